@@ -14,11 +14,16 @@
 #   cimgui.cpp  : a CPP implementation file which can to be linked into a C program.
 #   cimgui.json : full metadata to reconstruct bindings for other programming languages, including full comments.
 
+import json
 import os
 from pathlib import Path
 from src import code_dom
 from src import c_lexer
 from src import utils
+from src import preprocessor_expression
+from src import header_templates
+from src import render_cache
+from src.output_file import OutputFile
 import argparse
 import sys
 import traceback
@@ -27,6 +32,27 @@ from src.generators import *
 from src.type_comprehension import *
 
 
+# File extensions to add to metadata files for each supported compression type
+metadata_compression_extensions = {
+    None: "",
+    "gzip": ".gz",
+    "xz": ".xz"
+}
+
+
+# File extension for binary metadata files
+binary_metadata_file_extension = ".dbmeta"
+
+# File extension for SQLite metadata databases
+sqlite_metadata_file_extension = ".sqlite"
+
+# File extension for metadata delta files
+metadata_delta_file_extension = ".delta.json"
+
+# File extension for the render cache
+render_cache_file_extension = ".rendercache.json"
+
+
 # Insert a single header template file, complaining if it does not exist
 # Replaces any expansions in the expansions dictionary with the given result
 def insert_single_template(dest_file, template_file, expansions):
@@ -38,11 +64,7 @@ def insert_single_template(dest_file, template_file, expansions):
                                                  "file name.")
         sys.exit(2)
 
-    with open(template_file, "r") as src_file:
-        for line in src_file.readlines():
-            for before, after in expansions.items():
-                line = line.replace(before, after)
-            dest_file.write(line)
+    dest_file.write(header_templates.get_template(template_file).expand(expansions))
 
 
 # Insert the contents of the appropriate header template file(s)
@@ -93,7 +115,19 @@ def convert_header(
         is_backend,
         imgui_include_dir,
         backend_include_dir,
-        emit_combined_json_metadata
+        emit_combined_json_metadata,
+        define_environment,
+        metadata_options,
+        use_render_cache,
+        emit_direct_aliases,
+        emit_api_table,
+        emit_reflection_tables,
+        emit_command_buffer,
+        batch_functions,
+        emit_sized_string_functions,
+        struct_args_by_pointer_over,
+        struct_args_by_pointer_sysv_memory,
+        emit_struct_layouts
     ):
 
     # Set up context and DOM root
@@ -119,6 +153,12 @@ def convert_header(
     dom_root.validate_hierarchy()
     #  dom_root.dump()
 
+    # Resolve any preprocessor conditionals that the user has supplied define/undef information for, so we don't waste
+    # time processing code that will never be compiled
+    if not define_environment.is_empty():
+        print("Resolving preprocessor conditionals")
+        mod_resolve_conditionals.apply(dom_root, define_environment)
+
     print("Storing unmodified DOM")
 
     dom_root.save_unmodified_clones()
@@ -258,6 +298,13 @@ def convert_header(
     mod_generate_imstr_helpers.apply(dom_root)
     mod_remove_enum_forward_declarations.apply(dom_root)
     mod_calculate_enum_values.apply(dom_root)
+    if (not no_struct_by_value_arguments) and \
+            ((struct_args_by_pointer_over is not None) or struct_args_by_pointer_sysv_memory):
+        # Pass only the larger by-value structs as pointers (this happens here rather than alongside the
+        # unconditional conversion above because calculating struct sizes needs the flattened structs and enum values)
+        mod_convert_by_value_struct_args_to_pointers.apply(dom_root,
+                                                           max_by_value_size=struct_args_by_pointer_over,
+                                                           convert_sysv_memory=struct_args_by_pointer_sysv_memory)
     # Treat enum values ending with _ as internal, and _COUNT as being count values
     mod_mark_special_enum_values.apply(dom_root, internal_suffixes=["_"], count_suffixes=["_COUNT"])
     # Mark enums that end with Flags (or Flags_ for the internal ones) as being flag enums
@@ -470,6 +517,14 @@ def convert_header(
                                                 'ImGui_Text',
                                                 'ImGuiTextBuffer_appendf'
                                             ])
+
+    if emit_sized_string_functions:
+        # Add variants of functions taking strings that take a pointer and length instead
+        mod_add_sized_string_functions.apply(dom_root)
+
+    if len(batch_functions) > 0:
+        # Add variants of the requested functions that take an array of arguments
+        mod_add_batch_functions.apply(main_src_root, batch_functions)
         
     if is_imgui_internal:
         mod_move_elements.apply(dom_root,
@@ -546,8 +601,20 @@ def convert_header(
         'IMGUI_CHECKVERSION()': 'CIMGUI_CHECKVERSION()'
     })
 
+    if emit_command_buffer:
+        # Assign opcodes for recording function calls, and add the function to replay them
+        mod_add_command_buffer.apply(main_src_root, dest_file_name_only)
+    if emit_reflection_tables:
+        # Add declarations for the reflection tables and lookup functions
+        mod_add_reflection_tables.apply(main_src_root, dest_file_name_only)
+    if emit_api_table:
+        # Add a table of pointers to all the functions, for FFI users to load in one go
+        mod_add_api_table.apply(main_src_root, dest_file_name_only)
     mod_forward_declare_structs.apply(dom_root)
     mod_wrap_with_extern_c.apply(main_src_root)  # main_src_root here to avoid wrapping the config headers
+    if emit_direct_aliases:
+        # Let C code call functions whose ABI is unchanged directly, rather than via the stubs
+        mod_mark_direct_alias_functions.apply(dom_root)
     # For now we leave #pragma once intact on the assumption that modern compilers all support it, but if necessary
     # it can be replaced with a traditional #include guard by uncommenting the line below. If you find yourself needing
     # this functionality in a significant way please let me know!
@@ -555,10 +622,8 @@ def convert_header(
     mod_remove_empty_conditionals.apply(dom_root)
     mod_merge_blank_lines.apply(dom_root)
     mod_remove_blank_lines.apply(dom_root)
-    mod_align_enum_values.apply(dom_root)
-    mod_align_function_names.apply(dom_root)
-    mod_align_structure_field_names.apply(dom_root)
-    mod_align_comments.apply(dom_root)
+    # Align enum values, function names, structure field names and comments (all in one pass)
+    mod_align_columns.apply(dom_root)
 
     # Exclude some defines that aren't really useful from the metadata
     mod_exclude_defines_from_metadata.apply(dom_root, [
@@ -607,47 +672,126 @@ def convert_header(
                   "%OUTPUT_HEADER_NAME%": dest_file_name_only + ".h",
                   "%OUTPUT_HEADER_NAME_NO_INTERNAL%": dest_file_name_only_no_internal + ".h"}
 
-    with open(dest_file_no_ext + ".h", "w") as file:
+    output_files = []  # Every output we generate, so we can report which ones actually changed
+
+    # Set up the render cache, if one is being used, and hash the final DOM so we can find out which parts of it have
+    # changed since the last run
+    if use_render_cache:
+        cache = render_cache.RenderCache(dest_file_no_ext + render_cache_file_extension)
+        cache.update_hashes(dom_root)
+    else:
+        cache = None
+
+    with OutputFile(dest_file_no_ext + ".h") as file:
+        output_files.append(file)
         insert_header_templates(file, template_dir, src_file_name_only, ".h", expansions)
 
         write_context = code_dom.WriteContext()
         write_context.for_c = True
         write_context.for_backend = is_backend
+        write_context.render_cache = cache
         main_src_root.write_to_c(file, context=write_context)
 
     # Generate implementations
-    with open(dest_file_no_ext + ".cpp", "w") as file:
+    with OutputFile(dest_file_no_ext + ".cpp") as file:
+        output_files.append(file)
         insert_header_templates(file, template_dir, src_file_name_only, ".cpp", expansions)
 
         gen_struct_converters.generate(dom_root, file, indent=0)
 
+        if emit_struct_layouts:
+            # Check the layouts we put in the metadata against what the compiler actually does
+            gen_struct_layout_assertions.generate(main_src_root, file, indent=0)
+
         # Extract custom types from everything we parsed,
         # but generate only for the main header
         imgui_custom_types = utils.get_imgui_custom_types(dom_root)
         gen_function_stubs.generate(main_src_root, file, imgui_custom_types,
                                     indent=0,
                                     custom_varargs_list_suffixes=custom_varargs_list_suffixes,
-                                    is_backend=is_backend)
+                                    is_backend=is_backend,
+                                    render_cache=cache)
+
+        if emit_command_buffer:
+            gen_command_buffer.generate(main_src_root, file, dest_file_name_only,
+                                        indent=0,
+                                        is_backend=is_backend)
+
+        if emit_reflection_tables:
+            gen_reflection_tables.generate(main_src_root, file, dest_file_name_only,
+                                           indent=0,
+                                           is_backend=is_backend)
+
+        if emit_api_table:
+            gen_function_stubs.generate_api_table(main_src_root, file, dest_file_name_only,
+                                                  indent=0,
+                                                  is_backend=is_backend)
+
+    # Generating stubs gives names to unnamed arguments, so the affected functions need re-hashing
+    if cache is not None:
+        cache.update_hashes(dom_root)
 
     # Generate metadata
+    metadata_file_extension = ".json" + metadata_compression_extensions[metadata_options.compression]
+
     if emit_combined_json_metadata:
-        metadata_file_name = dest_file_no_ext + ".json"
-        with open(metadata_file_name, "w") as file:
+        metadata_file_name = dest_file_no_ext + metadata_file_extension
+        with OutputFile(metadata_file_name, metadata_options.compression) as file:
+            output_files.append(file)
             # We intentionally generate JSON starting from the root here so that we emit metadata from all dependencies
-            gen_metadata.generate(dom_root, file)
+            gen_metadata.generate(dom_root, file, metadata_options, cache)
+            main_metadata_file = file
+
+        if metadata_options.binary:
+            with OutputFile(dest_file_no_ext + binary_metadata_file_extension, binary=True) as file:
+                output_files.append(file)
+                gen_binary_metadata.generate(dom_root, file, metadata_options)
+
+        if metadata_options.sqlite:
+            with OutputFile(dest_file_no_ext + sqlite_metadata_file_extension, binary=True) as file:
+                output_files.append(file)
+                gen_sqlite_metadata.generate(dom_root, file, metadata_options)
     else:
         # Emit separate metadata files for each header
         headers = dom_root.list_directly_contained_children_of_type(code_dom.DOMHeaderFile)
         for header in headers:
             if (header == main_src_root):
-                metadata_file_name = dest_file_no_ext
+                metadata_file_name_no_ext = dest_file_no_ext
             else:
-                metadata_file_name = dest_file_no_ext + "_" + str(Path(header.source_filename).with_suffix(""))
-
-            metadata_file_name = metadata_file_name + ".json"
-            with open(metadata_file_name, "w") as file:
-                gen_metadata.generate(header, file)
-
+                metadata_file_name_no_ext = dest_file_no_ext + "_" + str(Path(header.source_filename).with_suffix(""))
+
+            with OutputFile(metadata_file_name_no_ext + metadata_file_extension, metadata_options.compression) as file:
+                output_files.append(file)
+                gen_metadata.generate(header, file, metadata_options, cache)
+                if header == main_src_root:
+                    main_metadata_file = file
+
+            if metadata_options.binary:
+                with OutputFile(metadata_file_name_no_ext + binary_metadata_file_extension, binary=True) as file:
+                    output_files.append(file)
+                    gen_binary_metadata.generate(header, file, metadata_options)
+
+            if metadata_options.sqlite:
+                with OutputFile(metadata_file_name_no_ext + sqlite_metadata_file_extension, binary=True) as file:
+                    output_files.append(file)
+                    gen_sqlite_metadata.generate(header, file, metadata_options)
+
+    # Generate a delta against the previous metadata, if requested
+    if metadata_options.diff_against is not None:
+        with OutputFile(dest_file_no_ext + metadata_delta_file_extension) as file:
+            output_files.append(file)
+            gen_metadata_diff.generate(json.loads(main_metadata_file.getvalue()), metadata_options.diff_against, file)
+
+    if cache is not None:
+        cache.save()
+        print("Render cache: reused " + str(cache.hits) + " items, regenerated " + str(cache.misses))
+
+    # Report which files were rewritten (unchanged files are left alone so their timestamps don't trigger rebuilds)
+    for output_file in output_files:
+        if output_file.changed:
+            print("Updated " + output_file.filename)
+        else:
+            print("Unchanged " + output_file.filename)
 
 if __name__ == '__main__':
     # Parse the C++ header found in src_file, and write a C header to dest_file_no_ext.h, with binding implementation in
@@ -707,7 +851,106 @@ if __name__ == '__main__':
                         help="Emit a single combined metadata JSON file instead of emitting "
                              "separate metadata JSON files for each header",
                         default=False)
-    
+    parser.add_argument('--metadata-compact',
+                        action='store_true',
+                        help="Emit metadata JSON without indentation or whitespace (much smaller, but harder to read)",
+                        default=False)
+    parser.add_argument('--metadata-compression',
+                        choices=['none', 'gzip', 'xz'],
+                        default='none',
+                        help="Compress metadata JSON files, adding a .gz or .xz extension (default: none)")
+    parser.add_argument('--metadata-type-table',
+                        action='store_true',
+                        help="Emit each distinct type once in a \"types\" table in the metadata, with all other uses "
+                             "referring to types by their ID in that table (instead of repeating the full type data "
+                             "inline)",
+                        default=False)
+    parser.add_argument('--metadata-abi-signatures',
+                        action='store_true',
+                        help="Include a canonical ABI signature for each function in the metadata (with types "
+                             "lowered to libffi-style classes such as sint32 or pointer), and a \"signature_groups\" "
+                             "table listing the functions that share each signature",
+                        default=False)
+    parser.add_argument('--metadata-binary',
+                        action='store_true',
+                        help="Also emit metadata in an indexed binary format (<output>.dbmeta), which can be read "
+                             "with random access using src/binary_metadata.py",
+                        default=False)
+    parser.add_argument('--metadata-sqlite',
+                        action='store_true',
+                        help="Also emit metadata as an SQLite database (<output>.sqlite)",
+                        default=False)
+    parser.add_argument('--metadata-diff-against',
+                        metavar='OLD_METADATA',
+                        help="Compare the generated metadata against a previously generated metadata file (for the "
+                             "same header), and write a list of the added, removed and changed elements to "
+                             "<output>.delta.json",
+                        default=None)
+    parser.add_argument('--render-cache',
+                        action='store_true',
+                        help="Keep a cache of the generated code for each declaration in <output>.rendercache.json, "
+                             "and reuse it for declarations that have not changed since the last run",
+                        default=False)
+    parser.add_argument('--emit-direct-aliases',
+                        action='store_true',
+                        help="Mark functions whose C signature is ABI-identical to the original C++ function with the "
+                             "C++ symbol name, so that C code built with GCC/Clang can call them directly instead of "
+                             "going through the wrapper functions",
+                        default=False)
+    parser.add_argument('--emit-api-table',
+                        action='store_true',
+                        help="Emit a struct containing pointers to all the functions in the header, and a function to "
+                             "get a filled-in instance of it, so that dynamic loaders can fetch the whole API with one "
+                             "symbol lookup",
+                        default=False)
+    parser.add_argument('--emit-reflection-tables',
+                        action='store_true',
+                        help="Compile tables describing the functions, enums and structs in the header into the "
+                             "generated code, along with functions to look them up by name",
+                        default=False)
+    parser.add_argument('--emit-command-buffer',
+                        action='store_true',
+                        help="Emit a function that replays a buffer of recorded calls, so that bindings can make "
+                             "many calls with a single call into C (the opcodes for each function are given in the "
+                             "metadata)",
+                        default=False)
+    parser.add_argument('--batch-function',
+                        help="Generate a variant of the given function (e.g. ImDrawList_AddLine) with _Batch appended "
+                             "to the name, which takes an array of argument structs and calls the function for each "
+                             "one (can be specified multiple times)",
+                        default=[],
+                        action='append')
+    parser.add_argument('--emit-sized-string-functions',
+                        action='store_true',
+                        help="Generate variants of functions that take strings with end pointers (or as ImStr) with "
+                             "Sized appended to the name, which take a pointer and a length instead",
+                        default=False)
+    parser.add_argument('--struct-args-by-pointer-over',
+                        type=int,
+                        metavar='BYTES',
+                        help="Convert by-value struct arguments to pointers only for structs larger than the given "
+                             "number of bytes (on LP64 platforms), leaving smaller ones such as ImVec2 passed by value",
+                        default=None)
+    parser.add_argument('--struct-args-by-pointer-sysv-memory',
+                        action='store_true',
+                        help="Convert by-value struct arguments to pointers for structs that the x86-64 System V ABI "
+                             "would pass in memory rather than in registers",
+                        default=False)
+    parser.add_argument('--emit-struct-layouts',
+                        action='store_true',
+                        help="Include the size and alignment of structs and the offsets of their fields (for LP64 and "
+                             "LLP64 platforms) in the metadata, and emit static_asserts to check them",
+                        default=False)
+    parser.add_argument('--define',
+                        help="Treat the given macro as defined when evaluating preprocessor conditionals, "
+                             "in the form NAME or NAME=VALUE (e.g. IMGUI_DISABLE_OBSOLETE_FUNCTIONS). Conditionals "
+                             "that can be decided are removed, leaving only the code that would be compiled",
+                        default=[],
+                        action='append')
+    parser.add_argument('--undef',
+                        help="Treat the given macro as not defined when evaluating preprocessor conditionals",
+                        default=[],
+                        action='append')
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
@@ -727,6 +970,33 @@ if __name__ == '__main__':
     for include in args.include:
         include_files.append(os.path.realpath(include))
 
+    # Gather macro state for evaluating conditionals
+    defines = {}
+    for define in args.define:
+        name, _, value = define.partition('=')
+        defines[name.strip()] = value if value != "" else None
+
+    for undef in args.undef:
+        if undef in defines:
+            print("Macro " + undef + " cannot be both defined and undefined")
+            sys.exit(2)
+
+    define_environment = preprocessor_expression.PPDefineEnvironment(defines, args.undef)
+
+    metadata_options = gen_metadata.MetadataOptions()
+    metadata_options.compact = args.metadata_compact
+    metadata_options.compression = args.metadata_compression if args.metadata_compression != 'none' else None
+    metadata_options.type_table = args.metadata_type_table
+    metadata_options.abi_signatures = args.metadata_abi_signatures
+    metadata_options.binary = args.metadata_binary
+    metadata_options.sqlite = args.metadata_sqlite
+    metadata_options.diff_against = args.metadata_diff_against
+    metadata_options.struct_layouts = args.emit_struct_layouts
+
+    if (metadata_options.diff_against is not None) and not os.path.isfile(metadata_options.diff_against):
+        print("Metadata file " + metadata_options.diff_against + " to compare against could not be found")
+        sys.exit(2)
+
     # Perform conversion
     try:
         convert_header(
@@ -740,7 +1010,19 @@ if __name__ == '__main__':
             args.backend,
             args.imgui_include_dir,
             args.backend_include_dir if args.backend_include_dir is not None else args.imgui_include_dir,
-            args.emit_combined_json_metadata
+            args.emit_combined_json_metadata,
+            define_environment,
+            metadata_options,
+            args.render_cache,
+            args.emit_direct_aliases,
+            args.emit_api_table,
+            args.emit_reflection_tables,
+            args.emit_command_buffer,
+            args.batch_function,
+            args.emit_sized_string_functions,
+            args.struct_args_by_pointer_over,
+            args.struct_args_by_pointer_sysv_memory,
+            args.emit_struct_layouts
         )
     except:  # noqa - suppress warning about broad exception clause as it's intentionally broad
         print("Exception during conversion:")
@@ -0,0 +1,243 @@
+# Dear Bindings binary metadata format
+#
+# This is an alternative to the JSON metadata, designed to allow consumers to look up individual elements without
+# parsing the whole file. It contains the same data as the JSON metadata generated with --metadata-type-table, stored
+# as follows (all integers are little-endian):
+#
+# Header:
+#   char[4]  Magic ("DBMD")
+#   u32      Format version
+#   u32      Offset of the string table
+#   u32      Offset of the section directory
+#
+# String table:
+#   u32      Number of strings (N)
+#   u32[N+1] Offset of each string relative to the start of the string data (the last entry is the end of the data)
+#   ...      UTF-8 string data
+#
+# Section directory:
+#   u32      Number of sections
+#   For each section:
+#     u32    String ID of the section name ("defines", "enums", "typedefs", "structs", "functions",
+#            "signature_groups" or "types")
+#     u32    Number of records in the section (R)
+#     u32    Offset of the record offset table (R u32 entries, giving the absolute offset of each record)
+#     u32    Offset of the name index (or 0 if the section does not have one)
+#     u32    String ID of the record key used by the name index
+#
+# Name index:
+#   u32      Number of entries (E)
+#   For each entry, sorted by name:
+#     u32    String ID of the name
+#     u32    Record index
+#
+# Records are encoded as tagged values, each starting with a tag byte (one of the VALUE_* constants below) followed by
+# the value data. Variable-length integers use unsigned LEB128 encoding, with signed integers zigzag-encoded first.
+# Strings (including dictionary keys) are stored as a variable-length string ID.
+
+import mmap
+import struct
+
+MAGIC = b"DBMD"
+FORMAT_VERSION = 1
+
+HEADER_FORMAT = "<4sIII"
+SECTION_FORMAT = "<IIIII"
+NAME_INDEX_ENTRY_FORMAT = "<II"
+
+VALUE_NULL = 0
+VALUE_FALSE = 1
+VALUE_TRUE = 2
+VALUE_INT = 3  # Zigzag-encoded variable-length integer
+VALUE_STRING = 4  # Variable-length string ID
+VALUE_LIST = 5  # Variable-length item count, followed by the items
+VALUE_DICT = 6  # Variable-length entry count, followed by (variable-length key string ID, value) pairs
+VALUE_FLOAT = 7  # 64-bit IEEE double
+
+# The record key each section is indexed by
+SECTION_INDEX_KEYS = {
+    "defines": "name",
+    "enums": "name",
+    "typedefs": "name",
+    "structs": "name",
+    "functions": "name",
+    "signature_groups": "signature",
+    "types": "declaration"
+}
+
+
+# Reads a binary metadata file, memory-mapping it and decoding records on demand
+class BinaryMetadataReader:
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, string_table_offset, section_directory_offset = \
+            struct.unpack_from(HEADER_FORMAT, self.data, 0)
+        if magic != MAGIC:
+            raise Exception(filename + " is not a Dear Bindings binary metadata file")
+        if version != FORMAT_VERSION:
+            raise Exception(filename + " has unsupported format version " + str(version))
+
+        # String table
+        (self.string_count,) = struct.unpack_from("<I", self.data, string_table_offset)
+        self.string_offsets_offset = string_table_offset + 4
+        self.string_data_offset = self.string_offsets_offset + ((self.string_count + 1) * 4)
+        self.strings = {}  # Decoded strings, indexed by ID
+
+        # Sections
+        self.sections = {}
+        (section_count,) = struct.unpack_from("<I", self.data, section_directory_offset)
+        for i in range(0, section_count):
+            section_info = struct.unpack_from(SECTION_FORMAT, self.data,
+                                              section_directory_offset + 4 + (i * struct.calcsize(SECTION_FORMAT)))
+            section = BinaryMetadataSection(self, *section_info)
+            self.sections[section.name] = section
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+        return False
+
+    # Get the names of all the sections in the file
+    def get_section_names(self):
+        return list(self.sections.keys())
+
+    # Get a section by name (or None if the file does not contain that section)
+    def get_section(self, name):
+        return self.sections.get(name)
+
+    # Get the data for a type by ID
+    def get_type(self, type_id):
+        return self.sections["types"][type_id]
+
+    # Get a string from the string table by ID
+    def get_string(self, string_id):
+        result = self.strings.get(string_id)
+        if result is None:
+            start, end = struct.unpack_from("<II", self.data, self.string_offsets_offset + (string_id * 4))
+            result = str(self.data[self.string_data_offset + start:self.string_data_offset + end], "utf-8")
+            self.strings[string_id] = result
+        return result
+
+    # Decode a variable-length integer, returning (value, offset after the integer)
+    def read_varint(self, offset):
+        data = self.data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, offset
+            shift += 7
+
+    # Decode the value at the given offset, returning (value, offset after the value)
+    def read_value(self, offset):
+        tag = self.data[offset]
+        offset += 1
+
+        if tag == VALUE_STRING:
+            string_id, offset = self.read_varint(offset)
+            return self.get_string(string_id), offset
+        elif tag == VALUE_DICT:
+            count, offset = self.read_varint(offset)
+            result = {}
+            for i in range(0, count):
+                key_id, offset = self.read_varint(offset)
+                result[self.get_string(key_id)], offset = self.read_value(offset)
+            return result, offset
+        elif tag == VALUE_LIST:
+            count, offset = self.read_varint(offset)
+            result = []
+            for i in range(0, count):
+                item, offset = self.read_value(offset)
+                result.append(item)
+            return result, offset
+        elif tag == VALUE_INT:
+            value, offset = self.read_varint(offset)
+            return (value >> 1) ^ -(value & 1), offset
+        elif tag == VALUE_FALSE:
+            return False, offset
+        elif tag == VALUE_TRUE:
+            return True, offset
+        elif tag == VALUE_NULL:
+            return None, offset
+        elif tag == VALUE_FLOAT:
+            return struct.unpack_from("<d", self.data, offset)[0], offset + 8
+        else:
+            raise Exception("Unknown value tag " + str(tag) + " at offset " + str(offset - 1))
+
+
+# A section of a binary metadata file, which acts as a read-only sequence of records (decoded on access)
+class BinaryMetadataSection:
+    def __init__(self, reader, name_id, record_count, record_offsets_offset, name_index_offset, index_key_id):
+        self.reader = reader
+        self.name = reader.get_string(name_id)
+        self.record_count = record_count
+        self.record_offsets_offset = record_offsets_offset
+        self.name_index_offset = name_index_offset
+        self.index_key = reader.get_string(index_key_id) if name_index_offset != 0 else None
+
+    def __len__(self):
+        return self.record_count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.record_count
+        if (index < 0) or (index >= self.record_count):
+            raise IndexError("Record index out of range")
+        (record_offset,) = struct.unpack_from("<I", self.reader.data, self.record_offsets_offset + (index * 4))
+        return self.reader.read_value(record_offset)[0]
+
+    def __iter__(self):
+        for index in range(0, self.record_count):
+            yield self[index]
+
+    # Get the (name string ID, record index) pair for an entry in the name index
+    def get_index_entry(self, position):
+        return struct.unpack_from(NAME_INDEX_ENTRY_FORMAT, self.reader.data,
+                                  self.name_index_offset + 4 + (position * struct.calcsize(NAME_INDEX_ENTRY_FORMAT)))
+
+    # Get the indices of all the records with the given name (by the index key for this section)
+    def find_indices(self, name):
+        if self.name_index_offset == 0:
+            raise Exception("Section " + self.name + " does not have a name index")
+
+        (entry_count,) = struct.unpack_from("<I", self.reader.data, self.name_index_offset)
+
+        # Binary search for the first entry with the name
+        low = 0
+        high = entry_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.reader.get_string(self.get_index_entry(middle)[0]) < name:
+                low = middle + 1
+            else:
+                high = middle
+
+        result = []
+        while low < entry_count:
+            name_id, record_index = self.get_index_entry(low)
+            if self.reader.get_string(name_id) != name:
+                break
+            result.append(record_index)
+            low += 1
+
+        return result
+
+    # Get all the records with the given name
+    def find_all(self, name):
+        return [self[index] for index in self.find_indices(name)]
+
+    # Get the first record with the given name, or None if there isn't one
+    def find(self, name):
+        indices = self.find_indices(name)
+        return self[indices[0]] if len(indices) > 0 else None
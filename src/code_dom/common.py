@@ -16,36 +16,71 @@ class WriteContext:
         self.include_leading_colons = False  # Do we want to include leading colons to fully-qualify all names?
         self.mark_non_nullable_pointers = False  # Do we want to emit non-nullable pointers as ^ instead of *?
         self.for_backend = False  # Are we outputting backend code?
+        self.render_cache = None  # Optional RenderCache (see render_cache.py) to reuse previously generated code from
+
+
+# Token values that are treated as punctuation by collapse_tokens_to_string()
+collapse_punctuation = frozenset(['+', '-', '<', '>', '(', ')', '=', '/', '\\', '!', '~', '[', ']', '&', '"', "'", '%',
+                                  '^', '*', ':', ';', '?', ',', '.', '{', '}'])
 
 
 # Collapse a list of tokens back into a C-style string, attempting to be reasonably intelligent and/or aesthetic
 # about the use of whitespace
 def collapse_tokens_to_string(tokens):
-    result = ""
+    result = []
     need_space = False
     need_forced_space = False
     for token in tokens:
-        token_is_punctuation = token.value in ['+', '-', '<', '>', '(', ')', '=', '/', '\\', '!', '~',
-                                               '[', ']', '&', '"', "'", '%', '^', '*', ':', ';', '?',
-                                               '!', ',', '.', '{', '}']
+        value = token.value
+        token_is_punctuation = value in collapse_punctuation
         if (need_space and not token_is_punctuation) or need_forced_space:
-            result += " "
-        result += token.value
+            result.append(" ")
+        result.append(value)
         need_space = not token_is_punctuation
         # Special-case here - semicolon and comma do not get a space before them, but do get a space after them,
         # even if the next character is punctuation
-        need_forced_space = token.value in [';', ',']
-    return result
+        need_forced_space = (value == ';') or (value == ',')
+    return "".join(result)
 
 
 # Collapse a list of tokens back into a C-style string, assuming the tokens already have suitable whitespace
 def collapse_tokens_to_string_with_whitespace(tokens):
-    result = ""
-    for token in tokens:
-        result += token.value
-    return result
+    return "".join(token.value for token in tokens)
+
+
+# Cache of indentation prefixes, indexed by indent level
+indent_prefixes = []
+
+
+# Get the whitespace prefix for a given indent level (negative levels get no indentation)
+def get_indent_prefix(indent):
+    indent = max(indent, 0)
+    while len(indent_prefixes) <= indent:
+        indent_prefixes.append("".ljust(len(indent_prefixes) * 4))
+    return indent_prefixes[indent]
 
 
 # Write a C-style line with indentation, and any trailing whitespace removed
 def write_c_line(file, indent, text):
-    file.write("".ljust(indent * 4) + text.rstrip() + "\n")
+    file.write(get_indent_prefix(indent) + text.rstrip() + "\n")
+
+
+# Write a child of a container element (header file, preprocessor conditional, etc) out as C code, reusing the
+# previously generated code for it if the context has a render cache
+def write_child_to_c(child, file, indent, context):
+    if context.render_cache is not None:
+        context.render_cache.write_element_to_c(child, file, indent, context)
+    else:
+        child.write_to_c(file, indent=indent, context=context)
+
+
+# An in-memory output target that can be used anywhere a file is written to, collecting the written text into a list
+# (which is much cheaper than making lots of small writes to a real file) and joining it together once at the end
+class LineBuffer:
+    def __init__(self):
+        self.chunks = []
+        self.write = self.chunks.append  # Bound directly to the list to avoid a function call per line
+
+    # Get everything written so far as a single string
+    def getvalue(self):
+        return "".join(self.chunks)
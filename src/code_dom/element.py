@@ -19,6 +19,7 @@ class DOMElement:
         #                                     (primarily for template parameter expansion and the like)
         self.is_internal = False  # Indicates that the associated element is an internal API component
         self.exclude_from_metadata = False  # Should this element be excluded from the generated metadata?
+        self.structural_hash = None  # Hash of this element and its children (see structural_hash.py), if calculated
 
     # Parse tokens that can appear anywhere, returning an appropriate element if possible or None if not
     @staticmethod
@@ -70,7 +70,7 @@ class DOMExternC(code_dom.element.DOMElement):
             if self.is_cpp_guarded:
                 write_c_line(file, indent, '#endif')
             for child in self.children:
-                child.write_to_c(file, indent + 1, context)
+                write_child_to_c(child, file, indent + 1, context)
         else:
             # Multi-line version
             write_c_line(file, indent, "{")
@@ -78,7 +78,7 @@ class DOMExternC(code_dom.element.DOMElement):
                 write_c_line(file, indent, '#endif')
             for child in self.children:
                 # Only indent in the non-guarded case, for aesthetic purposes
-                child.write_to_c(file, indent + (0 if self.is_cpp_guarded else 1), context)
+                write_child_to_c(child, file, indent + (0 if self.is_cpp_guarded else 1), context)
             if self.is_cpp_guarded:
                 write_c_line(file, indent, '#ifdef __cplusplus')
             write_c_line(file, indent, '} // End of extern "C" block')
@@ -149,7 +149,7 @@ class DOMFieldDeclaration(code_dom.element.DOMElement):
             return self.names[0] if len(self.names) > 0 else leaf_name
 
     # Get the initial (pre-name) part of the declaration. This is a separate function because
-    # mod_align_structure_field_names needs it
+    # mod_align_columns needs it
     def get_prefix_and_type(self, context):
         declaration = self.field_type.to_c_string(context)
 
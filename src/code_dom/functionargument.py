@@ -16,6 +16,11 @@ class DOMFunctionArgument(code_dom.element.DOMElement):
         #                                   (see mod_generate_default_argument_functions)
         self.is_instance_pointer = False  # Set if this is the instance pointer argument (i.e. "this"/"self")
         self.stub_call_value = None   # Set to make function stub use this as a value instead of passing the argument
+        self.was_by_value_struct = False  # Set if this was a by-value struct that has been converted to a pointer
+        #                                   (see mod_convert_by_value_struct_args_to_pointers)
+        self.length_of_argument = None  # Name of the string argument this gives the length of, if it is a length
+        #                                 added by mod_add_sized_string_functions (these have no equivalent in the
+        #                                 original function)
 
     # Parse tokens from the token stream given
     @staticmethod
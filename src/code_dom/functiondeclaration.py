@@ -34,9 +34,17 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
         self.is_imstr_helper = False  # Set if this is a helper function that converts char* into ImStr
         #                                (see mod_generate_imstr_helpers for more details)
 
-        self.function_name_alignment = 0  # Column to align the function name to (see mod_align_function_names)
+        self.function_name_alignment = 0  # Column to align the function name to (see mod_align_columns)
         self.is_unformatted_helper = False # Set if this is a variant of a function accepting a format string with
         #                                  format string forced to '%s' and a single string argument
+        self.direct_alias_symbol = None  # Symbol name of the original C++ function, if C code can call that directly
+        #                                  (see mod_mark_direct_alias_functions)
+        self.batch_source_function = None  # Name of the function this calls for each element of an array of
+        #                                    arguments, if it is a batched variant (see mod_add_batch_functions)
+        self.sized_string_source_function = None  # Name of the function this is a variant of, if it takes strings
+        #                                           as a pointer and length (see mod_add_sized_string_functions)
+        self.command_opcode = None  # Opcode used to record calls to this function in command buffers, if they can be
+        #                             recorded (see mod_add_command_buffer)
 
     # Parse tokens from the token stream given
     @staticmethod
@@ -275,7 +283,7 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
         return clone
 
     # Get the prefixes and return type for this function
-    # This is a separate function largely because mod_align_function_names needs it
+    # This is a separate function largely because mod_align_columns needs it
     def get_prefixes_and_return_type(self, context=WriteContext()):
         declaration = ""
         if self.is_imgui_api:
@@ -332,6 +340,8 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
         if self.is_constexpr:
             declaration += " constexpr"
         if not context.for_implementation:
+            if self.direct_alias_symbol is not None:
+                declaration += " CIMGUI_DIRECT_ALIAS(\"" + self.direct_alias_symbol + "\")"
             if self.im_fmtargs is not None:
                 declaration += " IM_FMTARGS(" + self.im_fmtargs + ")"
             if self.im_fmtlist is not None:
@@ -42,7 +42,7 @@ class DOMHeaderFile(code_dom.element.DOMElement):
     def write_to_c(self, file, indent=0, context=WriteContext()):
         self.write_preceding_comments(file, indent, context)
         for child in self.children:
-            child.write_to_c(file, indent=indent, context=context)
+            write_child_to_c(child, file, indent, context)
 
     # Get the original filename
     def get_source_filename(self):
@@ -64,7 +64,7 @@ class DOMNamespace(code_dom.element.DOMElement):
         write_c_line(file, indent, self.add_attached_comment_to_line("namespace " + self.name))
         write_c_line(file, indent, "{")
         for child in self.children:
-            child.write_to_c(file, indent + 1, context)
+            write_child_to_c(child, file, indent + 1, context)
         write_c_line(file, indent, "}")
 
     def __str__(self):
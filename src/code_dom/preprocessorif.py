@@ -1,5 +1,6 @@
 from .common import *
 from src import code_dom
+from src import preprocessor_expression
 
 
 # A #if or #ifdef block (or #elif inside one)
@@ -83,21 +84,22 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
         return dom_element
 
     # Returns true if this has the same condition (expression+flags) as another
+    # Expressions are compared in their normalised form, so (for example) "defined(A) && defined(B)" matches
+    # "defined B && defined A"
     def condition_matches(self, other):
-        return (self.get_expression() == other.get_expression()) and \
+        return (self.get_expression_node() is other.get_expression_node()) and \
                (self.is_ifdef == other.is_ifdef) and \
                (self.is_elif == other.is_elif) and \
                (self.is_negated == other.is_negated)
 
     # Returns true if this is mutually exclusive with another condition
     # (i.e. it is impossible for both to be active at the same time)
-    # Note that this currently only detects #ifdef/#ifndef pairs, not more complex expressions, nor does it check for
-    # the effect of being in the else-side of a conditional
+    # This detects #ifdef/#ifndef pairs and conditions where one requires a term that the other excludes (such as
+    # "defined(X) && !defined(Y)" and "defined(Y)"), but not more complex cases, nor does it check for the effect of
+    # being in the else-side of a conditional
     def condition_is_mutually_exclusive(self, other):
-        return (self.get_expression() == other.get_expression()) and \
-               (self.is_ifdef == other.is_ifdef) and \
-               (self.is_elif == other.is_elif) and \
-               (self.is_negated != other.is_negated)
+        return preprocessor_expression.are_conditions_mutually_exclusive(self.get_condition_node(),
+                                                                          other.get_condition_node())
 
     # Returns true if the element given is part of our else block
     # (see utils.is_in_else_clause for a version of this that works for non-direct-children)
@@ -114,6 +116,20 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
     def get_expression(self):
         return collapse_tokens_to_string(self.expression_tokens)
 
+    # Get the expression used as a (normalised, interned) preprocessor_expression node
+    def get_expression_node(self):
+        return preprocessor_expression.get_expression_node(self.expression_tokens)
+
+    # Get the full condition under which the main body of this is active (taking into account #ifdef and negation)
+    # as a preprocessor_expression node
+    def get_condition_node(self):
+        node = self.get_expression_node()
+        if self.is_ifdef and (node.kind == preprocessor_expression.PPExpressionKind.identifier):
+            node = preprocessor_expression.intern_node(preprocessor_expression.PPExpressionKind.defined, node.value)
+        if self.is_negated:
+            node = preprocessor_expression.make_not(node)
+        return node
+
     # Get the opening clause as a string
     def get_opening_clause(self):
         if self.is_ifdef:
@@ -135,12 +151,12 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
         write_c_line(file, 0, opening_clause)
 
         for child in self.children:
-            child.write_to_c(file, indent, context)
+            write_child_to_c(child, file, indent, context)
 
         if len(self.else_children) > 0:
             write_c_line(file, 0, "#else")
             for child in self.else_children:
-                child.write_to_c(file, indent, context)
+                write_child_to_c(child, file, indent, context)
 
         # If we don't have an existing attached comment, note the opening clause
         if self.attached_comment is not None:
@@ -9,8 +9,9 @@ class ConditionalGenerator:
     def __init__(self):
         self.current_conditionals = []  # The current stack of preprocessor conditionals we have emitted
 
-    # Write the conditionals necessary to bring us to the state needed by element
-    def write_conditionals(self, element, file, indent=0):
+    # Get the list of conditionals needed by element
+    @staticmethod
+    def get_wanted_conditionals(element):
         wanted_conditionals = utils.get_preprocessor_conditionals(element)
 
         # Remove the include guard from our list of conditionals
@@ -25,6 +26,17 @@ class ConditionalGenerator:
                 wanted_conditionals[i] = wanted_conditionals[i].clone()
                 wanted_conditionals[i].is_negated = not wanted_conditionals[i].is_negated
 
+        return wanted_conditionals
+
+    # Set the state to that needed by element without writing anything (for generating code that will be placed
+    # somewhere where those conditionals are already in effect)
+    def assume_conditionals(self, element):
+        self.current_conditionals = self.get_wanted_conditionals(element)
+
+    # Write the conditionals necessary to bring us to the state needed by element
+    def write_conditionals(self, element, file, indent=0):
+        wanted_conditionals = self.get_wanted_conditionals(element)
+
         # Close any unwanted conditionals
         first_endif = True
         while (len(self.current_conditionals) > len(wanted_conditionals)) or \
@@ -1,3 +1,9 @@
 from . import gen_struct_converters
 from . import gen_function_stubs
 from . import gen_metadata
+from . import gen_binary_metadata
+from . import gen_sqlite_metadata
+from . import gen_metadata_diff
+from . import gen_reflection_tables
+from . import gen_command_buffer
+from . import gen_struct_layout_assertions
@@ -0,0 +1,130 @@
+from src import binary_metadata
+from src.generators import gen_metadata
+import struct
+
+
+# Builds the contents of a binary metadata file (see binary_metadata.py for a description of the format)
+class BinaryMetadataWriter:
+    def __init__(self):
+        self.data = bytearray(struct.calcsize(binary_metadata.HEADER_FORMAT))  # Header gets filled in at the end
+        self.string_ids = {}  # String IDs, indexed by string
+        self.sections = []  # (name string ID, record count, offset table offset, name index offset, key string ID)
+
+    # Get the ID of a string in the string table, adding it if necessary
+    def get_string_id(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.string_ids)
+            self.string_ids[string] = string_id
+        return string_id
+
+    def write_u32(self, value):
+        self.data += struct.pack("<I", value)
+
+    def write_varint(self, value):
+        data = self.data
+        while value >= 0x80:
+            data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        data.append(value)
+
+    # Write a JSON-style value (dict, list, string, integer, float, boolean or None)
+    def write_value(self, value):
+        data = self.data
+        if isinstance(value, str):
+            data.append(binary_metadata.VALUE_STRING)
+            self.write_varint(self.get_string_id(value))
+        elif isinstance(value, dict):
+            data.append(binary_metadata.VALUE_DICT)
+            self.write_varint(len(value))
+            for key, item in value.items():
+                self.write_varint(self.get_string_id(key))
+                self.write_value(item)
+        elif isinstance(value, list):
+            data.append(binary_metadata.VALUE_LIST)
+            self.write_varint(len(value))
+            for item in value:
+                self.write_value(item)
+        elif value is None:
+            data.append(binary_metadata.VALUE_NULL)
+        elif value is True:
+            data.append(binary_metadata.VALUE_TRUE)
+        elif value is False:
+            data.append(binary_metadata.VALUE_FALSE)
+        elif isinstance(value, int):
+            data.append(binary_metadata.VALUE_INT)
+            self.write_varint((value << 1) if value >= 0 else ((-value << 1) - 1))  # Zigzag encoding
+        elif isinstance(value, float):
+            data.append(binary_metadata.VALUE_FLOAT)
+            data += struct.pack("<d", value)
+        else:
+            raise Exception("Cannot encode value of type " + str(type(value)) + " in binary metadata")
+
+    # Write a section, along with its record offset table and name index
+    def write_section(self, name, records):
+        record_offsets = []
+        index_key = binary_metadata.SECTION_INDEX_KEYS.get(name)
+        index_entries = []  # (name, record index) tuples
+
+        for record in records:
+            if (index_key is not None) and (index_key in record):
+                index_entries.append((record[index_key], len(record_offsets)))
+            record_offsets.append(len(self.data))
+            self.write_value(record)
+
+        record_offsets_offset = len(self.data)
+        self.data += struct.pack("<" + str(len(record_offsets)) + "I", *record_offsets)
+
+        name_index_offset = 0
+        if index_key is not None:
+            name_index_offset = len(self.data)
+            index_entries.sort()
+            self.write_u32(len(index_entries))
+            for entry_name, record_index in index_entries:
+                self.data += struct.pack(binary_metadata.NAME_INDEX_ENTRY_FORMAT,
+                                         self.get_string_id(entry_name), record_index)
+
+        self.sections.append((self.get_string_id(name), len(record_offsets), record_offsets_offset,
+                              name_index_offset, self.get_string_id(index_key or "")))
+
+    # Write the string table and section directory, and return the completed file contents
+    def finish(self):
+        # String table
+        string_table_offset = len(self.data)
+        encoded_strings = [string.encode("utf-8") for string in self.string_ids.keys()]  # Dictionary is in ID order
+        self.write_u32(len(encoded_strings))
+        string_offset = 0
+        for encoded_string in encoded_strings:
+            self.write_u32(string_offset)
+            string_offset += len(encoded_string)
+        self.write_u32(string_offset)
+        self.data += b"".join(encoded_strings)
+
+        # Section directory
+        section_directory_offset = len(self.data)
+        self.write_u32(len(self.sections))
+        for section in self.sections:
+            self.data += struct.pack(binary_metadata.SECTION_FORMAT, *section)
+
+        struct.pack_into(binary_metadata.HEADER_FORMAT, self.data, 0, binary_metadata.MAGIC,
+                         binary_metadata.FORMAT_VERSION, string_table_offset, section_directory_offset)
+
+        return bytes(self.data)
+
+
+# Write metadata about our file to a binary metadata file (file should be opened in binary mode)
+# This always uses a type table, so the records match the JSON metadata generated with --metadata-type-table
+# options (a gen_metadata.MetadataOptions) controls which optional data is included, as for the JSON metadata
+def generate(dom_root, file, options=None):
+    writer = BinaryMetadataWriter()
+
+    sections = gen_metadata.emit_sections(dom_root, gen_metadata.MetadataTypeTable(),
+                                          layout_calculators=gen_metadata.get_struct_layout_calculators(dom_root,
+                                                                                                        options),
+                                          signature_layout_calculator=gen_metadata.get_signature_layout_calculator(
+                                              dom_root, options))
+
+    for section_name, items in sections:
+        writer.write_section(section_name, items)
+
+    file.write(writer.finish())
@@ -0,0 +1,134 @@
+from src import code_dom
+from src import conditional_generator
+from src.code_dom.common import write_c_line
+from src.modifiers import mod_add_command_buffer
+
+
+# Get the declaration of the local variable an argument is decoded into
+def get_argument_local_declaration(argument, context):
+    if isinstance(argument.arg_type, code_dom.DOMFunctionPointerType):
+        return argument.to_c_string(context)
+    type_string = argument.arg_type.to_c_string(context)
+    if argument.is_array:
+        # Arrays are passed (and so recorded) as pointers
+        type_string += "*"
+    elif ("*" not in type_string) and type_string.startswith("const "):
+        type_string = type_string[len("const "):]  # The value needs to be written when it is read from the buffer
+    return type_string + " " + argument.name
+
+
+# Generate the replay function declared by mod_add_command_buffer, which decodes and executes recorded calls
+def generate(dom_root, file, dest_file_name, indent=0, is_backend=False):
+    replay_function_name = mod_add_command_buffer.get_replay_function_name(dest_file_name)
+
+    replay_function = None
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.is_manual_helper and (function.name == replay_function_name):
+            replay_function = function
+            break
+
+    if replay_function is None:
+        return  # No command buffer support in this file
+
+    read_function_name = replay_function_name + "_read"
+    read_string_function_name = replay_function_name + "_read_string"
+
+    context = code_dom.WriteContext()
+    context.for_c = True
+    context.for_implementation = True
+
+    generator = conditional_generator.ConditionalGenerator()
+    generator.write_conditionals(replay_function, file, indent)
+
+    write_c_line(file, indent, "// Command buffer replay")
+    file.write("\n")
+
+    # Helpers to read values from the buffer
+    write_c_line(file, indent, "static bool " + read_function_name + "(const unsigned char** read_ptr, "
+                                                                     "const unsigned char* end, void* dest, "
+                                                                     "size_t size)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "if ((size_t)(end - *read_ptr) < size)")
+    write_c_line(file, indent + 2, "return false;")
+    write_c_line(file, indent + 1, "memcpy(dest, *read_ptr, size);")
+    write_c_line(file, indent + 1, "*read_ptr += size;")
+    write_c_line(file, indent + 1, "return true;")
+    write_c_line(file, indent, "}")
+    file.write("\n")
+    write_c_line(file, indent, "static bool " + read_string_function_name + "(const unsigned char** read_ptr, "
+                                                                            "const unsigned char* end, "
+                                                                            "const char** dest)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "ImU32 length;")
+    write_c_line(file, indent + 1, "if (!" + read_function_name + "(read_ptr, end, &length, sizeof(length)))")
+    write_c_line(file, indent + 2, "return false;")
+    write_c_line(file, indent + 1, "if (length == 0xFFFFFFFF)")
+    write_c_line(file, indent + 1, "{")
+    write_c_line(file, indent + 2, "*dest = NULL;")
+    write_c_line(file, indent + 2, "return true;")
+    write_c_line(file, indent + 1, "}")
+    write_c_line(file, indent + 1, "// The string must be followed by a zero terminator, so it can be used in-place")
+    write_c_line(file, indent + 1, "if (((size_t)(end - *read_ptr) <= length) || ((*read_ptr)[length] != 0))")
+    write_c_line(file, indent + 2, "return false;")
+    write_c_line(file, indent + 1, "*dest = (const char*)*read_ptr;")
+    write_c_line(file, indent + 1, "*read_ptr += length + 1;")
+    write_c_line(file, indent + 1, "return true;")
+    write_c_line(file, indent, "}")
+
+    file.write("\n")
+    write_c_line(file, indent, ("CIMGUI_IMPL_API " if is_backend else "CIMGUI_API ") + "int cimgui::" +
+                 replay_function_name + "(const void* buf, size_t len)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "const unsigned char* replay_read_ptr = (const unsigned char*)buf;")
+    write_c_line(file, indent + 1, "const unsigned char* replay_end = replay_read_ptr + len;")
+    write_c_line(file, indent + 1, "int replay_command_count = 0;")
+    write_c_line(file, indent + 1, "while (replay_read_ptr < replay_end)")
+    write_c_line(file, indent + 1, "{")
+    write_c_line(file, indent + 2, "ImU16 replay_opcode;")
+    write_c_line(file, indent + 2, "if (!" + read_function_name + "(&replay_read_ptr, replay_end, &replay_opcode, "
+                                                                  "sizeof(replay_opcode)))")
+    write_c_line(file, indent + 3, "return -1;")
+    write_c_line(file, indent + 2, "switch (replay_opcode)")
+    write_c_line(file, indent + 2, "{")
+
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.command_opcode is None:
+            continue
+
+        generator.write_conditionals(function, file, indent + 2)
+
+        arguments = mod_add_command_buffer.get_command_arguments(function)
+
+        write_c_line(file, indent + 2, "case " + str(function.command_opcode) + ": // " + function.name)
+        write_c_line(file, indent + 2, "{")
+        if len(arguments) > 0:
+            reads = []
+            for argument in arguments:
+                write_c_line(file, indent + 3, get_argument_local_declaration(argument, context) + ";")
+                if mod_add_command_buffer.is_string_argument(argument):
+                    reads.append(read_string_function_name + "(&replay_read_ptr, replay_end, &" + argument.name +
+                                 ")")
+                else:
+                    reads.append(read_function_name + "(&replay_read_ptr, replay_end, &" + argument.name +
+                                 ", sizeof(" + argument.name + "))")
+            write_c_line(file, indent + 3, "if (!" + reads[0] + (")" if len(reads) == 1 else ""))
+            for read_index in range(1, len(reads)):
+                write_c_line(file, indent + 3, "    || !" + reads[read_index] +
+                             (")" if read_index == len(reads) - 1 else ""))
+            write_c_line(file, indent + 4, "return -1;")
+        write_c_line(file, indent + 3, "cimgui::" + function.name + "(" +
+                     ", ".join(argument.name for argument in arguments) + ");")
+        write_c_line(file, indent + 3, "break;")
+        write_c_line(file, indent + 2, "}")
+
+    generator.write_conditionals(replay_function, file, indent + 2)
+
+    write_c_line(file, indent + 2, "default:")
+    write_c_line(file, indent + 3, "return -1; // Unknown opcode")
+    write_c_line(file, indent + 2, "}")
+    write_c_line(file, indent + 2, "replay_command_count++;")
+    write_c_line(file, indent + 1, "}")
+    write_c_line(file, indent + 1, "return replay_command_count;")
+    write_c_line(file, indent, "}")
+
+    generator.finish_writing(file, indent)
@@ -2,7 +2,10 @@ import itertools
 from src import code_dom
 from src import utils
 from src import conditional_generator
+from src.generators import gen_struct_converters
+from src.modifiers import mod_add_api_table
 from src.code_dom.common import write_c_line
+from src.render_cache import get_write_context_key
 
 
 # Generate a cast between two types (if required)
@@ -87,8 +90,318 @@ def generate_cast(from_type, to_type, imgui_custom_types, nested_classes, to_cpp
     return cast_prefix, cast_suffix
 
 
+# Generate the stub body for a single function
+# args_with_temp_names is the list of indices of arguments that have been given temporary names
+def generate_function_stub(function, file, indent, write_context, imgui_custom_types, nested_classes,
+                           custom_varargs_list_suffixes, args_with_temp_names):
+    # Get a reference to the original (C++) version of the function
+    original_function = function.unmodified_element or function
+
+    # Check if this has a self argument we need to turn into a this pointer
+
+    has_self = False
+    is_const_function = False
+    self_class_type = function.original_class
+    # Constructors are a special case as they don't get self passed in
+    if self_class_type is not None and not function.is_constructor and not function.is_static:
+        has_self = True
+        # The function's own is_const will be false as it has been transformed into a non-const stub, but the
+        # self argument will be const in the case it was originally const
+        is_const_function = function.arguments[0].arg_type.tokens[0].value == 'const'
+
+    # Check if varargs is involved
+
+    uses_varargs = False
+    for arg in function.arguments:
+        if arg.is_varargs:
+            uses_varargs = True
+
+    # Fudge the function data to map everything into our namespace
+
+    function = function.clone_without_children()  # Clone so we aren't altering the original
+    function.name = "cimgui::" + function.name
+    for type_data in function.list_all_children_of_type(code_dom.DOMType):
+        for tok in type_data.tokens:
+            if tok.value in imgui_custom_types:
+                tok.value = "cimgui::" + tok.value
+
+    # We need to remove the "self" argument, partially because we don't want it and partially because if we
+    # don't the argument list won't match the original function's
+    # Length arguments added by mod_add_sized_string_functions don't exist in the original function either (their
+    # values are used via the stub_call_value of other arguments)
+    fudged_function_arguments = [arg for arg in function.arguments if arg.length_of_argument is None]
+    if has_self:
+        fudged_function_arguments = fudged_function_arguments[1:]
+
+    if len(fudged_function_arguments) != len(original_function.arguments):
+        raise Exception("Argument list mismatch with original function")
+
+    # Write function declaration
+
+    file.write("\n")
+    function.write_to_c(file, indent=indent, context=write_context)
+    write_c_line(file, indent, "{")
+    indent += 1
+
+    # Write varargs decoding preamble
+
+    if uses_varargs:
+        write_c_line(file, indent, "va_list args;")
+        write_c_line(file, indent, "va_start(args, fmt);")
+
+    # If the function takes an array of a by-value struct, then we need to generate an intermediate array to convert
+    # that into
+
+    converted_arg_name_overrides = {}  # Map of arguments whose names we have changed through conversion,
+    #                                    indexed by the original name
+
+    arg_to_original_arg_list = list(zip(fudged_function_arguments, original_function.arguments))
+    for (arg, original_arg) in arg_to_original_arg_list:
+        if original_arg.is_array and not arg.is_implicit_default:
+            if len(original_arg.arg_type.tokens) >= 1:
+                type_name = original_arg.arg_type.tokens[len(original_arg.arg_type.tokens) - 1].value
+                if type_name in imgui_custom_types:
+                    underlying_type = imgui_custom_types[type_name]
+                    if isinstance(underlying_type, code_dom.DOMClassStructUnion) and underlying_type.is_by_value and \
+                            gen_struct_converters.is_layout_compatible(underlying_type, imgui_custom_types):
+                        # This is an array of a by-value struct with the same layout in C and C++ (which is checked by
+                        # static_asserts alongside the conversion functions), so we can pass it straight through
+                        # without a copy
+                        is_const = any(tok.value == 'const' for tok in original_arg.arg_type.tokens)
+                        converted_arg_name_overrides[arg.name] = \
+                            "reinterpret_cast<" + ("const " if is_const else "") + \
+                            underlying_type.get_original_fully_qualified_name(include_leading_colons=True) + \
+                            "*>(" + arg.name + ")"
+                    elif isinstance(underlying_type, code_dom.DOMClassStructUnion) and underlying_type.is_by_value:
+                        # This is an array of a by-value struct, so we need to convert it
+                        # Emit a local array of the converted type
+
+                        if arg.array_bounds is None:
+                            raise Exception("Cannot convert an array of indeterminate size")
+
+                        converted_array_name = arg.name + "_converted_array"
+                        write_c_line(file, indent,
+                                     underlying_type.get_original_fully_qualified_name(include_leading_colons=True)
+                                     + " " + converted_array_name + "[" + str(arg.array_bounds) + "];")
+
+                        # And a for loop to do the conversion
+                        write_c_line(file, indent, "for (int i=0; i<" + str(arg.array_bounds) + "; i++)")
+                        write_c_line(file, indent + 1, converted_array_name + "[i] = " +
+                                     "ConvertToCPP_" + underlying_type.name + "(" + arg.name + "[i]);")
+
+                        converted_arg_name_overrides[arg.name] = converted_array_name
+
+    # Write body containing thunk call
+
+    if (function.return_type is None) or (function.return_type.to_c_string() == "void"):
+        thunk_call = ""
+    else:
+        thunk_call = "return "
+
+    # Generate return type cast if necessary
+
+    if function.is_constructor:
+        # Constructors are a special case that returns the type they are constructing
+
+        # To use generate_cast() we need to generate a type element that represents what the C++ new() call will
+        # be returning
+        original_type_name = original_function.get_parent_class().get_fully_qualified_name()
+
+        if not function.is_by_value_constructor:
+            original_type_name += "*"
+
+        new_type = code_dom.DOMType()
+        new_type.tokens = utils.create_tokens_for_type(original_type_name)
+
+        return_cast_prefix, return_cast_suffix = generate_cast(new_type,
+                                                               function.return_type,
+                                                               imgui_custom_types,
+                                                               nested_classes,
+                                                               to_cpp=False)
+    else:
+        return_cast_prefix, return_cast_suffix = generate_cast(original_function.return_type,
+                                                               function.return_type,
+                                                               imgui_custom_types,
+                                                               nested_classes,
+                                                               to_cpp=False)
+    thunk_call += return_cast_prefix
+
+    function_call_name = function.get_original_fully_qualified_name()
+
+    if uses_varargs:
+        if function_call_name in custom_varargs_list_suffixes:
+            function_call_name += custom_varargs_list_suffixes[function_call_name]
+        else:
+            # Make the glorious assumption that if something has varargs, there will be a corresponding
+            # <function name>V function that takes a va_list
+            function_call_name += "V"
+
+    if has_self:
+        # Cast self pointer
+        if is_const_function:
+            thunk_call += "reinterpret_cast<const " + \
+                          self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
+                          "*>(self)->"
+        else:
+            thunk_call += "reinterpret_cast<" + \
+                          self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
+                          "*>(self)->"
+    else:
+        # If the function is not a member function, prefix the call with :: to avoid accidentally picking
+        # up functions from the wrong namespace
+        function_call_name = "::" + function_call_name
+
+    if (function.return_type is not None) and (function.return_type.to_c_string() != "void"):
+        # If the return type was a reference that we turned into a pointer, turn it into a pointer here
+        # (note that we do no marshalling to make sure this is safe memory-wise!)
+        for tok in function.return_type.tokens:
+            if hasattr(tok, "was_reference") and tok.was_reference:
+                thunk_call += "&"
+
+    if function.is_constructor:
+        if not function.is_by_value_constructor:
+            # Add new (unless this is by-value, in which case we don't want it)
+            thunk_call += "new "
+        # Constructor calls use the typename, not the nominal function name within the type
+        function_call_name = self_class_type.get_original_fully_qualified_name(include_leading_colons=True)
+
+    thunk_call += function_call_name + "("
+
+    first_arg = True
+    for (arg, original_arg) in arg_to_original_arg_list:
+        if arg.is_implicit_default and arg.stub_call_value is None:
+            continue  # Skip implicit default arguments
+
+        # Generate a set of dereference operators to convert any pointer that was originally a reference and
+        # converted by mod_convert_references_to_pointers back into reference form for passing to the C++ API
+        # This isn't perfect but it should deal correctly with all the reasonably simple cases
+        dereferences = ""
+        if arg.arg_type is not None:
+            for tok in arg.arg_type.tokens:
+                if hasattr(tok, "was_reference") and tok.was_reference:
+                    dereferences += "*"
+
+        # Generate a cast if required
+        cast_prefix, cast_suffix = generate_cast(arg.arg_type, original_arg.arg_type,
+                                                 imgui_custom_types, nested_classes, to_cpp=True)
+
+        if not first_arg:
+            thunk_call += ", "
+        if arg.is_varargs:
+            thunk_call += "args"  # Turn ... into our expanded varargs list
+        else:
+            if arg.name in converted_arg_name_overrides:
+                # If the name got remapped due to conversion, that also means we don't need any casting
+                thunk_call += dereferences + converted_arg_name_overrides[arg.name]
+            else:
+                if arg.stub_call_value is not None:
+                    # Stub call values are already of the type the original function expects
+                    thunk_call += arg.stub_call_value
+                else:
+                    thunk_call += cast_prefix + dereferences + arg.name + cast_suffix
+        first_arg = False
+
+    thunk_call += ")" + return_cast_suffix + ";"
+
+    if function.is_destructor:
+        #  Destructors get a totally different bit of code generated
+        write_c_line(file, indent, "delete self;")
+    else:
+        write_c_line(file, indent, thunk_call)
+
+    # Write varargs teardown
+
+    if uses_varargs:
+        write_c_line(file, indent, "va_end(args);")
+
+    # Close off body
+
+    indent -= 1
+    write_c_line(file, indent, "}")
+
+    # Remove temporary argument names
+    for arg_index in args_with_temp_names:
+        function.arguments[arg_index].name = None
+
+
+# Get a JSON-compatible representation of the information about custom types that function stubs depend on (for
+# render cache keys)
+def get_custom_types_key(imgui_custom_types):
+    result = []
+    for name, custom_type in imgui_custom_types.items():
+        if name is None:
+            continue  # Anonymous types can't be referred to
+        result.append([name,
+                       type(custom_type).__name__,
+                       getattr(custom_type, "is_by_value", False),
+                       getattr(custom_type, "is_by_value", False) and
+                       gen_struct_converters.is_layout_compatible(custom_type, imgui_custom_types),
+                       custom_type.get_original_fully_qualified_name(include_leading_colons=True)])
+    return sorted(result)
+
+
+# Generate the body of a batched variant of a function (see mod_add_batch_functions), which calls the C version of the
+# original function for each element of the argument array
+def generate_batch_function_stub(function, file, indent, write_context, imgui_custom_types):
+    source_function = None
+    for sibling in function.parent.list_directly_contained_children_of_type(code_dom.DOMFunctionDeclaration):
+        if sibling.name == function.batch_source_function:
+            source_function = sibling
+            break
+
+    if source_function is None:
+        raise Exception("Could not find function " + function.batch_source_function + " for batched function " +
+                        function.name)
+
+    source_arguments = [argument for argument in source_function.arguments if not argument.is_implicit_default]
+
+    # Everything but args/count is passed straight through (this is the self argument, if there is one)
+    call_arguments = [argument.name for argument in function.arguments[:-2]]
+    for argument in source_arguments[len(call_arguments):]:
+        call_arguments.append("args[i]." + argument.name)
+
+    # Map the declaration into our namespace
+    function = function.clone_without_children()
+    function.name = "cimgui::" + function.name
+    for type_data in function.list_all_children_of_type(code_dom.DOMType):
+        for tok in type_data.tokens:
+            if tok.value in imgui_custom_types:
+                tok.value = "cimgui::" + tok.value
+
+    file.write("\n")
+    function.write_to_c(file, indent=indent, context=write_context)
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "for (int i = 0; i < count; i++)")
+    write_c_line(file, indent + 2, "cimgui::" + source_function.name + "(" + ", ".join(call_arguments) + ");")
+    write_c_line(file, indent, "}")
+
+
+# Generate the helpers used by the stubs for functions added by mod_add_sized_string_functions (if there are any)
+def generate_sized_string_helpers(dom_root, file, indent):
+    if not any(function.sized_string_source_function is not None
+               for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration)):
+        return
+
+    file.write("\n")
+    write_c_line(file, indent, "#if defined(IMGUI_HAS_IMSTR)")
+    write_c_line(file, indent, "#if IMGUI_HAS_IMSTR")
+    file.write("\n")
+    write_c_line(file, indent, "// Internal helper to convert char* and a length directly to C++-style ImStr")
+    write_c_line(file, indent, "static inline ::ImStr MarshalToCPP_ImStr_FromSizedCharStr(const char* b, size_t len)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "::ImStr str;")
+    write_c_line(file, indent + 1, "str.Begin = b;")
+    write_c_line(file, indent + 1, "str.End = b ? b + len : NULL;")
+    write_c_line(file, indent + 1, "return str;")
+    write_c_line(file, indent, "}")
+    write_c_line(file, indent, "#endif // IMGUI_HAS_IMSTR")
+    write_c_line(file, indent, "#endif // defined(IMGUI_HAS_IMSTR)")
+
+
 # Generate function stub bodies
-def generate(dom_root, file, imgui_custom_types, indent=0, custom_varargs_list_suffixes={}, is_backend=False):
+# If render_cache is supplied, previously generated stubs are reused for functions that have not changed
+def generate(dom_root, file, imgui_custom_types, indent=0, custom_varargs_list_suffixes={}, is_backend=False,
+             render_cache=None):
     generator = conditional_generator.ConditionalGenerator()
 
     write_context = code_dom.WriteContext()
@@ -105,6 +418,16 @@ def generate(dom_root, file, imgui_custom_types, indent=0, custom_varargs_list_s
         if (parent_struct is not None) and (struct.name is not None):
             nested_classes[struct.name] = struct.get_fully_qualified_name(include_leading_colons=True)
 
+    if render_cache is not None:
+        # Everything other than the function itself that the generated stubs depend on
+        stub_key_data = [indent,
+                         get_write_context_key(write_context),
+                         nested_classes,
+                         custom_varargs_list_suffixes,
+                         get_custom_types_key(imgui_custom_types)]
+
+    generate_sized_string_helpers(dom_root, file, indent)
+
     file.write("\n")
     write_c_line(file, indent, "// Function stubs")
     # Emit functions
@@ -115,9 +438,6 @@ def generate(dom_root, file, imgui_custom_types, indent=0, custom_varargs_list_s
         # Emit conditionals (#ifdefs/etc)
         generator.write_conditionals(function, file, indent)
 
-        # Get a reference to the original (C++) version of the function
-        original_function = function.unmodified_element or function
-
         # Give temporary names to any arguments that lack them
         args_with_temp_names = []
 
@@ -128,219 +448,60 @@ def generate(dom_root, file, imgui_custom_types, indent=0, custom_varargs_list_s
                 args_with_temp_names.append(arg_index)
             arg_index += 1
 
-        # Check if this has a self argument we need to turn into a this pointer
-
-        has_self = False
-        is_const_function = False
-        self_class_type = function.original_class
-        # Constructors are a special case as they don't get self passed in
-        if self_class_type is not None and not function.is_constructor and not function.is_static:
-            has_self = True
-            # The function's own is_const will be false as it has been transformed into a non-const stub, but the
-            # self argument will be const in the case it was originally const
-            is_const_function = function.arguments[0].arg_type.tokens[0].value == 'const'
-
-        # Check if varargs is involved
-
-        uses_varargs = False
-        for arg in function.arguments:
-            if arg.is_varargs:
-                uses_varargs = True
-
-        # Fudge the function data to map everything into our namespace
-
-        function = function.clone_without_children()  # Clone so we aren't altering the original
-        function.name = "cimgui::" + function.name
-        for type_data in function.list_all_children_of_type(code_dom.DOMType):
-            for tok in type_data.tokens:
-                if tok.value in imgui_custom_types:
-                    tok.value = "cimgui::" + tok.value
-
-        # We need to remove the "self" argument, partially because we don't want it and partially because if we
-        # don't the argument list won't match the original function's
-        fudged_function_arguments = function.arguments.copy()
-        if has_self:
-            fudged_function_arguments = fudged_function_arguments[1:]
-
-        if len(fudged_function_arguments) != len(original_function.arguments):
-            raise Exception("Argument list mismatch with original function")
-
-        # Write function declaration
-
-        file.write("\n")
-        function.write_to_c(file, indent=indent, context=write_context)
-        write_c_line(file, indent, "{")
-        indent += 1
-
-        # Write varargs decoding preamble
-
-        if uses_varargs:
-            write_c_line(file, indent, "va_list args;")
-            write_c_line(file, indent, "va_start(args, fmt);")
-
-        # If the function takes an array of a by-value struct, then we need to generate an intermediate array to convert
-        # that into
-
-        converted_arg_name_overrides = {}  # Map of arguments whose names we have changed through conversion,
-        #                                    indexed by the original name
-
-        arg_to_original_arg_list = list(zip(fudged_function_arguments, original_function.arguments))
-        for (arg, original_arg) in arg_to_original_arg_list:
-            if original_arg.is_array and not arg.is_implicit_default:
-                if len(original_arg.arg_type.tokens) >= 1:
-                    type_name = original_arg.arg_type.tokens[len(original_arg.arg_type.tokens) - 1].value
-                    if type_name in imgui_custom_types:
-                        underlying_type = imgui_custom_types[type_name]
-                        if isinstance(underlying_type, code_dom.DOMClassStructUnion) and underlying_type.is_by_value:
-                            # This is an array of a by-value struct, so we need to convert it
-                            # Emit a local array of the converted type
-
-                            if arg.array_bounds is None:
-                                raise Exception("Cannot convert an array of indeterminate size")
-
-                            converted_array_name = arg.name + "_converted_array"
-                            write_c_line(file, indent,
-                                         underlying_type.get_original_fully_qualified_name(include_leading_colons=True)
-                                         + " " + converted_array_name + "[" + str(arg.array_bounds) + "];")
-
-                            # And a for loop to do the conversion
-                            write_c_line(file, indent, "for (int i=0; i<" + str(arg.array_bounds) + "; i++)")
-                            write_c_line(file, indent + 1, converted_array_name + "[i] = " +
-                                         "ConvertToCPP_" + underlying_type.name + "(" + arg.name + "[i]);")
-
-                            converted_arg_name_overrides[arg.name] = converted_array_name
-
-        # Write body containing thunk call
-
-        if (function.return_type is None) or (function.return_type.to_c_string() == "void"):
-            thunk_call = ""
+        if function.batch_source_function is not None:
+            generate_batch_function_stub(function, file, indent, write_context, imgui_custom_types)
+        elif render_cache is not None:
+            file.write(render_cache.get_text(function, "stub", stub_key_data,
+                                             lambda buffer: generate_function_stub(function, buffer, indent,
+                                                                                   write_context,
+                                                                                   imgui_custom_types,
+                                                                                   nested_classes,
+                                                                                   custom_varargs_list_suffixes,
+                                                                                   args_with_temp_names)))
         else:
-            thunk_call = "return "
+            generate_function_stub(function, file, indent, write_context, imgui_custom_types, nested_classes,
+                                   custom_varargs_list_suffixes, args_with_temp_names)
 
-        # Generate return type cast if necessary
-
-        if function.is_constructor:
-            # Constructors are a special case that returns the type they are constructing
+    # Finally close any last conditionals
+    generator.finish_writing(file, indent)
 
-            # To use generate_cast() we need to generate a type element that represents what the C++ new() call will
-            # be returning
-            original_type_name = original_function.get_parent_class().get_fully_qualified_name()
 
-            if not function.is_by_value_constructor:
-                original_type_name += "*"
 
-            new_type = code_dom.DOMType()
-            new_type.tokens = utils.create_tokens_for_type(original_type_name)
+# Generate the table of function pointers and getter function added to the header by mod_add_api_table
+def generate_api_table(dom_root, file, dest_file_name, indent=0, is_backend=False):
+    struct_name, function_name, version_define_name = mod_add_api_table.get_api_table_names(dest_file_name)
 
-            return_cast_prefix, return_cast_suffix = generate_cast(new_type,
-                                                                   function.return_type,
-                                                                   imgui_custom_types,
-                                                                   nested_classes,
-                                                                   to_cpp=False)
-        else:
-            return_cast_prefix, return_cast_suffix = generate_cast(original_function.return_type,
-                                                                   function.return_type,
-                                                                   imgui_custom_types,
-                                                                   nested_classes,
-                                                                   to_cpp=False)
-        thunk_call += return_cast_prefix
-
-        function_call_name = function.get_original_fully_qualified_name()
-
-        if uses_varargs:
-            if function_call_name in custom_varargs_list_suffixes:
-                function_call_name += custom_varargs_list_suffixes[function_call_name]
-            else:
-                # Make the glorious assumption that if something has varargs, there will be a corresponding
-                # <function name>V function that takes a va_list
-                function_call_name += "V"
-
-        if has_self:
-            # Cast self pointer
-            if is_const_function:
-                thunk_call += "reinterpret_cast<const " + \
-                              self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
-                              "*>(self)->"
-            else:
-                thunk_call += "reinterpret_cast<" + \
-                              self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
-                              "*>(self)->"
-        else:
-            # If the function is not a member function, prefix the call with :: to avoid accidentally picking
-            # up functions from the wrong namespace
-            function_call_name = "::" + function_call_name
-
-        if (function.return_type is not None) and (function.return_type.to_c_string() != "void"):
-            # If the return type was a reference that we turned into a pointer, turn it into a pointer here
-            # (note that we do no marshalling to make sure this is safe memory-wise!)
-            for tok in function.return_type.tokens:
-                if hasattr(tok, "was_reference") and tok.was_reference:
-                    thunk_call += "&"
-
-        if function.is_constructor:
-            if not function.is_by_value_constructor:
-                # Add new (unless this is by-value, in which case we don't want it)
-                thunk_call += "new "
-            # Constructor calls use the typename, not the nominal function name within the type
-            function_call_name = self_class_type.get_original_fully_qualified_name(include_leading_colons=True)
-
-        thunk_call += function_call_name + "("
-
-        first_arg = True
-        for (arg, original_arg) in arg_to_original_arg_list:
-            if arg.is_implicit_default and arg.stub_call_value is None:
-                continue  # Skip implicit default arguments
-
-            # Generate a set of dereference operators to convert any pointer that was originally a reference and
-            # converted by mod_convert_references_to_pointers back into reference form for passing to the C++ API
-            # This isn't perfect but it should deal correctly with all the reasonably simple cases
-            dereferences = ""
-            if arg.arg_type is not None:
-                for tok in arg.arg_type.tokens:
-                    if hasattr(tok, "was_reference") and tok.was_reference:
-                        dereferences += "*"
-
-            # Generate a cast if required
-            cast_prefix, cast_suffix = generate_cast(arg.arg_type, original_arg.arg_type,
-                                                     imgui_custom_types, nested_classes, to_cpp=True)
-
-            if not first_arg:
-                thunk_call += ", "
-            if arg.is_varargs:
-                thunk_call += "args"  # Turn ... into our expanded varargs list
-            else:
-                if arg.name in converted_arg_name_overrides:
-                    # If the name got remapped due to conversion, that also means we don't need any casting
-                    thunk_call += dereferences + converted_arg_name_overrides[arg.name]
-                else:
-                    argument_call = arg.name
-                    if arg.stub_call_value is not None:
-                        argument_call = arg.stub_call_value
-                    thunk_call += cast_prefix + dereferences + argument_call + cast_suffix
-            first_arg = False
-
-        thunk_call += ")" + return_cast_suffix + ";"
+    getter_function = None
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.is_manual_helper and (function.name == function_name):
+            getter_function = function
+            break
 
-        if function.is_destructor:
-            #  Destructors get a totally different bit of code generated
-            write_c_line(file, indent, "delete self;")
-        else:
-            write_c_line(file, indent, thunk_call)
+    if getter_function is None:
+        return  # No table in this file
 
-        # Write varargs teardown
+    table_name = function_name[:-len("_get_api")] + "_api_table"
 
-        if uses_varargs:
-            write_c_line(file, indent, "va_end(args);")
+    generator = conditional_generator.ConditionalGenerator()
 
-        # Close off body
+    generator.write_conditionals(getter_function, file, indent)
+    write_c_line(file, indent, "// API table")
 
-        indent -= 1
-        write_c_line(file, indent, "}")
+    # The table entries need to be in the same order (and under the same conditionals) as the struct fields
+    write_c_line(file, indent, "static const cimgui::" + struct_name + " " + table_name + " =")
+    write_c_line(file, indent, "{")
+    for slot_functions in mod_add_api_table.get_api_table_slots(dom_root, function_name):
+        mod_add_api_table.write_table_slot(file, indent + 1, getter_function,
+                                           [(function, "&cimgui::" + function.name + ",")
+                                            for function in slot_functions],
+                                           "NULL,")
+    write_c_line(file, indent, "};")
 
-        # Remove temporary argument names
-        for arg_index in args_with_temp_names:
-            function.arguments[arg_index].name = None
+    file.write("\n")
+    write_c_line(file, indent, ("CIMGUI_IMPL_API " if is_backend else "CIMGUI_API ") + "const cimgui::" + struct_name +
+                 "* cimgui::" + function_name + "(int version)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "return (version == " + version_define_name + ") ? &" + table_name + " : NULL;")
+    write_c_line(file, indent, "}")
 
-    # Finally close any last conditionals
     generator.finish_writing(file, indent)
-
@@ -1,6 +1,8 @@
 from src import code_dom
 from src import utils
 from src import type_comprehension
+from src import struct_layout
+import hashlib
 import json
 
 
@@ -85,6 +87,44 @@ def add_source_file_and_line(element, root):
             source_info["line"] = source_line
             
             
+# Keys that are ignored when calculating content hashes (as they don't affect the signature/layout of the element)
+content_hash_ignored_keys = {"comments", "source_location", "content_hash"}
+
+# Keys that contain types (which may be IDs in a type table)
+type_keys = {"type", "return_type", "storage_type"}
+
+
+# Get a canonical version of some metadata for hashing, with ignored keys removed and any type IDs replaced with
+# the type data they refer to (via resolve_type)
+def get_canonical_content(value, resolve_type):
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in content_hash_ignored_keys:
+                continue
+            if (key in type_keys) and isinstance(item, int):
+                item = resolve_type(item)
+            result[key] = get_canonical_content(item, resolve_type)
+        return result
+    elif isinstance(value, list):
+        return [get_canonical_content(item, resolve_type) for item in value]
+    else:
+        return value
+
+
+# Calculate a stable hash of the content of a metadata element (excluding comments and source location, so that
+# the hash only changes if the signature or layout of the element does). resolve_type should be a function that
+# returns the type data for a type ID (only needed if the metadata uses a type table).
+def get_content_hash(root, resolve_type=None):
+    canonical_content = json.dumps(get_canonical_content(root, resolve_type), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical_content.encode("utf-8")).hexdigest()[:16]
+
+
+# Add a content hash to the dictionary given
+def add_content_hash(root, type_table):
+    root["content_hash"] = get_content_hash(root, type_table.get_type if type_table is not None else None)
+
+
 # Emit type comprehension storage classes
 def emit_type_comprehension_storage_classes(container, storage_classes):
     if len(storage_classes) > 0:
@@ -191,13 +231,13 @@ def emit_type_comprehension_element(element):
 
 
 # Emit data for a single function pointer type
-def emit_function_pointer_type(function_ptr):
+def emit_function_pointer_type(function_ptr, type_table=None):
     result = {}
 
     result["flavour"] = "function_pointer"
 
     if function_ptr.return_type is not None:
-        result["return_type"] = emit_type(function_ptr.return_type)
+        result["return_type"] = emit_type(function_ptr.return_type, type_table=type_table)
 
     arguments_root = []
     result["arguments"] = arguments_root
@@ -205,7 +245,7 @@ def emit_function_pointer_type(function_ptr):
     for argument in function_ptr.arguments:
         if argument.is_implicit_default:
             continue  # Don't emit implicit default arguments
-        arguments_root.append(emit_function_argument(argument))
+        arguments_root.append(emit_function_argument(argument, type_table))
 
     return result
 
@@ -213,7 +253,8 @@ def emit_function_pointer_type(function_ptr):
 # Emit data for a single type
 # declaration_suffix is a workaround to allow us to include array information that is currently stored outside
 # the main type for arguments/fields
-def emit_type(type_info, declaration_suffix=""):
+# If type_table is supplied, the type is added to that and its ID returned instead of the type data itself
+def emit_type(type_info, declaration_suffix="", type_table=None):
     result = {}
 
     # The regular declaration
@@ -225,19 +266,70 @@ def emit_type(type_info, declaration_suffix=""):
     context.mark_non_nullable_pointers = True
     declaration_with_non_nullable_pointers = type_info.to_c_string(context) + declaration_suffix
 
+    is_function_pointer = isinstance(type_info, code_dom.DOMFunctionPointerType)
+
+    # Function pointer types include their argument names, so those can't be looked up by declaration alone
+    if (type_table is not None) and not is_function_pointer:
+        type_id = type_table.get_declaration_type_id(declaration, declaration_with_non_nullable_pointers)
+        if type_id is not None:
+            return type_id
+
     result["declaration"] = declaration
 
-    if isinstance(type_info, code_dom.DOMFunctionPointerType):
+    if is_function_pointer:
         # Special case for function pointers - we want to include a parsed version as well
-        result["type_details"] = emit_function_pointer_type(type_info)
+        result["type_details"] = emit_function_pointer_type(type_info, type_table)
 
     # Emit type description as generated by the type comprehension system
     description_type = type_comprehension.type_comprehender.get_type_description(declaration_with_non_nullable_pointers)
     result["description"] = emit_type_comprehension_element(description_type)
 
+    if type_table is not None:
+        type_id = type_table.add_type(result)
+        if not is_function_pointer:
+            type_table.set_declaration_type_id(declaration, declaration_with_non_nullable_pointers, type_id)
+        return type_id
+
     return result
 
 
+# A table of the distinct types used in the metadata, which can be emitted once and then referred to by ID (in place
+# of repeating the full type data at every use)
+class MetadataTypeTable:
+    def __init__(self):
+        self.types = []  # Type data, indexed by ID
+        self.type_ids_by_content = {}  # Type IDs indexed by the JSON serialisation of the type data
+        self.type_ids_by_declaration = {}  # Type IDs indexed by (declaration, declaration with non-nullable pointers)
+
+    # Get the ID of a type that has already been emitted for a given declaration, or None if there isn't one
+    def get_declaration_type_id(self, declaration, declaration_with_non_nullable_pointers):
+        return self.type_ids_by_declaration.get((declaration, declaration_with_non_nullable_pointers))
+
+    def set_declaration_type_id(self, declaration, declaration_with_non_nullable_pointers, type_id):
+        self.type_ids_by_declaration[(declaration, declaration_with_non_nullable_pointers)] = type_id
+
+    # Add a type to the table (if an identical one is not already present), returning its ID
+    def add_type(self, type_root):
+        key = json.dumps(type_root, sort_keys=True)
+        type_id = self.type_ids_by_content.get(key)
+        if type_id is None:
+            type_id = len(self.types)
+            self.types.append(type_root)
+            self.type_ids_by_content[key] = type_id
+        return type_id
+
+    # Get the data for a type by ID
+    def get_type(self, type_id):
+        return self.types[type_id]
+
+    # Get the table entries to emit (each one with its ID included)
+    def get_entries(self):
+        for type_id, type_root in enumerate(self.types):
+            entry = {"id": type_id}
+            entry.update(type_root)
+            yield entry
+
+
 # Emit data for an enum element
 def emit_enum_element(enum):
     result = {}
@@ -258,13 +350,13 @@ def emit_enum_element(enum):
 
 
 # Emit data for an enum
-def emit_enum(enum):
+def emit_enum(enum, type_table=None):
     result = {}
 
     result["name"] = enum.name
     result["original_fully_qualified_name"] = enum.get_original_fully_qualified_name()
     if enum.storage_type is not None:
-        result["storage_type"] = emit_type(enum.storage_type)
+        result["storage_type"] = emit_type(enum.storage_type, type_table=type_table)
     result["is_flags_enum"] = enum.is_flags_enum
 
     elements_root = []
@@ -277,20 +369,22 @@ def emit_enum(enum):
     add_preprocessor_conditionals(enum, result)
     add_internal_flag(enum, result)
     add_source_file_and_line(enum, result)
+    add_content_hash(result, type_table)
 
     return result
 
 # Emit data for a single typedef
-def emit_typedef(typedef):
+def emit_typedef(typedef, type_table=None):
     result = {}
 
     result["name"] = typedef.name
-    result["type"] = emit_type(typedef.type)
+    result["type"] = emit_type(typedef.type, type_table=type_table)
 
     add_comments(typedef, result)
     add_preprocessor_conditionals(typedef, result)
     add_internal_flag(typedef, result)
     add_source_file_and_line(typedef, result)
+    add_content_hash(result, type_table)
 
     return result
 
@@ -298,7 +392,7 @@ def emit_typedef(typedef):
 # Emit data for a single field (which may actually contain multiple fields if it has several names)
 # In the case where there are several names we pretend they are each a distinct field, to avoid complicating
 # the JSON to support a corner-case of C syntax
-def emit_field(container, field):
+def emit_field(container, field, type_table=None):
     # Emit one field for each of the field names
     for i in range(0, len(field.names)):
         field_data = {}
@@ -317,7 +411,7 @@ def emit_field(container, field):
         field_data["is_anonymous"] = field.is_anonymous
 
         # Emit the type
-        field_data["type"] = emit_type(field.field_type, declaration_suffix)
+        field_data["type"] = emit_type(field.field_type, declaration_suffix, type_table)
 
         # Emit the default value, if any
         if field.default_value_tokens is not None:
@@ -333,14 +427,14 @@ def emit_field(container, field):
 
 # Walk into a container (initially a struct) and emit field declarations for any fields found
 # Avoid recursing into nested structs (as those don't contribute fields to their container)
-def emit_struct_field_list(container, fields_root):
+def emit_struct_field_list(container, fields_root, type_table=None):
     # It is important that we preserve ordering here (so we can't, for example, emit all fields first and then nested
     # structs, as those structs could be implicit field declarations)
     for child_list in container.get_child_lists():
         for child in child_list:
             if isinstance(child, code_dom.DOMFieldDeclaration):
                 # Regular fields
-                emit_field(fields_root, child)
+                emit_field(fields_root, child, type_table)
             elif isinstance(child, code_dom.DOMClassStructUnion):
                 # Nested structs
 
@@ -356,15 +450,15 @@ def emit_struct_field_list(container, fields_root):
                     dummy_field.is_anonymous = child.is_anonymous  # Technically wrong, but see above
                     dummy_type = utils.create_type(child.name)
                     dummy_field.field_type = dummy_type
-                    emit_field(fields_root, dummy_field)
+                    emit_field(fields_root, dummy_field, type_table)
             else:
                 # If we find anything else, recurse into it to look for fields (as it may be a preprocessor declaration
                 # or similar)
-                emit_struct_field_list(child, fields_root)
+                emit_struct_field_list(child, fields_root, type_table)
 
 
 # Emit data for a single struct
-def emit_struct(struct):
+def emit_struct(struct, type_table=None):
     result = {}
 
     result["name"] = struct.name
@@ -377,18 +471,53 @@ def emit_struct(struct):
     fields_root = []
     result["fields"] = fields_root
 
-    emit_struct_field_list(struct, fields_root)
+    emit_struct_field_list(struct, fields_root, type_table)
 
     add_comments(struct, result)
     add_preprocessor_conditionals(struct, result)
     add_internal_flag(struct, result)
     add_source_file_and_line(struct, result)
+    add_content_hash(result, type_table)
+
+    return result
 
+
+# Add the size and alignment of a struct, and the offsets of its fields, for each ABI that layout_calculators (a list of
+# StructLayoutCalculators) covers, returning the new struct data
+# Layouts that can't be determined, or which depend on the build configuration, are omitted
+# This is done on a copy of the struct data, as the layout depends on other elements (so it can't be cached with it)
+def add_struct_layout(struct, struct_data, layout_calculators, type_table=None):
+    layouts = {}
+    for layout_calculator in layout_calculators:
+        layout = layout_calculator.get_struct_layout(struct)
+        if (layout is not None) and not struct_layout.is_configuration_dependent(struct, layout):
+            layouts[layout_calculator.abi.name] = layout
+
+    if len(layouts) == 0:
+        return struct_data
+
+    result = dict(struct_data)
+    result["layout"] = {abi_name: {"size": layout.size, "alignment": layout.alignment}
+                        for abi_name, layout in layouts.items()}
+
+    result["fields"] = []
+    for field_data in struct_data["fields"]:
+        field_data = dict(field_data)
+        for abi_name, layout in layouts.items():
+            field_layout = layout.get_field(field_data["name"])
+            if field_layout is None:
+                continue  # Static fields don't have an offset
+            field_data.setdefault("offset", {})[abi_name] = field_layout.offset
+            if field_layout.bit_width is not None:
+                field_data.setdefault("bit_offset", {})[abi_name] = field_layout.bit_offset
+        result["fields"].append(field_data)
+
+    add_content_hash(result, type_table)
     return result
 
 
 # Emit data for a single function argument
-def emit_function_argument(argument):
+def emit_function_argument(argument, type_table=None):
     result = {}
 
     if argument.name is not None:
@@ -397,7 +526,7 @@ def emit_function_argument(argument):
         declaration_suffix = ""
         if argument.is_array:
             declaration_suffix = "[" + str(argument.array_bounds or "") + "]"
-        result["type"] = emit_type(argument.arg_type, declaration_suffix)
+        result["type"] = emit_type(argument.arg_type, declaration_suffix, type_table)
     result["is_array"] = argument.is_array
     result["is_varargs"] = argument.is_varargs
     if argument.is_array:
@@ -405,19 +534,25 @@ def emit_function_argument(argument):
     if argument.default_value_tokens is not None:
         result["default_value"] = code_dom.common.collapse_tokens_to_string(argument.default_value_tokens)
     result["is_instance_pointer"] = argument.is_instance_pointer
+    # Note if this was passed by value originally (see --nopassingstructsbyvalue and --struct-args-by-pointer-*)
+    if argument.was_by_value_struct:
+        result["was_by_value_struct"] = True
+    # Note the string argument this gives the length of, if it is one (see --emit-sized-string-functions)
+    if argument.length_of_argument is not None:
+        result["length_of_argument"] = argument.length_of_argument
 
     return result
 
 
 # Emit data for a single function
-def emit_function(function):
+def emit_function(function, type_table=None):
     result = {}
 
     result["name"] = function.name
     result["original_fully_qualified_name"] = function.get_original_fully_qualified_name()
 
     if function.return_type is not None:
-        result["return_type"] = emit_type(function.return_type)
+        result["return_type"] = emit_type(function.return_type, type_table=type_table)
 
     arguments_root = []
     result["arguments"] = arguments_root
@@ -425,7 +560,7 @@ def emit_function(function):
     for argument in function.arguments:
         if argument.is_implicit_default:
             continue  # Don't emit implicit default arguments
-        arguments_root.append(emit_function_argument(argument))
+        arguments_root.append(emit_function_argument(argument, type_table))
 
     result["is_default_argument_helper"] = \
         function.is_default_argument_helper  # True for functions that are variants of existing functions but with
@@ -452,10 +587,27 @@ def emit_function(function):
     if function.original_class is not None:
         result["original_class"] = function.original_class.name
 
+    # Note the function this is a batched version of, if it is one (see --batch-function)
+    if function.batch_source_function is not None:
+        result["batch_source_function"] = function.batch_source_function
+
+    # Note the C++ symbol that C code can call directly instead, if there is one (see --emit-direct-aliases)
+    if function.direct_alias_symbol is not None:
+        result["direct_alias_symbol"] = function.direct_alias_symbol
+
+    # Note the opcode used to record calls to this in command buffers, if it has one (see --emit-command-buffer)
+    if function.command_opcode is not None:
+        result["command_opcode"] = function.command_opcode
+
+    # Note the function this takes sized strings in place of, if it is a variant (see --emit-sized-string-functions)
+    if function.sized_string_source_function is not None:
+        result["sized_string_source_function"] = function.sized_string_source_function
+
     add_comments(function, result)
     add_preprocessor_conditionals(function, result)
     add_internal_flag(function, result)
     add_source_file_and_line(function, result)
+    add_content_hash(result, type_table)
 
     return result
 
@@ -475,18 +627,89 @@ def emit_define(define):
     add_preprocessor_conditionals(define, result)
     add_internal_flag(define, result)
     add_source_file_and_line(define, result)
+    add_content_hash(result, None)
 
     return result
 
 
-# Write metadata about our file to a JSON file
-def generate(dom_root, file):
-    metadata_root = {}
+# Options controlling the metadata output format
+class MetadataOptions:
+    def __init__(self):
+        self.compact = False  # Emit JSON without indentation or whitespace between items
+        self.compression = None  # Compression to apply to the output file ("gzip", "xz" or None)
+        self.type_table = False  # Emit each distinct type once in a "types" table, and refer to types by ID elsewhere
+        self.binary = False  # Also emit the metadata in the indexed binary format (see binary_metadata.py)
+        self.sqlite = False  # Also emit the metadata as an SQLite database
+        self.diff_against = None  # Filename of previous metadata to write a delta against (or None)
+        self.struct_layouts = False  # Emit the size/alignment of structs and field offsets for each supported ABI
+        self.abi_signatures = False  # Emit the ABI signature of each function, and a table grouping functions by them
+
+
+# Writes the top-level metadata JSON object section-by-section, serialising each item as soon as it is produced
+# (rather than building the whole tree and then dumping it). In non-compact mode the result is identical to
+# json.dump(..., indent=4).
+class MetadataWriter:
+    def __init__(self, file, compact):
+        self.file = file
+        self.compact = compact
+        self.first_section = True
+        self.first_item = True
+        if compact:
+            self.section_separator = ","
+            self.item_separator = ","
+            self.key_separator = ":"
+            self.item_indent = ""
+            self.encoder = json.JSONEncoder(separators=(",", ":"))
+        else:
+            self.section_separator = ",\n    "
+            self.item_separator = ",\n        "
+            self.key_separator = ": "
+            self.item_indent = "\n        "
+            self.encoder = json.JSONEncoder(indent=4)
+
+    def begin(self):
+        self.file.write("{" if self.compact else "{\n    ")
+
+    def end(self):
+        self.file.write("}" if self.compact else "\n}")
+
+    def begin_section(self, name):
+        if not self.first_section:
+            self.file.write(self.section_separator)
+        self.first_section = False
+        self.first_item = True
+        self.file.write(json.dumps(name) + self.key_separator + "[")
+
+    def end_section(self):
+        if self.first_item or self.compact:
+            self.file.write("]")  # Empty lists don't get any whitespace
+        else:
+            self.file.write("\n    ]")
+
+    def write_item(self, item):
+        if self.first_item:
+            self.file.write(self.item_indent)
+        else:
+            self.file.write(self.item_separator)
+        self.first_item = False
+
+        text = self.encoder.encode(item)
+        if not self.compact:
+            # Nest the item inside the list (newlines can't occur inside JSON strings, so this is safe)
+            text = text.replace("\n", self.item_indent)
+        self.file.write(text)
+
 
-    # Emit defines
-    defines_root = []
-    metadata_root["defines"] = defines_root
+# Get the metadata emitted by emit (a function taking no arguments) for an element, reusing the previously emitted
+# version from render_cache if there is one
+def emit_with_cache(render_cache, element, kind, emit):
+    if render_cache is None:
+        return emit()
+    return render_cache.get_metadata(element, kind, emit)
 
+
+# Emit the defines to include in the metadata
+def emit_defines(dom_root, render_cache=None):
     for define in dom_root.list_all_children_of_type(code_dom.DOMDefine):
         if not define.exclude_from_metadata:
 
@@ -494,28 +717,26 @@ def generate(dom_root, file):
             if "(" in define.name:
                 continue
 
-            defines_root.append(emit_define(define))
+            yield emit_with_cache(render_cache, define, "define", lambda: emit_define(define))
 
-    # Emit enums
-    enums_root = []
-    metadata_root["enums"] = enums_root
 
+# Emit the enums to include in the metadata
+def emit_enums(dom_root, type_table=None, render_cache=None):
     for enum in dom_root.list_all_children_of_type(code_dom.DOMEnum):
         if not enum.exclude_from_metadata and not enum.is_forward_declaration:
-            enums_root.append(emit_enum(enum))
+            yield emit_with_cache(render_cache, enum, "enum", lambda: emit_enum(enum, type_table))
 
-    # Emit typedefs
-    typedefs_root = []
-    metadata_root["typedefs"] = typedefs_root
 
+# Emit the typedefs to include in the metadata
+def emit_typedefs(dom_root, type_table=None, render_cache=None):
     for typedef in dom_root.list_all_children_of_type(code_dom.DOMTypedef):
         if not typedef.exclude_from_metadata:
-            typedefs_root.append(emit_typedef(typedef))
+            yield emit_with_cache(render_cache, typedef, "typedef", lambda: emit_typedef(typedef, type_table))
 
-    # Emit struct declarations
-    structs_root = []
-    metadata_root["structs"] = structs_root
 
+# Emit the structs to include in the metadata
+# If layout_calculators is supplied, struct layouts are included for the ABIs they cover
+def emit_structs(dom_root, type_table=None, render_cache=None, layout_calculators=None):
     # Make a list of all structs we have full definitions for
     structs_with_definitions = {}
     for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
@@ -531,15 +752,120 @@ def generate(dom_root, file):
             continue
 
         if not struct.exclude_from_metadata:
-            structs_root.append(emit_struct(struct))
+            struct_data = emit_with_cache(render_cache, struct, "struct", lambda: emit_struct(struct, type_table))
+            if layout_calculators is not None:
+                struct_data = add_struct_layout(struct, struct_data, layout_calculators, type_table)
+            yield struct_data
+
+
+# Add the ABI signature of a function (calculated with layout_calculator), returning the new function data and recording
+# the function in signature_groups (a dictionary of lists of function names, indexed by signature)
+# As with struct layouts, this depends on other elements so it is done on a copy of the function data
+def add_abi_signature(function, function_data, layout_calculator, signature_groups, type_table=None):
+    signature = struct_layout.get_function_abi_signature(function, layout_calculator)
+    if signature is None:
+        return function_data
 
-    # Emit function declarations
-    functions_root = []
-    metadata_root["functions"] = functions_root
+    signature_groups.setdefault(signature, []).append(function.name)
 
+    result = dict(function_data)
+    result["abi_signature"] = signature
+    add_content_hash(result, type_table)
+    return result
+
+
+# Emit the functions to include in the metadata
+# If layout_calculator is supplied, ABI signatures are included, and the functions with each signature are recorded in
+# signature_groups
+def emit_functions(dom_root, type_table=None, render_cache=None, layout_calculator=None, signature_groups=None):
     for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
         if not function.exclude_from_metadata:
-            functions_root.append(emit_function(function))
+            function_data = emit_with_cache(render_cache, function, "function",
+                                            lambda: emit_function(function, type_table))
+            if layout_calculator is not None:
+                function_data = add_abi_signature(function, function_data, layout_calculator, signature_groups,
+                                                  type_table)
+            yield function_data
+
+
+# Emit the table of ABI signatures, with the functions that have each one
+def emit_signature_groups(signature_groups):
+    for signature, function_names in signature_groups.items():
+        yield {"signature": signature, "functions": function_names}
+
+
+# Emit all the top-level metadata sections, as (section name, item iterator) tuples
+# Items are generated lazily as each section is consumed, so each section must be consumed fully before moving on to
+# the next (in particular the type table, if one is supplied, is only complete once all other sections are done)
+# If render_cache is supplied, previously emitted items are reused for elements that have not changed
+# layout_calculators (a list of StructLayoutCalculators, one for each ABI) enables struct layouts, and
+# signature_layout_calculator enables ABI signatures
+def emit_sections(dom_root, type_table=None, render_cache=None, layout_calculators=None,
+                  signature_layout_calculator=None):
+    if type_table is not None:
+        render_cache = None  # Type IDs depend on everything emitted beforehand, so cached items can't be reused
+
+    yield "defines", emit_defines(dom_root, render_cache)
+    yield "enums", emit_enums(dom_root, type_table, render_cache)
+    yield "typedefs", emit_typedefs(dom_root, type_table, render_cache)
+    yield "structs", emit_structs(dom_root, type_table, render_cache, layout_calculators)
+    signature_groups = {}
+    yield "functions", emit_functions(dom_root, type_table, render_cache, signature_layout_calculator,
+                                      signature_groups)
+
+    # The signature table has to come after the functions, as it is filled in as they are emitted
+    if signature_layout_calculator is not None:
+        yield "signature_groups", emit_signature_groups(signature_groups)
+
+    # The type table goes last, as types get added to it as the other sections are written
+    if type_table is not None:
+        yield "types", type_table.get_entries()
+
+
+# Get the root of the DOM that dom_root is part of (layouts need to be calculated from the whole DOM, even if we are only
+# emitting metadata for one header)
+def get_layout_root(dom_root):
+    layout_root = dom_root
+    while layout_root.parent is not None:
+        layout_root = layout_root.parent
+    return layout_root
+
+
+# Get the layout calculators to pass to emit_sections() for struct layouts, or None if options doesn't ask for them
+def get_struct_layout_calculators(dom_root, options):
+    if (options is None) or not options.struct_layouts:
+        return None
+    return [struct_layout.StructLayoutCalculator(get_layout_root(dom_root), abi) for abi in struct_layout.all_abis]
+
+
+# Get the layout calculator to pass to emit_sections() for ABI signatures, or None if options doesn't ask for them
+def get_signature_layout_calculator(dom_root, options):
+    if (options is None) or not options.abi_signatures:
+        return None
+    # ABI classes are the same for all the ABIs we support, so it doesn't matter which one is used here
+    return struct_layout.StructLayoutCalculator(get_layout_root(dom_root))
+
+
+# Write metadata about our file to a JSON file
+def generate(dom_root, file, options=None, render_cache=None):
+    if options is None:
+        options = MetadataOptions()
+
+    writer = MetadataWriter(file, options.compact)
+
+    type_table = MetadataTypeTable() if options.type_table else None
+
+    layout_calculators = get_struct_layout_calculators(dom_root, options)
+
+    signature_layout_calculator = get_signature_layout_calculator(dom_root, options)
+
+    writer.begin()
+
+    for section_name, items in emit_sections(dom_root, type_table, render_cache, layout_calculators,
+                                             signature_layout_calculator):
+        writer.begin_section(section_name)
+        for item in items:
+            writer.write_item(item)
+        writer.end_section()
 
-    # Write JSON to file
-    json.dump(metadata_root, file, indent=4)
+    writer.end()
@@ -0,0 +1,78 @@
+from src import metadata_reader
+from src.generators import gen_metadata
+import json
+
+# Sections that get compared (the type table is not compared directly, as types are compared as part of the elements
+# that use them)
+diff_section_names = ["defines", "enums", "typedefs", "structs", "functions"]
+
+
+# Get a dictionary mapping element names to content hashes for a section of metadata
+# records should be an iterable of element records, and resolve_type a function to get the type data for a type ID
+# (for metadata that uses a type table)
+def get_section_hashes(records, resolve_type):
+    hashes_by_name = {}
+    for record in records:
+        # Always recalculate the hash (rather than using the one in the file, if any), so that metadata generated by
+        # older versions can be compared correctly
+        hashes_by_name.setdefault(record.get("name"), []).append(gen_metadata.get_content_hash(record, resolve_type))
+
+    # There can be multiple elements with the same name (e.g. in mutually exclusive #ifdef blocks), so combine them
+    return {name: ",".join(sorted(hashes)) for name, hashes in hashes_by_name.items()}
+
+
+# Get content hashes for each section in metadata previously loaded from JSON
+def get_metadata_root_hashes(metadata_root):
+    types = metadata_root.get("types", [])
+
+    def resolve_type(type_id):
+        return get_type_without_id(types[type_id])
+
+    return {section_name: get_section_hashes(metadata_root.get(section_name, []), resolve_type)
+            for section_name in diff_section_names}
+
+
+# Get content hashes for each section in a metadata file
+def get_metadata_file_hashes(filename):
+    with metadata_reader.load_metadata(filename) as metadata:
+        source = metadata.source
+
+        def resolve_type(type_id):
+            return get_type_without_id(source.get_record("types", type_id))
+
+        return {section_name: get_section_hashes((source.get_record(section_name, index)
+                                                  for index in range(0, source.get_record_count(section_name))),
+                                                 resolve_type)
+                for section_name in diff_section_names}
+
+
+# Type table entries include their ID, which we need to remove to get the same data as the inline version of the type
+def get_type_without_id(type_root):
+    return {key: value for key, value in type_root.items() if key != "id"}
+
+
+# Write a JSON file describing the differences between the metadata in new_metadata_root (as generated by
+# gen_metadata and then parsed) and a previously-generated metadata file
+def generate(new_metadata_root, old_metadata_filename, file):
+    old_hashes = get_metadata_file_hashes(old_metadata_filename)
+    new_hashes = get_metadata_root_hashes(new_metadata_root)
+
+    result = {"old_metadata": old_metadata_filename}
+
+    for section_name in diff_section_names:
+        old_section = old_hashes[section_name]
+        new_section = new_hashes[section_name]
+
+        added = [name for name in new_section.keys() if name not in old_section]
+        removed = [name for name in old_section.keys() if name not in new_section]
+        changed = [name for name, content_hash in new_section.items()
+                   if (name in old_section) and (old_section[name] != content_hash)]
+
+        result[section_name] = {
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged_count": len(new_section) - len(added) - len(changed)
+        }
+
+    json.dump(result, file, indent=4)
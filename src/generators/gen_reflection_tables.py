@@ -0,0 +1,417 @@
+from src import code_dom
+from src import utils
+from src import conditional_generator
+from src.code_dom.common import write_c_line
+from src.modifiers import mod_add_reflection_tables
+
+# Constants for the 32-bit FNV-1a hash used for lookups (this must match the C++ version written by generate())
+FNV_OFFSET_BASIS = 2166136261
+FNV_PRIME = 16777619
+
+
+# Hash a key (a list of strings, which are separated by a zero byte) with a given seed
+def get_hash(key, seed):
+    result = FNV_OFFSET_BASIS ^ seed
+    for part_index, part in enumerate(key):
+        if part_index > 0:
+            result = (result * FNV_PRIME) & 0xFFFFFFFF
+        for byte in part.encode("utf-8"):
+            result = ((result ^ byte) * FNV_PRIME) & 0xFFFFFFFF
+    return result
+
+
+# Build a minimal perfect hash for a list of distinct keys, using the "hash and displace" approach - keys are first
+# split into buckets using a hash with seed 0, and then for each bucket (largest first) we search for a seed that
+# sends all the keys in it to unused slots. Buckets with only one key get a free slot directly, which is indicated by
+# a negative seed.
+# Returns (seeds, slots), where seeds are indexed by bucket, and slots[i] is the index of the key that ends up in
+# slot i.
+def build_perfect_hash(keys):
+    count = len(keys)
+    buckets = [[] for _ in range(count)]
+    for key_index, key in enumerate(keys):
+        buckets[get_hash(key, 0) % count].append(key_index)
+
+    seeds = [0] * count
+    slots = [None] * count
+
+    bucket_order = sorted(range(count), key=lambda bucket_index: -len(buckets[bucket_index]))
+    for bucket_index in bucket_order:
+        bucket = buckets[bucket_index]
+        if len(bucket) == 0:
+            break
+        if len(bucket) == 1:
+            # Single keys can go in any free slot
+            free_slot = slots.index(None)
+            seeds[bucket_index] = -free_slot - 1
+            slots[free_slot] = bucket[0]
+            continue
+
+        seed = 1
+        while True:
+            candidate_slots = [get_hash(keys[key_index], seed) % count for key_index in bucket]
+            if (len(set(candidate_slots)) == len(candidate_slots)) and \
+                    all(slots[slot] is None for slot in candidate_slots):
+                break
+            seed += 1
+
+        seeds[bucket_index] = seed
+        for key_index, slot in zip(bucket, candidate_slots):
+            slots[slot] = key_index
+
+    return seeds, slots
+
+
+# Get a C string literal for a name
+def get_string_literal(text):
+    return "\"" + text.replace("\\", "\\\\").replace("\"", "\\\"") + "\""
+
+
+# Get the type of a function or function pointer as a string with no names in it (e.g. "bool(const char*, bool*)"),
+# which is used to group functions by signature
+def get_signature(return_type, arguments, context):
+    argument_types = []
+    for argument in arguments:
+        if argument.is_implicit_default:
+            continue
+        if argument.is_varargs:
+            argument_types.append("...")
+        elif isinstance(argument.arg_type, code_dom.DOMFunctionPointerType):
+            argument_types.append(get_function_pointer_signature(argument.arg_type, context))
+        else:
+            argument_types.append(argument.arg_type.to_c_string(context) + ("*" if argument.is_array else ""))
+    if len(argument_types) == 0:
+        argument_types = ["void"]
+    return return_type.to_c_string(context) + "(" + ", ".join(argument_types) + ")"
+
+
+# Get the type of a function pointer as a string with no names in it (e.g. "void(*)(void*)")
+def get_function_pointer_signature(function_pointer_type, context):
+    signature = get_signature(function_pointer_type.return_type, function_pointer_type.arguments, context)
+    return_type_length = len(function_pointer_type.return_type.to_c_string(context))
+    return signature[:return_type_length] + "(*)" + signature[return_type_length:]
+
+
+# Get the structs that are described by the reflection tables, in declaration order
+def get_reflection_structs(dom_root):
+    result = []
+    for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
+        if struct.is_forward_declaration or struct.is_anonymous or (struct.name is None):
+            continue  # Opaque types and anonymous nested structs/unions
+        if utils.find_nearest_parent_of_type(struct, code_dom.DOMTemplate) is not None:
+            continue
+        result.append(struct)
+    return result
+
+
+# Get the fields of a struct as a list of (field declaration, name) tuples, including those in anonymous nested
+# structs/unions (which are accessed as if they were members of the parent)
+def get_struct_fields(struct):
+    result = []
+    for child in struct.list_directly_contained_children():
+        if isinstance(child, code_dom.DOMFieldDeclaration):
+            if child.is_static or child.is_anonymous:
+                continue
+            for name_index, name in enumerate(child.names):
+                if child.width_specifiers[name_index] is not None:
+                    continue  # Bitfields don't have an offset
+                result.append((child, name))
+        elif isinstance(child, code_dom.DOMClassStructUnion) and child.is_anonymous:
+            result += get_struct_fields(child)
+    return result
+
+
+# Writes table entries, wrapping any that are subject to conditionals beyond the base ones in those conditionals, with
+# a placeholder entry used when they are disabled (so that the entry indices are the same in every configuration)
+class TableEntryWriter:
+    def __init__(self, file, indent, base_element):
+        self.file = file
+        self.indent = indent
+        self.base_conditionals = conditional_generator.ConditionalGenerator.get_wanted_conditionals(base_element)
+
+    def write_entry(self, element, entry_text, placeholder_text):
+        wanted_conditionals = conditional_generator.ConditionalGenerator.get_wanted_conditionals(element)
+        extra_conditionals = [conditional for conditional in wanted_conditionals
+                              if not any(conditional.condition_matches(base_conditional)
+                                         for base_conditional in self.base_conditionals)]
+
+        for conditional in extra_conditionals:
+            write_c_line(self.file, 0, conditional.get_opening_clause())
+        write_c_line(self.file, self.indent, entry_text + ",")
+        for conditional in reversed(extra_conditionals):
+            write_c_line(self.file, 0, "#else")
+            write_c_line(self.file, self.indent, placeholder_text + ",")
+            write_c_line(self.file, 0, "#endif // " + conditional.get_opening_clause())
+
+
+# Write a perfect hash lookup table (the seeds and slot-to-entry-index mapping) for the keys of a table
+# The same key can appear more than once if the entries are in mutually exclusive conditionals (e.g. either side of an
+# #ifdef/#else), in which case the slot refers to the first entry, and a table of the next entry with the same key is
+# also written so that the lookup can find whichever one is enabled.
+# Returns the number of distinct keys, and whether the table of next entries was written.
+def write_hash_table(file, indent, table_name, keys):
+    unique_keys = []
+    first_indices = {}  # Index of the first entry with each key, indexed by key
+    next_indices = [-1] * len(keys)
+    last_indices = {}
+    for index, key in enumerate(keys):
+        key = tuple(key)
+        if key in first_indices:
+            next_indices[last_indices[key]] = index
+        else:
+            first_indices[key] = index
+            unique_keys.append(key)
+        last_indices[key] = index
+
+    seeds, slots = build_perfect_hash(unique_keys)
+    write_int_array(file, indent, table_name + "_seeds", seeds)
+    write_int_array(file, indent, table_name + "_slots", [first_indices[unique_keys[slot]] for slot in slots])
+
+    if len(unique_keys) == len(keys):
+        return len(unique_keys), False
+
+    write_int_array(file, indent, table_name + "_next", next_indices)
+    return len(unique_keys), True
+
+
+# Write a static array of integers
+def write_int_array(file, indent, name, values):
+    write_c_line(file, indent, "static const int " + name + "[" + str(len(values)) + "] =")
+    write_c_line(file, indent, "{")
+    for start in range(0, len(values), 16):
+        write_c_line(file, indent + 1, ", ".join(str(value) for value in values[start:start + 16]) + ",")
+    write_c_line(file, indent, "};")
+
+
+# Write code to find the index of an entry from its key (a list of C expressions for the key parts) using a table
+# written by write_hash_table()
+def write_hash_lookup(file, indent, table_name, key_count, hash_function_name, key_expressions, has_next_table):
+    arguments = key_expressions + ["NULL"] * (2 - len(key_expressions))
+    write_c_line(file, indent, "const int seed = " + table_name + "_seeds[" + hash_function_name + "(" +
+                 ", ".join(arguments) + ", 0) % " + str(key_count) + "];")
+    write_c_line(file, indent, "const int slot = (seed < 0) ? (-seed - 1) : (int)(" + hash_function_name + "(" +
+                 ", ".join(arguments) + ", (ImU32)seed) % " + str(key_count) + ");")
+    if has_next_table:
+        write_c_line(file, indent, "int index = " + table_name + "_slots[slot];")
+        write_c_line(file, indent, "while ((" + table_name + "[index].name == NULL) && (" + table_name +
+                     "_next[index] >= 0))")
+        write_c_line(file, indent + 1, "index = " + table_name + "_next[index];")
+    else:
+        write_c_line(file, indent, "const int index = " + table_name + "_slots[slot];")
+
+
+# Generate the reflection tables and lookup functions declared by mod_add_reflection_tables
+def generate(dom_root, file, dest_file_name, indent=0, is_backend=False):
+    names = mod_add_reflection_tables.get_reflection_names(dest_file_name)
+    type_prefix, function_prefix = utils.get_output_file_name_prefixes(dest_file_name)
+
+    get_tables_function = None
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.is_manual_helper and (function.name == names["get_tables"]):
+            get_tables_function = function
+            break
+
+    if get_tables_function is None:
+        return  # No reflection tables in this file
+
+    api_macro = "CIMGUI_IMPL_API " if is_backend else "CIMGUI_API "
+    hash_function_name = function_prefix + "_reflection_hash"
+    functions_table_name = function_prefix + "_reflection_functions"
+    enums_table_name = function_prefix + "_reflection_enums"
+    enum_values_table_name = function_prefix + "_reflection_enum_values"
+    structs_table_name = function_prefix + "_reflection_structs"
+
+    context = code_dom.WriteContext()
+    context.for_c = True
+    context.for_implementation = True
+
+    functions = mod_add_reflection_tables.get_reflection_functions(dom_root, names)
+    enums = [enum for enum in dom_root.list_all_children_of_type(code_dom.DOMEnum) if enum.name is not None]
+    structs = get_reflection_structs(dom_root)
+
+    generator = conditional_generator.ConditionalGenerator()
+    generator.write_conditionals(get_tables_function, file, indent)
+
+    write_c_line(file, indent, "// Reflection tables")
+    file.write("\n")
+
+    # Hash function (see get_hash())
+    write_c_line(file, indent, "static ImU32 " + hash_function_name + "(const char* key, const char* key2, "
+                                                                      "ImU32 seed)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "ImU32 hash = " + str(FNV_OFFSET_BASIS) + "u ^ seed;")
+    write_c_line(file, indent + 1, "for (const char* c = key; *c; c++)")
+    write_c_line(file, indent + 2, "hash = (hash ^ (ImU8)*c) * " + str(FNV_PRIME) + "u;")
+    write_c_line(file, indent + 1, "if (key2 != NULL)")
+    write_c_line(file, indent + 1, "{")
+    write_c_line(file, indent + 2, "hash *= " + str(FNV_PRIME) + "u;")
+    write_c_line(file, indent + 2, "for (const char* c = key2; *c; c++)")
+    write_c_line(file, indent + 3, "hash = (hash ^ (ImU8)*c) * " + str(FNV_PRIME) + "u;")
+    write_c_line(file, indent + 1, "}")
+    write_c_line(file, indent + 1, "return hash;")
+    write_c_line(file, indent, "}")
+
+    hash_tables = {}  # (key count, has next table) for each hashed table, indexed by table name
+
+    # Functions
+
+    signature_ids = {}
+    if len(functions) > 0:
+        file.write("\n")
+        write_c_line(file, indent, "static const cimgui::" + names["function_info"] + " " + functions_table_name +
+                     "[" + str(len(functions)) + "] =")
+        write_c_line(file, indent, "{")
+        entry_writer = TableEntryWriter(file, indent + 1, get_tables_function)
+        for function in functions:
+            signature = get_signature(function.return_type, function.arguments, context)
+            signature_id = signature_ids.setdefault(signature, len(signature_ids))
+            entry_writer.write_entry(function,
+                                     "{ " + get_string_literal(function.name) + ", " +
+                                     "reinterpret_cast<void (*)(void)>(&cimgui::" + function.name + "), " +
+                                     str(signature_id) + ", " + get_string_literal(signature) + " }",
+                                     "{ NULL, NULL, -1, NULL }")
+        write_c_line(file, indent, "};")
+        hash_tables[functions_table_name] = write_hash_table(file, indent, functions_table_name,
+                                                             [[function.name] for function in functions])
+
+    # Enums
+
+    enum_values = []  # List of (enum, enum element) tuples
+    enum_value_starts = []
+    for enum in enums:
+        enum_value_starts.append(len(enum_values))
+        for element in enum.list_directly_contained_children_of_type(code_dom.DOMEnumElement):
+            enum_values.append((enum, element))
+
+    if len(enum_values) > 0:
+        file.write("\n")
+        write_c_line(file, indent, "static const cimgui::" + names["enum_value_info"] + " " + enum_values_table_name +
+                     "[" + str(len(enum_values)) + "] =")
+        write_c_line(file, indent, "{")
+        entry_writer = TableEntryWriter(file, indent + 1, get_tables_function)
+        for enum, element in enum_values:
+            entry_writer.write_entry(element,
+                                     "{ " + get_string_literal(element.name) + ", (long long)cimgui::" +
+                                     element.name + " }",
+                                     "{ NULL, 0 }")
+        write_c_line(file, indent, "};")
+        hash_tables[enum_values_table_name] = write_hash_table(file, indent, enum_values_table_name,
+                                                               [[enum.name, element.name]
+                                                                for enum, element in enum_values])
+
+        # The index of the enum each value belongs to
+        enum_indices = {enum: enum_index for enum_index, enum in enumerate(enums)}
+        write_c_line(file, indent, "static const int " + enum_values_table_name + "_enums[" + str(len(enum_values)) +
+                     "] =")
+        write_c_line(file, indent, "{")
+        for start in range(0, len(enum_values), 16):
+            write_c_line(file, indent + 1, ", ".join(str(enum_indices[enum])
+                                                     for enum, element in enum_values[start:start + 16]) + ",")
+        write_c_line(file, indent, "};")
+
+    if len(enums) > 0:
+        file.write("\n")
+        write_c_line(file, indent, "static const cimgui::" + names["enum_info"] + " " + enums_table_name +
+                     "[" + str(len(enums)) + "] =")
+        write_c_line(file, indent, "{")
+        entry_writer = TableEntryWriter(file, indent + 1, get_tables_function)
+        for enum, value_start in zip(enums, enum_value_starts):
+            value_count = len(enum.list_directly_contained_children_of_type(code_dom.DOMEnumElement))
+            values_expression = ("&" + enum_values_table_name + "[" + str(value_start) + "]") if value_count > 0 \
+                else "NULL"
+            entry_writer.write_entry(enum,
+                                     "{ " + get_string_literal(enum.name) + ", " + values_expression + ", " +
+                                     str(value_count) + " }",
+                                     "{ NULL, NULL, 0 }")
+        write_c_line(file, indent, "};")
+
+    # Structs
+
+    for struct_index, struct in enumerate(structs):
+        fields = get_struct_fields(struct)
+        if len(fields) == 0:
+            continue
+        file.write("\n")
+        write_c_line(file, indent, "static const cimgui::" + names["field_info"] + " " + structs_table_name + "_" +
+                     str(struct_index) + "_fields[" + str(len(fields)) + "] = // " + struct.name)
+        write_c_line(file, indent, "{")
+        entry_writer = TableEntryWriter(file, indent + 1, get_tables_function)
+        for field, field_name in fields:
+            entry_writer.write_entry(field,
+                                     "{ " + get_string_literal(field_name) + ", offsetof(cimgui::" + struct.name +
+                                     ", " + field_name + "), sizeof(cimgui::" + struct.name + "::" + field_name + ") }",
+                                     "{ NULL, 0, 0 }")
+        write_c_line(file, indent, "};")
+
+    if len(structs) > 0:
+        file.write("\n")
+        write_c_line(file, indent, "static const cimgui::" + names["struct_info"] + " " + structs_table_name +
+                     "[" + str(len(structs)) + "] =")
+        write_c_line(file, indent, "{")
+        entry_writer = TableEntryWriter(file, indent + 1, get_tables_function)
+        for struct_index, struct in enumerate(structs):
+            field_count = len(get_struct_fields(struct))
+            fields_expression = (structs_table_name + "_" + str(struct_index) + "_fields") if field_count > 0 \
+                else "NULL"
+            entry_writer.write_entry(struct,
+                                     "{ " + get_string_literal(struct.name) + ", sizeof(cimgui::" + struct.name +
+                                     "), alignof(cimgui::" + struct.name + "), " + fields_expression + ", " +
+                                     str(field_count) + " }",
+                                     "{ NULL, 0, 0, NULL, 0 }")
+        write_c_line(file, indent, "};")
+        hash_tables[structs_table_name] = write_hash_table(file, indent, structs_table_name,
+                                                           [[struct.name] for struct in structs])
+
+    # Lookup functions
+
+    file.write("\n")
+    write_c_line(file, indent, "static const cimgui::" + names["tables"] + " " + function_prefix +
+                 "_reflection_tables =")
+    write_c_line(file, indent, "{")
+    for table_name, count in [(functions_table_name, len(functions)),
+                              (enums_table_name, len(enums)),
+                              (structs_table_name, len(structs))]:
+        write_c_line(file, indent + 1, (table_name if count > 0 else "NULL") + ", " + str(count) + ",")
+    write_c_line(file, indent, "};")
+
+    file.write("\n")
+    write_c_line(file, indent, api_macro + "const cimgui::" + names["tables"] + "* cimgui::" +
+                 names["get_tables"] + "(void)")
+    write_c_line(file, indent, "{")
+    write_c_line(file, indent + 1, "return &" + function_prefix + "_reflection_tables;")
+    write_c_line(file, indent, "}")
+
+    for function_name, info_name, table_name, count, key_arguments in [
+            (names["find_function"], names["function_info"], functions_table_name, len(functions), ["name"]),
+            (names["find_enum_value"], names["enum_value_info"], enum_values_table_name, len(enum_values),
+             ["enum_name", "value_name"]),
+            (names["find_struct"], names["struct_info"], structs_table_name, len(structs), ["name"])]:
+        file.write("\n")
+        write_c_line(file, indent, api_macro + "const cimgui::" + info_name + "* cimgui::" + function_name + "(" +
+                     ", ".join("const char* " + argument for argument in key_arguments) + ")")
+        write_c_line(file, indent, "{")
+        if count == 0:
+            for argument in key_arguments:
+                write_c_line(file, indent + 1, "IM_UNUSED(" + argument + ");")
+            write_c_line(file, indent + 1, "return NULL;")
+        else:
+            key_count, has_next_table = hash_tables[table_name]
+            write_hash_lookup(file, indent + 1, table_name, key_count, hash_function_name, key_arguments,
+                              has_next_table)
+            write_c_line(file, indent + 1, "const cimgui::" + info_name + "* entry = &" + table_name + "[index];")
+            if len(key_arguments) == 1:
+                write_c_line(file, indent + 1, "if ((entry->name == NULL) || (strcmp(entry->name, name) != 0))")
+                write_c_line(file, indent + 2, "return NULL;")
+            else:
+                # Enum values are stored without the name of their enum, so that needs checking separately
+                write_c_line(file, indent + 1, "if ((entry->name == NULL) || (strcmp(entry->name, value_name) != 0))")
+                write_c_line(file, indent + 2, "return NULL;")
+                write_c_line(file, indent + 1, "const char* entry_enum_name = " + enums_table_name + "[" +
+                             enum_values_table_name + "_enums[index]].name;")
+                write_c_line(file, indent + 1, "if ((entry_enum_name == NULL) || "
+                                               "(strcmp(entry_enum_name, enum_name) != 0))")
+                write_c_line(file, indent + 2, "return NULL;")
+            write_c_line(file, indent + 1, "return entry;")
+        write_c_line(file, indent, "}")
+
+    generator.finish_writing(file, indent)
@@ -0,0 +1,442 @@
+from src import struct_layout
+from src.generators import gen_metadata
+import json
+import os
+import sqlite3
+import tempfile
+
+# Schema for the SQLite metadata database
+# Every element table has an integer id primary key (in emission order), and child tables (arguments, fields, enum
+# elements) reference their owner by ID and record their position within it. Types are stored once in the types table
+# and referenced by ID, with the C declaration of each use also stored inline for convenient querying.
+# Preprocessor conditionals are stored in a single table, referencing the element they apply to by kind (the name of
+# the element table) and ID.
+# Values that the JSON gives for each ABI (struct layouts) get a column per ABI, with the ABI name as a suffix.
+schema = """
+CREATE TABLE types (
+    id INTEGER PRIMARY KEY,
+    declaration TEXT NOT NULL,
+    description TEXT,
+    type_details TEXT
+);
+CREATE TABLE defines (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    content TEXT,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE enums (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    original_fully_qualified_name TEXT,
+    storage_type_id INTEGER REFERENCES types(id),
+    storage_type TEXT,
+    is_flags_enum INTEGER NOT NULL,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE enum_elements (
+    id INTEGER PRIMARY KEY,
+    enum_id INTEGER NOT NULL REFERENCES enums(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value_expression TEXT,
+    value INTEGER,
+    is_count INTEGER NOT NULL,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE typedefs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    type_id INTEGER NOT NULL REFERENCES types(id),
+    type TEXT NOT NULL,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE structs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    original_fully_qualified_name TEXT,
+    kind TEXT NOT NULL,
+    by_value INTEGER NOT NULL,
+    forward_declaration INTEGER NOT NULL,
+    is_anonymous INTEGER NOT NULL,
+    size_lp64 INTEGER,
+    alignment_lp64 INTEGER,
+    size_llp64 INTEGER,
+    alignment_llp64 INTEGER,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE fields (
+    id INTEGER PRIMARY KEY,
+    struct_id INTEGER NOT NULL REFERENCES structs(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type_id INTEGER NOT NULL REFERENCES types(id),
+    type TEXT NOT NULL,
+    is_array INTEGER NOT NULL,
+    array_bounds TEXT,
+    width INTEGER,
+    is_anonymous INTEGER NOT NULL,
+    default_value TEXT,
+    offset_lp64 INTEGER,
+    bit_offset_lp64 INTEGER,
+    offset_llp64 INTEGER,
+    bit_offset_llp64 INTEGER,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE functions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    original_fully_qualified_name TEXT,
+    return_type_id INTEGER REFERENCES types(id),
+    return_type TEXT,
+    original_class TEXT,
+    is_default_argument_helper INTEGER NOT NULL,
+    is_manual_helper INTEGER NOT NULL,
+    is_imstr_helper INTEGER NOT NULL,
+    has_imstr_helper INTEGER NOT NULL,
+    is_unformatted_helper INTEGER NOT NULL,
+    is_static INTEGER NOT NULL,
+    direct_alias_symbol TEXT,
+    command_opcode INTEGER,
+    batch_source_function TEXT,
+    sized_string_source_function TEXT,
+    abi_signature TEXT,
+    is_internal INTEGER NOT NULL,
+    preceding_comments TEXT,
+    attached_comment TEXT,
+    source_filename TEXT,
+    source_line INTEGER
+);
+CREATE TABLE arguments (
+    id INTEGER PRIMARY KEY,
+    function_id INTEGER NOT NULL REFERENCES functions(id),
+    position INTEGER NOT NULL,
+    name TEXT,
+    type_id INTEGER REFERENCES types(id),
+    type TEXT,
+    is_array INTEGER NOT NULL,
+    array_bounds TEXT,
+    is_varargs INTEGER NOT NULL,
+    is_instance_pointer INTEGER NOT NULL,
+    length_of_argument TEXT,
+    was_by_value_struct INTEGER NOT NULL,
+    default_value TEXT
+);
+CREATE TABLE signature_groups (
+    id INTEGER PRIMARY KEY,
+    signature TEXT NOT NULL,
+    function_count INTEGER NOT NULL
+);
+CREATE TABLE conditionals (
+    id INTEGER PRIMARY KEY,
+    element_kind TEXT NOT NULL,
+    element_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    condition TEXT NOT NULL,
+    expression TEXT NOT NULL
+);
+
+CREATE INDEX types_declaration ON types(declaration);
+CREATE INDEX defines_name ON defines(name);
+CREATE INDEX enums_name ON enums(name);
+CREATE INDEX enums_original_name ON enums(original_fully_qualified_name);
+CREATE INDEX enum_elements_enum ON enum_elements(enum_id);
+CREATE INDEX enum_elements_name ON enum_elements(name);
+CREATE INDEX typedefs_name ON typedefs(name);
+CREATE INDEX typedefs_type ON typedefs(type_id);
+CREATE INDEX structs_name ON structs(name);
+CREATE INDEX structs_original_name ON structs(original_fully_qualified_name);
+CREATE INDEX fields_struct ON fields(struct_id);
+CREATE INDEX fields_name ON fields(name);
+CREATE INDEX fields_type ON fields(type_id);
+CREATE INDEX functions_name ON functions(name);
+CREATE INDEX functions_content_hash ON functions(content_hash);
+CREATE INDEX functions_original_name ON functions(original_fully_qualified_name);
+CREATE INDEX functions_original_class ON functions(original_class);
+CREATE INDEX functions_return_type ON functions(return_type_id);
+CREATE INDEX functions_abi_signature ON functions(abi_signature);
+CREATE INDEX signature_groups_signature ON signature_groups(signature);
+CREATE INDEX arguments_function ON arguments(function_id);
+CREATE INDEX arguments_type ON arguments(type_id);
+CREATE INDEX arguments_type_declaration ON arguments(type);
+CREATE INDEX conditionals_element ON conditionals(element_kind, element_id);
+CREATE INDEX conditionals_expression ON conditionals(expression);
+"""
+
+
+# Metadata database builder, which takes the records generated by gen_metadata (with a type table) and inserts them
+# into the relevant tables
+class SQLiteMetadataWriter:
+    def __init__(self, connection):
+        self.connection = connection
+        self.next_ids = {}  # Next ID to use for each table
+
+    # Get the next ID for a row in a table
+    def get_next_id(self, table):
+        row_id = self.next_ids.get(table, 0)
+        self.next_ids[table] = row_id + 1
+        return row_id
+
+    # Insert a row into a table (values should be a dictionary of column values), returning its ID
+    def insert(self, table, values):
+        row_id = self.get_next_id(table)
+        columns = ["id"] + list(values.keys())
+        self.connection.execute("INSERT INTO " + table + " (" + ", ".join(columns) + ") VALUES (" +
+                                ", ".join(["?"] * len(columns)) + ")", [row_id] + list(values.values()))
+        return row_id
+
+    # Get the declaration of a type by ID (so it can be stored alongside the type ID for convenience)
+    def get_type_declaration(self, type_id, type_table):
+        if type_id is None:
+            return None
+        return type_table.types[type_id]["declaration"]
+
+    # Get the common column values for an element (comments, internal flag and source location)
+    def get_common_values(self, record):
+        comments = record.get("comments", {})
+        source_location = record.get("source_location", {})
+        preceding_comments = comments.get("preceding")
+        return {
+            "is_internal": record["is_internal"],
+            "preceding_comments": "\n".join(preceding_comments) if preceding_comments is not None else None,
+            "attached_comment": comments.get("attached"),
+            "source_filename": source_location.get("filename"),
+            "source_line": source_location.get("line")
+        }
+
+    # Insert the preprocessor conditionals for an element
+    def insert_conditionals(self, element_kind, element_id, record):
+        for position, conditional in enumerate(record.get("conditionals", [])):
+            self.insert("conditionals", {
+                "element_kind": element_kind,
+                "element_id": element_id,
+                "position": position,
+                "condition": conditional["condition"],
+                "expression": conditional["expression"]
+            })
+
+    def insert_define(self, record, type_table):
+        values = {
+            "name": record["name"],
+            "content_hash": record["content_hash"],
+            "content": record.get("content")
+        }
+        values.update(self.get_common_values(record))
+        self.insert_conditionals("defines", self.insert("defines", values), record)
+
+    def insert_enum(self, record, type_table):
+        storage_type_id = record.get("storage_type")
+        values = {
+            "name": record["name"],
+            "content_hash": record["content_hash"],
+            "original_fully_qualified_name": record.get("original_fully_qualified_name"),
+            "storage_type_id": storage_type_id,
+            "storage_type": self.get_type_declaration(storage_type_id, type_table),
+            "is_flags_enum": record["is_flags_enum"]
+        }
+        values.update(self.get_common_values(record))
+        enum_id = self.insert("enums", values)
+        self.insert_conditionals("enums", enum_id, record)
+
+        for position, element in enumerate(record["elements"]):
+            values = {
+                "enum_id": enum_id,
+                "position": position,
+                "name": element["name"],
+                "value_expression": element.get("value_expression"),
+                "value": element.get("value"),
+                "is_count": element["is_count"]
+            }
+            values.update(self.get_common_values(element))
+            self.insert_conditionals("enum_elements", self.insert("enum_elements", values), element)
+
+    def insert_typedef(self, record, type_table):
+        values = {
+            "name": record["name"],
+            "content_hash": record["content_hash"],
+            "type_id": record["type"],
+            "type": self.get_type_declaration(record["type"], type_table)
+        }
+        values.update(self.get_common_values(record))
+        self.insert_conditionals("typedefs", self.insert("typedefs", values), record)
+
+    def insert_struct(self, record, type_table):
+        values = {
+            "name": record["name"],
+            "content_hash": record["content_hash"],
+            "original_fully_qualified_name": record.get("original_fully_qualified_name"),
+            "kind": record["kind"],
+            "by_value": record["by_value"],
+            "forward_declaration": record["forward_declaration"],
+            "is_anonymous": record["is_anonymous"]
+        }
+        for abi in struct_layout.all_abis:
+            abi_layout = record.get("layout", {}).get(abi.name, {})
+            values["size_" + abi.name.lower()] = abi_layout.get("size")
+            values["alignment_" + abi.name.lower()] = abi_layout.get("alignment")
+        values.update(self.get_common_values(record))
+        struct_id = self.insert("structs", values)
+        self.insert_conditionals("structs", struct_id, record)
+
+        for position, field in enumerate(record["fields"]):
+            values = {
+                "struct_id": struct_id,
+                "position": position,
+                "name": field["name"],
+                "type_id": field["type"],
+                "type": self.get_type_declaration(field["type"], type_table),
+                "is_array": field["is_array"],
+                "array_bounds": field.get("array_bounds"),
+                "width": field.get("width"),
+                "is_anonymous": field["is_anonymous"],
+                "default_value": field.get("default_value")
+            }
+            for abi in struct_layout.all_abis:
+                values["offset_" + abi.name.lower()] = field.get("offset", {}).get(abi.name)
+                values["bit_offset_" + abi.name.lower()] = field.get("bit_offset", {}).get(abi.name)
+            values.update(self.get_common_values(field))
+            self.insert_conditionals("fields", self.insert("fields", values), field)
+
+    def insert_function(self, record, type_table):
+        return_type_id = record.get("return_type")
+        values = {
+            "name": record["name"],
+            "content_hash": record["content_hash"],
+            "original_fully_qualified_name": record.get("original_fully_qualified_name"),
+            "return_type_id": return_type_id,
+            "return_type": self.get_type_declaration(return_type_id, type_table),
+            "original_class": record.get("original_class"),
+            "is_default_argument_helper": record["is_default_argument_helper"],
+            "is_manual_helper": record["is_manual_helper"],
+            "is_imstr_helper": record["is_imstr_helper"],
+            "has_imstr_helper": record["has_imstr_helper"],
+            "is_unformatted_helper": record["is_unformatted_helper"],
+            "is_static": record["is_static"],
+            "direct_alias_symbol": record.get("direct_alias_symbol"),
+            "command_opcode": record.get("command_opcode"),
+            "batch_source_function": record.get("batch_source_function"),
+            "sized_string_source_function": record.get("sized_string_source_function"),
+            "abi_signature": record.get("abi_signature")
+        }
+        values.update(self.get_common_values(record))
+        function_id = self.insert("functions", values)
+        self.insert_conditionals("functions", function_id, record)
+
+        for position, argument in enumerate(record["arguments"]):
+            type_id = argument.get("type")
+            self.insert("arguments", {
+                "function_id": function_id,
+                "position": position,
+                "name": argument.get("name"),
+                "type_id": type_id,
+                "type": self.get_type_declaration(type_id, type_table),
+                "is_array": argument["is_array"],
+                "array_bounds": argument.get("array_bounds"),
+                "is_varargs": argument["is_varargs"],
+                "is_instance_pointer": argument["is_instance_pointer"],
+                "length_of_argument": argument.get("length_of_argument"),
+                "was_by_value_struct": argument.get("was_by_value_struct", False),
+                "default_value": argument.get("default_value")
+            })
+
+    # (the functions in each group can be found with the abi_signature column of the functions table)
+    def insert_signature_group(self, record, type_table):
+        self.insert("signature_groups", {
+            "signature": record["signature"],
+            "function_count": len(record["functions"])
+        })
+
+    def insert_type(self, record, type_table):
+        type_details = record.get("type_details")
+        self.connection.execute("INSERT INTO types (id, declaration, description, type_details) VALUES (?, ?, ?, ?)",
+                                [record["id"],
+                                 record["declaration"],
+                                 json.dumps(record["description"]),
+                                 json.dumps(type_details) if type_details is not None else None])
+
+
+# Build the metadata database for dom_root in the (empty) database connection given
+# options (a gen_metadata.MetadataOptions) controls which optional data is included, as for the JSON metadata
+def populate_database(dom_root, connection, options=None):
+    connection.executescript(schema)
+
+    writer = SQLiteMetadataWriter(connection)
+    type_table = gen_metadata.MetadataTypeTable()
+
+    section_inserters = {
+        "defines": writer.insert_define,
+        "enums": writer.insert_enum,
+        "typedefs": writer.insert_typedef,
+        "structs": writer.insert_struct,
+        "functions": writer.insert_function,
+        "signature_groups": writer.insert_signature_group,
+        "types": writer.insert_type
+    }
+
+    sections = gen_metadata.emit_sections(dom_root, type_table,
+                                          layout_calculators=gen_metadata.get_struct_layout_calculators(dom_root,
+                                                                                                        options),
+                                          signature_layout_calculator=gen_metadata.get_signature_layout_calculator(
+                                              dom_root, options))
+
+    for section_name, items in sections:
+        inserter = section_inserters[section_name]
+        for item in items:
+            inserter(item, type_table)
+
+    connection.commit()
+
+
+# Write metadata about our file to an SQLite database (file should be opened in binary mode)
+def generate(dom_root, file, options=None):
+    connection = sqlite3.connect(":memory:")
+    try:
+        populate_database(dom_root, connection, options)
+
+        if hasattr(connection, "serialize"):
+            data = connection.serialize()
+        else:
+            # Python versions before 3.11 can't serialise a database directly, so go via a temporary file
+            handle, temp_filename = tempfile.mkstemp(suffix=".db")
+            os.close(handle)
+            try:
+                file_connection = sqlite3.connect(temp_filename)
+                connection.backup(file_connection)
+                file_connection.close()
+                with open(temp_filename, "rb") as temp_file:
+                    data = temp_file.read()
+            finally:
+                os.remove(temp_filename)
+    finally:
+        connection.close()
+
+    file.write(data)
@@ -21,7 +21,68 @@ def generate_field_copies(file, indent, known_by_value_structs, struct, prefix):
                 write_c_line(file, indent, "dest." + prefix + name + " = src." + prefix + name + ";")
 
 
+# Get the data members of a struct as a list of (name, type, array bounds) tuples in declaration order, or None if the
+# struct contains anything that makes its layout hard to reason about (base classes, bitfields, nested structs or
+# conditionally-compiled fields)
+def get_data_member_layout(struct):
+    if struct.base_classes:
+        return None
+
+    members = []
+    for child in struct.children:
+        if isinstance(child, code_dom.DOMFieldDeclaration):
+            if child.is_static:
+                continue  # Static members don't take up any space in the struct
+            for i in range(0, len(child.names)):
+                if child.width_specifiers[i] is not None:
+                    return None
+                array_bounds = None
+                if child.is_array[i]:
+                    array_bounds = code_dom.common.collapse_tokens_to_string(child.array_bounds_tokens[i])
+                members.append((child.names[i], child.field_type.to_c_string(), array_bounds))
+        elif isinstance(child, code_dom.DOMClassStructUnion):
+            return None
+        elif isinstance(child, code_dom.DOMPreprocessorIf):
+            if len(child.list_all_children_of_type(code_dom.DOMFieldDeclaration)) > 0:
+                return None
+
+    return members
+
+
+# Returns True if the C version of a by-value struct has exactly the same data members as the original C++ struct (and
+# any by-value structs it contains are likewise compatible), so that the two can be converted with a straight memory
+# copy. custom_types should map type names to struct elements.
+# Note that this can't prove everything (the C++ struct could have virtual functions, for example), so code relying on
+# it should also emit static_asserts to check the layout at compile time.
+def is_layout_compatible(struct, custom_types):
+    original_struct = struct.unmodified_element or struct
+
+    members = get_data_member_layout(struct)
+    if (members is None) or (members != get_data_member_layout(original_struct)):
+        return False
+
+    for name, type_name, array_bounds in members:
+        member_struct = custom_types.get(type_name)
+        if isinstance(member_struct, code_dom.DOMClassStructUnion) and (member_struct is not struct):
+            if member_struct.is_by_value and not is_layout_compatible(member_struct, custom_types):
+                return False
+
+    return True
+
+
+# Write static_asserts that check the C and C++ versions of a struct have the same layout
+def write_layout_assertions(file, indent, struct, c_type, cpp_type):
+    message = "\"" + c_type + " must have the same layout as " + cpp_type + "\""
+    write_c_line(file, indent, "static_assert(sizeof(" + c_type + ") == sizeof(" + cpp_type + "), " + message + ");")
+    write_c_line(file, indent, "static_assert(alignof(" + c_type + ") == alignof(" + cpp_type + "), " + message + ");")
+    for name, type_name, array_bounds in get_data_member_layout(struct):
+        write_c_line(file, indent, "static_assert(offsetof(" + c_type + ", " + name + ") == offsetof(" + cpp_type +
+                     ", " + name + "), " + message + ");")
+
+
 # Generate code to convert by-value types to/from their CPP version
+# Where the C and C++ versions of a struct have the same layout (which is checked with static_asserts), the conversion
+# is a single memcpy() rather than a member-by-member copy
 def generate(dom_root, file, indent=0):
 
     # Make a list of known by-value structs so we can copy them property
@@ -36,11 +97,17 @@ def generate(dom_root, file, indent=0):
         # The original (C++) version of the struct
         original_struct = struct.unmodified_element or struct
         if struct.is_by_value and not struct.is_forward_declaration:
+            c_type = "cimgui::" + struct.name
+            cpp_type = original_struct.get_fully_qualified_name(include_leading_colons=True)
+
+            layout_compatible = is_layout_compatible(struct, known_by_value_structs)
+            if layout_compatible:
+                file.write("\n")
+                write_layout_assertions(file, indent, struct, c_type, cpp_type)
+
             for to_cpp in [False, True]:
-                src_type = ("cimgui::" + struct.name) if to_cpp else \
-                    original_struct.get_fully_qualified_name(include_leading_colons=True)
-                dest_type = original_struct.get_fully_qualified_name(include_leading_colons=True) if to_cpp else \
-                    ("cimgui::" + struct.name)
+                src_type = c_type if to_cpp else cpp_type
+                dest_type = cpp_type if to_cpp else c_type
 
                 function_prefix = "ConvertToCPP_" if to_cpp else "ConvertFromCPP_"
 
@@ -52,8 +119,13 @@ def generate(dom_root, file, indent=0):
 
                 write_c_line(file, indent, dest_type + " dest;")
 
-                # Emit code to copy each member
-                generate_field_copies(file, indent, known_by_value_structs, struct, "")
+                if layout_compatible:
+                    # The cast to void* avoids warnings about copying a C++ type that is not trivially
+                    # default-constructible, which is fine here as we are initialising every byte
+                    write_c_line(file, indent, "memcpy(static_cast<void*>(&dest), &src, sizeof(dest));")
+                else:
+                    # Emit code to copy each member
+                    generate_field_copies(file, indent, known_by_value_structs, struct, "")
 
                 write_c_line(file, indent, "return dest;")
                 indent -= 1
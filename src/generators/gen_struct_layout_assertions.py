@@ -0,0 +1,68 @@
+from src import code_dom
+from src import conditional_generator
+from src import struct_layout
+from src.code_dom.common import write_c_line
+
+
+# Preprocessor conditions that identify each ABI we know about (where the compiler is using it)
+abi_conditions = {
+    "LLP64": "defined(_WIN64)",
+    "LP64": "defined(__LP64__)"
+}
+
+
+# Write static_asserts that check the compiler agrees with the layout we calculated for a struct
+def write_struct_assertions(file, indent, struct, layout):
+    c_type = "cimgui::" + struct.name
+    message = "\"" + c_type + " layout does not match the metadata\""
+    write_c_line(file, indent, "static_assert(sizeof(" + c_type + ") == " + str(layout.size) + ", " + message + ");")
+    write_c_line(file, indent, "static_assert(alignof(" + c_type + ") == " + str(layout.alignment) + ", " + message +
+                 ");")
+    for field in layout.fields:
+        if field.is_anonymous or (field.bit_width is not None):
+            continue  # offsetof() can't be used with these
+        write_c_line(file, indent, "static_assert(offsetof(" + c_type + ", " + field.name + ") == " +
+                     str(field.offset) + ", " + message + ");")
+
+
+# Generate static_asserts that check the struct layouts given in the metadata against those the compiler produces, for
+# whichever of the ABIs we know about is being compiled for
+def generate(dom_root, file, indent=0):
+    # Layouts need to be calculated from the whole DOM, as structs may use types from other headers
+    layout_root = dom_root
+    while layout_root.parent is not None:
+        layout_root = layout_root.parent
+
+    structs = [struct for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion)
+               if not (struct.is_forward_declaration or struct.is_anonymous)]
+
+    # Work out which structs we can check for each ABI
+    abi_layouts = []
+    for abi in struct_layout.all_abis:
+        layout_calculator = struct_layout.StructLayoutCalculator(layout_root, abi)
+        layouts = []
+        for struct in structs:
+            layout = layout_calculator.get_struct_layout(struct)
+            if (layout is not None) and not struct_layout.is_configuration_dependent(struct, layout):
+                layouts.append((struct, layout))
+        abi_layouts.append((abi, layouts))
+
+    if all(len(layouts) == 0 for abi, layouts in abi_layouts):
+        return  # Nothing to check
+
+    file.write("\n")
+    write_c_line(file, indent, "// Struct layout checks")
+
+    for abi_index, (abi, layouts) in enumerate(abi_layouts):
+        file.write("\n")
+        write_c_line(file, indent, ("#if " if abi_index == 0 else "#elif ") + abi_conditions[abi.name])
+
+        generator = conditional_generator.ConditionalGenerator()
+        for struct, layout in layouts:
+            generator.write_conditionals(struct, file, indent)
+            file.write("\n")
+            write_struct_assertions(file, indent, struct, layout)
+        generator.finish_writing(file, indent)
+
+    file.write("\n")
+    write_c_line(file, indent, "#endif")
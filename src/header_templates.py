@@ -0,0 +1,43 @@
+import os
+import re
+
+# Matches expansion placeholders in templates (e.g. %IMGUI_INCLUDE_DIR%)
+placeholder_regex = re.compile(r"(%[A-Za-z0-9_]+%)")
+
+
+# A header template file, pre-split into alternating literal text and placeholder segments so that it can be expanded
+# with a single join
+class HeaderTemplate:
+    def __init__(self, text):
+        # re.split() with a capturing group gives literal text at even indices and placeholders at odd indices
+        self.segments = placeholder_regex.split(text)
+        self.placeholder_indices = range(1, len(self.segments), 2)
+
+    # Return the template text with placeholders replaced by the values in the expansions dictionary (placeholders
+    # that are not in the dictionary are left as-is)
+    def expand(self, expansions):
+        segments = self.segments.copy()
+        for index in self.placeholder_indices:
+            placeholder = segments[index]
+            if placeholder in expansions:
+                segments[index] = expansions[placeholder]
+        return "".join(segments)
+
+
+# Loaded templates, indexed by path, as (modification time, template) tuples
+loaded_templates = {}
+
+
+# Get the template at the given path, loading it if it has not been loaded before (or has changed since)
+def get_template(template_file):
+    mtime = os.stat(template_file).st_mtime_ns
+
+    cached = loaded_templates.get(template_file)
+    if (cached is not None) and (cached[0] == mtime):
+        return cached[1]
+
+    with open(template_file, "r") as file:
+        template = HeaderTemplate(file.read())
+
+    loaded_templates[template_file] = (mtime, template)
+    return template
@@ -0,0 +1,518 @@
+# Python API for reading Dear Bindings metadata
+#
+# This loads any of the metadata formats Dear Bindings emits (JSON, with or without --metadata-compact,
+# --metadata-compression or --metadata-type-table, and the --metadata-binary format), and presents the contents as
+# record objects. Records are only created when they are accessed, and their contents (including child elements such
+# as fields and arguments) are only converted as they are read, so tools that only look at part of the API only pay for
+# that part.
+#
+# Example usage:
+#
+#   with metadata_reader.load_metadata("cimgui.json") as metadata:
+#       function = metadata.get_function("ImGui_Begin")
+#       for argument in function.arguments:
+#           print(argument.name + ": " + argument.type.declaration)
+
+import gzip
+import json
+import lzma
+from src import binary_metadata
+
+
+# Metadata loaded from a JSON file (the whole file is parsed up-front, but records are only created on access)
+class JSONMetadataSource:
+    def __init__(self, filename):
+        if filename.endswith(".gz"):
+            open_function = gzip.open
+        elif filename.endswith(".xz"):
+            open_function = lzma.open
+        else:
+            open_function = open
+
+        with open_function(filename, "rt") as file:
+            self.root = json.load(file)
+
+        self.name_indices = {}  # Dictionaries mapping names to lists of record indices, for each section
+
+    def close(self):
+        pass
+
+    def get_record_count(self, section_name):
+        return len(self.root.get(section_name, []))
+
+    def get_record(self, section_name, index):
+        return self.root[section_name][index]
+
+    def find_indices(self, section_name, name):
+        name_index = self.name_indices.get(section_name)
+        if name_index is None:
+            # Build the index for this section the first time it is needed
+            name_index = {}
+            key = binary_metadata.SECTION_INDEX_KEYS[section_name]
+            for index, record in enumerate(self.root.get(section_name, [])):
+                name_index.setdefault(record.get(key), []).append(index)
+            self.name_indices[section_name] = name_index
+        return name_index.get(name, [])
+
+
+# Metadata loaded from a binary metadata file (which is memory-mapped, with records decoded on access)
+class BinaryMetadataSource:
+    def __init__(self, filename):
+        self.reader = binary_metadata.BinaryMetadataReader(filename)
+
+    def close(self):
+        self.reader.close()
+
+    def get_record_count(self, section_name):
+        section = self.reader.get_section(section_name)
+        return len(section) if section is not None else 0
+
+    def get_record(self, section_name, index):
+        return self.reader.get_section(section_name)[index]
+
+    def find_indices(self, section_name, name):
+        section = self.reader.get_section(section_name)
+        return section.find_indices(name) if section is not None else []
+
+
+# A type (see "types" in MetadataFormat.md)
+class MetadataType:
+    __slots__ = ("metadata", "raw")
+
+    def __init__(self, metadata, raw):
+        self.metadata = metadata
+        self.raw = raw
+
+    def __repr__(self):
+        return "MetadataType(" + self.declaration + ")"
+
+    @property
+    def declaration(self):
+        return self.raw["declaration"]
+
+    # The type description, as a dictionary (see "type descriptions" in MetadataFormat.md)
+    @property
+    def description(self):
+        return self.raw.get("description")
+
+    # The parsed details of the type, as a dictionary with any types inside converted to MetadataType (or None)
+    @property
+    def type_details(self):
+        type_details = self.raw.get("type_details")
+        if type_details is None:
+            return None
+        result = dict(type_details)
+        if "return_type" in result:
+            result["return_type"] = self.metadata.resolve_type(result["return_type"])
+        result["arguments"] = [MetadataArgument(self.metadata, argument) for argument in result.get("arguments", [])]
+        return result
+
+
+# A preprocessor conditional attached to an element
+class MetadataConditional:
+    __slots__ = ("condition", "expression")
+
+    def __init__(self, raw):
+        self.condition = raw["condition"]  # "ifdef", "ifndef", "if" or "ifnot"
+        self.expression = raw["expression"]
+
+    def __repr__(self):
+        return "MetadataConditional(" + self.condition + " " + self.expression + ")"
+
+
+# Base class for metadata records, which wraps the raw record data and converts values as they are accessed
+class MetadataRecord:
+    __slots__ = ("metadata", "raw")
+
+    def __init__(self, metadata, raw):
+        self.metadata = metadata
+        self.raw = raw
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + str(self.raw.get("name")) + ")"
+
+    @property
+    def name(self):
+        return self.raw.get("name")
+
+
+# Base class for top-level elements (and struct fields/enum elements), which have comments, conditionals and so on
+class MetadataElement(MetadataRecord):
+    __slots__ = ()
+
+    @property
+    def preceding_comments(self):
+        return self.raw.get("comments", {}).get("preceding", [])
+
+    @property
+    def attached_comment(self):
+        return self.raw.get("comments", {}).get("attached")
+
+    @property
+    def conditionals(self):
+        return [MetadataConditional(conditional) for conditional in self.raw.get("conditionals", [])]
+
+    @property
+    def is_internal(self):
+        return self.raw.get("is_internal", False)
+
+    # Stable hash of the signature/layout of the element (only present on top-level elements)
+    @property
+    def content_hash(self):
+        return self.raw.get("content_hash")
+
+    @property
+    def source_filename(self):
+        return self.raw.get("source_location", {}).get("filename")
+
+    @property
+    def source_line(self):
+        return self.raw.get("source_location", {}).get("line")
+
+
+class MetadataDefine(MetadataElement):
+    __slots__ = ()
+
+    @property
+    def content(self):
+        return self.raw.get("content")
+
+
+class MetadataEnumElement(MetadataElement):
+    __slots__ = ()
+
+    @property
+    def value_expression(self):
+        return self.raw.get("value_expression")
+
+    @property
+    def value(self):
+        return self.raw.get("value")
+
+    @property
+    def is_count(self):
+        return self.raw["is_count"]
+
+
+class MetadataEnum(MetadataElement):
+    __slots__ = ("cached_elements",)
+
+    def __init__(self, metadata, raw):
+        super().__init__(metadata, raw)
+        self.cached_elements = None
+
+    @property
+    def original_fully_qualified_name(self):
+        return self.raw.get("original_fully_qualified_name")
+
+    @property
+    def storage_type(self):
+        return self.metadata.resolve_type(self.raw.get("storage_type"))
+
+    @property
+    def is_flags_enum(self):
+        return self.raw["is_flags_enum"]
+
+    @property
+    def elements(self):
+        if self.cached_elements is None:
+            self.cached_elements = [MetadataEnumElement(self.metadata, element) for element in self.raw["elements"]]
+        return self.cached_elements
+
+
+class MetadataTypedef(MetadataElement):
+    __slots__ = ()
+
+    @property
+    def type(self):
+        return self.metadata.resolve_type(self.raw["type"])
+
+
+class MetadataField(MetadataElement):
+    __slots__ = ()
+
+    @property
+    def type(self):
+        return self.metadata.resolve_type(self.raw["type"])
+
+    @property
+    def is_array(self):
+        return self.raw["is_array"]
+
+    @property
+    def array_bounds(self):
+        return self.raw.get("array_bounds")
+
+    @property
+    def width(self):
+        return self.raw.get("width")
+
+    @property
+    def is_anonymous(self):
+        return self.raw["is_anonymous"]
+
+    @property
+    def default_value(self):
+        return self.raw.get("default_value")
+
+    # Field offsets in bytes indexed by ABI name (with --emit-struct-layouts, otherwise None)
+    @property
+    def offset(self):
+        return self.raw.get("offset")
+
+    # For bitfields, the bit position within the storage unit at offset, indexed by ABI name
+    @property
+    def bit_offset(self):
+        return self.raw.get("bit_offset")
+
+
+class MetadataStruct(MetadataElement):
+    __slots__ = ("cached_fields",)
+
+    def __init__(self, metadata, raw):
+        super().__init__(metadata, raw)
+        self.cached_fields = None
+
+    @property
+    def original_fully_qualified_name(self):
+        return self.raw.get("original_fully_qualified_name")
+
+    @property
+    def kind(self):
+        return self.raw["kind"]
+
+    @property
+    def by_value(self):
+        return self.raw["by_value"]
+
+    @property
+    def forward_declaration(self):
+        return self.raw["forward_declaration"]
+
+    @property
+    def is_anonymous(self):
+        return self.raw["is_anonymous"]
+
+    # Size and alignment indexed by ABI name (with --emit-struct-layouts, otherwise None)
+    @property
+    def layout(self):
+        return self.raw.get("layout")
+
+    @property
+    def fields(self):
+        if self.cached_fields is None:
+            self.cached_fields = [MetadataField(self.metadata, field) for field in self.raw["fields"]]
+        return self.cached_fields
+
+
+class MetadataArgument(MetadataRecord):
+    __slots__ = ()
+
+    # The argument type (None for varargs)
+    @property
+    def type(self):
+        return self.metadata.resolve_type(self.raw.get("type"))
+
+    @property
+    def is_array(self):
+        return self.raw["is_array"]
+
+    @property
+    def array_bounds(self):
+        return self.raw.get("array_bounds")
+
+    @property
+    def is_varargs(self):
+        return self.raw["is_varargs"]
+
+    @property
+    def default_value(self):
+        return self.raw.get("default_value")
+
+    @property
+    def is_instance_pointer(self):
+        return self.raw.get("is_instance_pointer", False)
+
+    # Was this a by-value struct argument that has been converted to a pointer?
+    @property
+    def was_by_value_struct(self):
+        return self.raw.get("was_by_value_struct", False)
+
+    # The name of the string argument this gives the length of, if it is one (with --emit-sized-string-functions)
+    @property
+    def length_of_argument(self):
+        return self.raw.get("length_of_argument")
+
+
+class MetadataFunction(MetadataElement):
+    __slots__ = ("cached_arguments",)
+
+    def __init__(self, metadata, raw):
+        super().__init__(metadata, raw)
+        self.cached_arguments = None
+
+    @property
+    def original_fully_qualified_name(self):
+        return self.raw.get("original_fully_qualified_name")
+
+    @property
+    def return_type(self):
+        return self.metadata.resolve_type(self.raw.get("return_type"))
+
+    @property
+    def arguments(self):
+        if self.cached_arguments is None:
+            self.cached_arguments = [MetadataArgument(self.metadata, argument) for argument in self.raw["arguments"]]
+        return self.cached_arguments
+
+    @property
+    def original_class(self):
+        return self.raw.get("original_class")
+
+    @property
+    def is_default_argument_helper(self):
+        return self.raw["is_default_argument_helper"]
+
+    @property
+    def is_manual_helper(self):
+        return self.raw["is_manual_helper"]
+
+    @property
+    def is_imstr_helper(self):
+        return self.raw["is_imstr_helper"]
+
+    @property
+    def has_imstr_helper(self):
+        return self.raw["has_imstr_helper"]
+
+    @property
+    def is_unformatted_helper(self):
+        return self.raw["is_unformatted_helper"]
+
+    @property
+    def is_static(self):
+        return self.raw.get("is_static", False)
+
+    # The name of the function this calls for each element of its argument array, if it is a batched variant (with
+    # --batch-function)
+    @property
+    def batch_source_function(self):
+        return self.raw.get("batch_source_function")
+
+    # The symbol of the original C++ function, if it has the same ABI as the C function (with --emit-direct-aliases)
+    @property
+    def direct_alias_symbol(self):
+        return self.raw.get("direct_alias_symbol")
+
+    # The opcode used to record calls to this function in command buffers, if it has one (with --emit-command-buffer)
+    @property
+    def command_opcode(self):
+        return self.raw.get("command_opcode")
+
+    # The name of the function this is a variant of that takes strings as a pointer and length, if it is one (with
+    # --emit-sized-string-functions)
+    @property
+    def sized_string_source_function(self):
+        return self.raw.get("sized_string_source_function")
+
+    # The canonical ABI signature of the function, if known (with --metadata-abi-signatures)
+    @property
+    def abi_signature(self):
+        return self.raw.get("abi_signature")
+
+
+# Record classes for each section
+section_record_classes = {
+    "defines": MetadataDefine,
+    "enums": MetadataEnum,
+    "typedefs": MetadataTypedef,
+    "structs": MetadataStruct,
+    "functions": MetadataFunction
+}
+
+
+# A section of the metadata, which acts as a read-only sequence of records (created on access)
+class MetadataSection:
+    def __init__(self, metadata, section_name):
+        self.metadata = metadata
+        self.section_name = section_name
+        self.record_class = section_record_classes[section_name]
+
+    def __len__(self):
+        return self.metadata.source.get_record_count(self.section_name)
+
+    def __getitem__(self, index):
+        return self.record_class(self.metadata, self.metadata.source.get_record(self.section_name, index))
+
+    def __iter__(self):
+        for index in range(0, len(self)):
+            yield self[index]
+
+    # Get all the records with the given name
+    def find_all(self, name):
+        return [self[index] for index in self.metadata.source.find_indices(self.section_name, name)]
+
+    # Get the first record with the given name, or None if there isn't one
+    def find(self, name):
+        indices = self.metadata.source.find_indices(self.section_name, name)
+        return self[indices[0]] if len(indices) > 0 else None
+
+
+# Loaded metadata
+class Metadata:
+    def __init__(self, source):
+        self.source = source
+        self.types = {}  # MetadataType objects for types from the type table, indexed by ID
+
+        self.defines = MetadataSection(self, "defines")
+        self.enums = MetadataSection(self, "enums")
+        self.typedefs = MetadataSection(self, "typedefs")
+        self.structs = MetadataSection(self, "structs")
+        self.functions = MetadataSection(self, "functions")
+
+    def close(self):
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+        return False
+
+    def get_function(self, name):
+        return self.functions.find(name)
+
+    def get_struct(self, name):
+        return self.structs.find(name)
+
+    def get_enum(self, name):
+        return self.enums.find(name)
+
+    def get_typedef(self, name):
+        return self.typedefs.find(name)
+
+    def get_define(self, name):
+        return self.defines.find(name)
+
+    # Get a MetadataType for a type value from a record, which may be either inline type data or an ID in the type
+    # table (or None)
+    def resolve_type(self, type_value):
+        if type_value is None:
+            return None
+        if isinstance(type_value, dict):
+            return MetadataType(self, type_value)
+
+        result = self.types.get(type_value)
+        if result is None:
+            result = MetadataType(self, self.source.get_record("types", type_value))
+            self.types[type_value] = result
+        return result
+
+
+# Load metadata from a file, choosing the appropriate loader based on the file extension
+def load_metadata(filename):
+    if filename.endswith(".dbmeta"):
+        return Metadata(BinaryMetadataSource(filename))
+    else:
+        return Metadata(JSONMetadataSource(filename))
@@ -35,10 +35,7 @@ from . import mod_remove_includes
 from . import mod_remove_heap_constructors_and_destructors
 from . import mod_generate_default_argument_functions
 from . import mod_generate_imstr_helpers
-from . import mod_align_comments
-from . import mod_align_enum_values
-from . import mod_align_function_names
-from . import mod_align_structure_field_names
+from . import mod_align_columns
 from . import mod_add_manual_helper_functions
 from . import mod_add_function_comment
 from . import mod_mark_internal_members
@@ -61,3 +58,10 @@ from . import mod_move_elements
 from . import mod_remove_typedefs
 from . import mod_replace_typedef_with_opaque_buffer
 from . import mod_change_class_field_type
+from . import mod_resolve_conditionals
+from . import mod_mark_direct_alias_functions
+from . import mod_add_api_table
+from . import mod_add_reflection_tables
+from . import mod_add_command_buffer
+from . import mod_add_batch_functions
+from . import mod_add_sized_string_functions
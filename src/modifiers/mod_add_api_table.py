@@ -0,0 +1,129 @@
+import hashlib
+from src import code_dom
+from src import conditional_generator
+from src import utils
+from src.code_dom.common import LineBuffer, write_c_line
+
+
+# Get the names used for the API table generated for an output file, as a (struct name, getter function name, version
+# define name) tuple (e.g. ("CimguiApi", "cimgui_get_api", "CIMGUI_API_TABLE_VERSION") for cimgui.h)
+def get_api_table_names(dest_file_name):
+    type_prefix, function_prefix = utils.get_output_file_name_prefixes(dest_file_name)
+    return type_prefix + "Api", function_prefix + "_get_api", function_prefix.upper() + "_API_TABLE_VERSION"
+
+
+# Get the functions that go in the API table, in table order
+def get_api_table_functions(src_root, function_name):
+    return [function for function in src_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration)
+            if function.name != function_name]
+
+
+# Get the slots in the API table, in table order, as lists of the functions that can occupy each one (functions with
+# the same name in mutually exclusive preprocessor blocks share a slot)
+def get_api_table_slots(src_root, function_name):
+    slots = {}
+    for function in get_api_table_functions(src_root, function_name):
+        slots.setdefault(function.name, []).append(function)
+    return list(slots.values())
+
+
+# Write a slot in the API table (a struct field or table entry). variants is a list of (function, text) tuples for the
+# functions that can occupy the slot, and each is wrapped in any conditionals the function is subject to beyond those of
+# base_element, with the remaining variants (or finally placeholder_text) used when they are disabled. This means that
+# the table has the same layout in every configuration, so the version number can be trusted.
+def write_table_slot(file, indent, base_element, variants, placeholder_text):
+    if len(variants) == 0:
+        write_c_line(file, indent, placeholder_text)
+        return
+
+    function, slot_text = variants[0]
+    base_conditionals = conditional_generator.ConditionalGenerator.get_wanted_conditionals(base_element)
+    extra_conditionals = [conditional for conditional in
+                          conditional_generator.ConditionalGenerator.get_wanted_conditionals(function)
+                          if not any(conditional.condition_matches(base_conditional)
+                                     for base_conditional in base_conditionals)]
+
+    # (the preprocessor directives have to go at the start of the line for the parser to recognise them)
+    for conditional in extra_conditionals:
+        write_c_line(file, 0, conditional.get_opening_clause())
+    write_c_line(file, indent, slot_text)
+    for conditional in reversed(extra_conditionals):
+        write_c_line(file, 0, "#else")
+        write_table_slot(file, indent, base_element, variants[1:], placeholder_text)
+        write_c_line(file, 0, "#endif // " + conditional.get_opening_clause())
+
+
+# This modifier adds a struct containing a pointer to every function in the file (in the order they are declared),
+# along with a function that returns a filled-in instance of it (see gen_function_stubs.generate_api_table()). This
+# allows FFI users to load the entire API with a single symbol lookup.
+# The struct layout is identified by a version number (a hash of the struct declaration), which callers pass to the
+# getter function to check that they agree on the layout. Functions that are disabled in the current build
+# configuration (such as obsolete functions with IMGUI_DISABLE_OBSOLETE_FUNCTIONS) keep their slot, as a NULL
+# void(void) function pointer, so the layout doesn't depend on the configuration.
+def apply(src_root, dest_file_name):
+    struct_name, function_name, version_define_name = get_api_table_names(dest_file_name)
+
+    functions = get_api_table_functions(src_root, function_name)
+    if len(functions) == 0:
+        return
+
+    # We put the table alongside the last function, in the innermost element that contains all the functions (so it
+    # is subject to any preprocessor conditionals they all share, such as IMGUI_DISABLE)
+    container, insert_point = utils.find_common_container(functions)
+
+    # Generate the struct, with fields inside any additional conditionals needed by each function
+    field_context = code_dom.WriteContext()
+    field_context.for_c = True
+    field_context.for_implementation = True  # Suppresses default argument comments
+
+    struct_text = LineBuffer()
+    write_c_line(struct_text, 0, "struct " + struct_name)
+    write_c_line(struct_text, 0, "{")
+    for slot_functions in get_api_table_slots(src_root, function_name):
+        write_table_slot(struct_text, 1, container,
+                         [(function, get_function_pointer_declaration(function, field_context) + ";")
+                          for function in slot_functions],
+                         "void (*" + slot_functions[0].name + ")(void);")
+    write_c_line(struct_text, 0, "};")
+
+    struct_element = utils.create_classstructunion(struct_text.getvalue())
+
+    version = int(hashlib.sha256(struct_text.getvalue().encode("utf-8")).hexdigest()[:8], 16) & 0x7FFFFFFF
+
+    version_define = code_dom.DOMDefine()
+    version_define.name = version_define_name
+    version_define.content = str(version)
+
+    function_element = utils.create_function_declaration("const " + struct_name + "* " + function_name +
+                                                         "(int version);")
+    function_element.is_imgui_api = True
+    function_element.is_manual_helper = True  # The implementation is generated by generate_api_table()
+    utils.append_comment_text(function_element, "Returns NULL if version is not " + version_define_name)
+
+    comment_lines = [
+        "// API table",
+        "// " + struct_name + " contains a pointer to every function above, in declaration order. Use " +
+        function_name + "(" + version_define_name + ")",
+        "// to get a filled-in table, allowing all the functions to be loaded with one symbol lookup."
+    ]
+    comments = []
+    for comment_line in comment_lines:
+        comment = code_dom.DOMComment()
+        comment.comment_text = comment_line
+        comments.append(comment)
+    version_define.attach_preceding_comments(comments)
+
+    container.insert_after_child(insert_point, [code_dom.DOMBlankLines(1),
+                                                version_define,
+                                                struct_element,
+                                                function_element,
+                                                code_dom.DOMBlankLines(1)])
+
+
+# Get the declaration of a pointer to function
+def get_function_pointer_declaration(function, context):
+    arguments = [argument.to_c_string(context) for argument in function.arguments
+                 if not argument.is_implicit_default]
+    if len(arguments) == 0:
+        arguments = ["void"]
+    return function.return_type.to_c_string(context) + " (*" + function.name + ")(" + ", ".join(arguments) + ")"
@@ -0,0 +1,77 @@
+from src import code_dom
+from src import utils
+
+
+# Get the declaration of the field that holds an argument in a batch arguments struct
+def get_argument_field_declaration(argument, context):
+    if isinstance(argument.arg_type, code_dom.DOMFunctionPointerType):
+        return argument.to_c_string(context)
+    type_string = argument.arg_type.to_c_string(context)
+    if ("*" not in type_string) and type_string.startswith("const "):
+        type_string = type_string[len("const "):]  # Const fields would stop the struct being assignable
+    if argument.is_array:
+        if argument.array_bounds is None:
+            return type_string + "* " + argument.name
+        return type_string + " " + argument.name + "[" + str(argument.array_bounds) + "]"
+    return type_string + " " + argument.name
+
+
+# This modifier adds "_Batch" variants of the named functions, which take an array of structs containing the
+# arguments and call the original function once for each of them (the self argument, if there is one, is passed
+# separately and shared by all the calls). This lets callers in languages where each call into C is expensive make
+# many calls at once.
+# Functions that return a value can't be batched (as there would be nowhere to put the results) and are ignored.
+def apply(dom_root, function_names):
+    context = code_dom.WriteContext()
+    context.for_c = True
+    context.for_implementation = True  # Suppresses default argument comments
+
+    functions_found = set()
+
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.name not in function_names:
+            continue
+        functions_found.add(function.name)
+
+        if (function.return_type is None) or (function.return_type.to_c_string() != "void"):
+            print("Not generating batch variant of " + function.name + " as it returns a value")
+            continue
+
+        arguments = [argument for argument in function.arguments if not argument.is_implicit_default]
+        if any(argument.is_varargs or (argument.name is None) for argument in arguments):
+            print("Not generating batch variant of " + function.name + " as it has varargs or unnamed arguments")
+            continue
+
+        self_argument = None
+        if (function.original_class is not None) and not function.is_static and (len(arguments) > 0):
+            self_argument = arguments[0]
+            arguments = arguments[1:]
+
+        if len(arguments) == 0:
+            print("Not generating batch variant of " + function.name + " as it has no arguments to batch")
+            continue
+
+        args_struct_name = function.name + "_BatchArgs"
+
+        struct_text = "struct " + args_struct_name + "\n{\n"
+        for argument in arguments:
+            struct_text += "    " + get_argument_field_declaration(argument, context) + ";\n"
+        struct_text += "};"
+        args_struct = utils.create_classstructunion(struct_text)
+
+        batch_arguments = []
+        if self_argument is not None:
+            batch_arguments.append(self_argument.to_c_string(context))
+        batch_arguments.append("const " + args_struct_name + "* args")
+        batch_arguments.append("int count")
+        batch_function = utils.create_function_declaration("void " + function.name + "_Batch(" +
+                                                           ", ".join(batch_arguments) + ");")
+        batch_function.is_imgui_api = True
+        batch_function.batch_source_function = function.name
+        utils.append_comment_text(batch_function, "Calls " + function.name + "() once for each element of args")
+
+        function.parent.insert_after_child(function, [args_struct, batch_function])
+
+    for function_name in function_names:
+        if function_name not in functions_found:
+            print("Function " + function_name + " to generate a batch variant of was not found")
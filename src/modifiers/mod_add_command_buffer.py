@@ -0,0 +1,95 @@
+from src import code_dom
+from src import utils
+
+
+# Get the name of the replay function for an output file (e.g. "cimgui_replay" for cimgui.h)
+def get_replay_function_name(dest_file_name):
+    type_prefix, function_prefix = utils.get_output_file_name_prefixes(dest_file_name)
+    return function_prefix + "_replay"
+
+
+# Get the arguments of a function that appear in the C version (and thus in command buffers)
+def get_command_arguments(function):
+    return [argument for argument in function.arguments if not argument.is_implicit_default]
+
+
+# Returns true if an argument is a string, which is copied into the command buffer (rather than being stored as a
+# pointer like other pointer arguments)
+def is_string_argument(argument):
+    return (not argument.is_array) and isinstance(argument.arg_type, code_dom.DOMType) and \
+        (not isinstance(argument.arg_type, code_dom.DOMFunctionPointerType)) and \
+        (argument.arg_type.to_c_string() == "const char*")
+
+
+# Returns true if calls to a function can be recorded in a command buffer
+def can_record_function(function):
+    # Recording is fire-and-forget, so functions that return anything are not included
+    if (function.return_type is None) or (function.return_type.to_c_string() != "void"):
+        return False
+
+    for argument in get_command_arguments(function):
+        if argument.is_varargs or (argument.name is None):
+            return False
+        if isinstance(argument.arg_type, code_dom.DOMFunctionPointerType):
+            continue
+        if "va_list" in argument.arg_type.to_c_string():
+            return False
+        # Strings are copied into the buffer, which would break end pointers that point into them
+        if argument.name.endswith("_end") and is_string_argument(argument):
+            return False
+
+    return True
+
+
+# This modifier assigns command buffer opcodes to all the functions that can be recorded (see can_record_function()),
+# and adds a replay function that executes a buffer of recorded calls (see gen_command_buffer.py). This allows
+# bindings for languages where each call into C is expensive to record a sequence of calls and then make them all at
+# once.
+def apply(src_root, dest_file_name):
+    replay_function_name = get_replay_function_name(dest_file_name)
+
+    functions = src_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration)
+    if len(functions) == 0:
+        return
+
+    next_opcode = 1  # 0 is never used as an opcode, to make it easier to spot uninitialised data
+    for function in functions:
+        if can_record_function(function):
+            function.command_opcode = next_opcode
+            next_opcode += 1
+
+    if next_opcode == 1:
+        return  # Nothing can be recorded
+
+    # We put the replay function alongside the last function, in the innermost element that contains all the
+    # functions (so it is subject to any preprocessor conditionals they all share, such as IMGUI_DISABLE)
+    container, insert_point = utils.find_common_container(functions)
+
+    replay_function = utils.create_function_declaration("int " + replay_function_name + "(const void* buf, "
+                                                        "size_t len); // Returns the number of commands executed, or "
+                                                        "-1 if the buffer is malformed")
+    replay_function.is_imgui_api = True
+    replay_function.is_manual_helper = True  # The implementation is generated by gen_command_buffer
+
+    comment_lines = [
+        "// Command buffer replay",
+        "// Executes a buffer of recorded calls to the functions above that have a command_opcode in the metadata. "
+        "Each call is",
+        "// recorded as its opcode (as a uint16_t), followed by each argument in turn. const char* arguments are "
+        "recorded as their",
+        "// length (as a uint32_t, or 0xFFFFFFFF for NULL) followed by the characters and a zero terminator, and "
+        "everything else",
+        "// (including other pointers) as the raw bytes of the argument value. Values are in native byte order with "
+        "no alignment.",
+        "// Commands before any malformed one are still executed."
+    ]
+    comments = []
+    for comment_line in comment_lines:
+        comment = code_dom.DOMComment()
+        comment.comment_text = comment_line
+        comments.append(comment)
+    replay_function.attach_preceding_comments(comments)
+
+    container.insert_after_child(insert_point, [code_dom.DOMBlankLines(1),
+                                                replay_function,
+                                                code_dom.DOMBlankLines(1)])
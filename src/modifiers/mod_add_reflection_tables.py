@@ -0,0 +1,124 @@
+from src import code_dom
+from src import utils
+
+
+# Get the names of the types and functions used for the reflection tables generated for an output file, as a
+# dictionary (e.g. names["find_function"] is "cimgui_find_function" for cimgui.h)
+def get_reflection_names(dest_file_name):
+    type_prefix, function_prefix = utils.get_output_file_name_prefixes(dest_file_name)
+    return {
+        "function_info": type_prefix + "ReflectionFunction",
+        "enum_info": type_prefix + "ReflectionEnum",
+        "enum_value_info": type_prefix + "ReflectionEnumValue",
+        "struct_info": type_prefix + "ReflectionStruct",
+        "field_info": type_prefix + "ReflectionField",
+        "tables": type_prefix + "ReflectionTables",
+        "get_tables": function_prefix + "_get_reflection_tables",
+        "find_function": function_prefix + "_find_function",
+        "find_enum_value": function_prefix + "_find_enum_value",
+        "find_struct": function_prefix + "_find_struct"
+    }
+
+
+# Get the functions that are described by the reflection tables, in declaration order
+def get_reflection_functions(src_root, names):
+    lookup_function_names = [names["get_tables"], names["find_function"], names["find_enum_value"],
+                             names["find_struct"]]
+    return [function for function in src_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration)
+            if function.name not in lookup_function_names]
+
+
+# This modifier adds the declarations for reflection tables describing the functions, enums and structs in the file,
+# which are compiled into the implementation (see gen_reflection_tables.py). This allows users such as scripting
+# language bindings to look things up at runtime without needing to parse the JSON metadata.
+def apply(src_root, dest_file_name):
+    names = get_reflection_names(dest_file_name)
+
+    functions = get_reflection_functions(src_root, names)
+    if len(functions) == 0:
+        return
+
+    # We put the declarations alongside the last function, in the innermost element that contains all the functions
+    # (so they are subject to any preprocessor conditionals they all share, such as IMGUI_DISABLE)
+    container, insert_point = utils.find_common_container(functions)
+
+    structs = [
+        utils.create_classstructunion("struct " + names["function_info"] + "\n"
+                                      "{\n"
+                                      "    const char* name;\n"
+                                      "    void (*function)(void);  // Cast to the correct type before calling\n"
+                                      "    int signature_id;        // Functions with the same signature_id have the "
+                                      "same signature\n"
+                                      "    const char* signature;   // The function type, e.g. \"bool(const char*, "
+                                      "bool*)\"\n"
+                                      "};"),
+        utils.create_classstructunion("struct " + names["enum_value_info"] + "\n"
+                                      "{\n"
+                                      "    const char* name;\n"
+                                      "    long long value;\n"
+                                      "};"),
+        utils.create_classstructunion("struct " + names["enum_info"] + "\n"
+                                      "{\n"
+                                      "    const char* name;\n"
+                                      "    const " + names["enum_value_info"] + "* values;\n"
+                                      "    int value_count;\n"
+                                      "};"),
+        utils.create_classstructunion("struct " + names["field_info"] + "\n"
+                                      "{\n"
+                                      "    const char* name;\n"
+                                      "    size_t offset;\n"
+                                      "    size_t size;\n"
+                                      "};"),
+        utils.create_classstructunion("struct " + names["struct_info"] + "\n"
+                                      "{\n"
+                                      "    const char* name;\n"
+                                      "    size_t size;\n"
+                                      "    size_t alignment;\n"
+                                      "    const " + names["field_info"] + "* fields;\n"
+                                      "    int field_count;\n"
+                                      "};"),
+        utils.create_classstructunion("struct " + names["tables"] + "\n"
+                                      "{\n"
+                                      "    const " + names["function_info"] + "* functions;\n"
+                                      "    int function_count;\n"
+                                      "    const " + names["enum_info"] + "* enums;\n"
+                                      "    int enum_count;\n"
+                                      "    const " + names["struct_info"] + "* structs;\n"
+                                      "    int struct_count;\n"
+                                      "};")
+    ]
+
+    lookup_functions = [
+        utils.create_function_declaration("const " + names["tables"] + "* " + names["get_tables"] + "(void);"),
+        utils.create_function_declaration("const " + names["function_info"] + "* " + names["find_function"] +
+                                          "(const char* name); // Returns NULL if not found"),
+        utils.create_function_declaration("const " + names["enum_value_info"] + "* " + names["find_enum_value"] +
+                                          "(const char* enum_name, const char* value_name); // Returns NULL if not "
+                                          "found"),
+        utils.create_function_declaration("const " + names["struct_info"] + "* " + names["find_struct"] +
+                                          "(const char* name); // Returns NULL if not found")
+    ]
+    for function in lookup_functions:
+        function.is_imgui_api = True
+        function.is_manual_helper = True  # The implementations are generated by gen_reflection_tables
+
+    comment_lines = [
+        "// Reflection tables",
+        "// These describe the functions, enums and structs above. Names are as they appear in this file (e.g. enum "
+        "names",
+        "// include any trailing underscore), and lookups use a perfect hash so are cheap. Entries that are disabled "
+        "by the",
+        "// current configuration (e.g. by IMGUI_DISABLE_OBSOLETE_FUNCTIONS) are present in the tables with a NULL "
+        "name."
+    ]
+    comments = []
+    for comment_line in comment_lines:
+        comment = code_dom.DOMComment()
+        comment.comment_text = comment_line
+        comments.append(comment)
+    structs[0].attach_preceding_comments(comments)
+
+    container.insert_after_child(insert_point, [code_dom.DOMBlankLines(1)] +
+                                 structs +
+                                 lookup_functions +
+                                 [code_dom.DOMBlankLines(1)])
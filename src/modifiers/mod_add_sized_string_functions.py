@@ -0,0 +1,132 @@
+from src import code_dom
+from src import utils
+
+
+# Returns true if an argument is a plain const char*
+def is_char_pointer_argument(argument):
+    return (not argument.is_varargs) and (not argument.is_array) and (argument.arg_type is not None) and \
+        (not isinstance(argument.arg_type, code_dom.DOMFunctionPointerType)) and \
+        (argument.arg_type.to_c_string() == "const char*")
+
+
+# Get the index of the string argument that an end pointer argument belongs to, or None if it isn't an end pointer
+# (we recognise "text"/"text_end" and "text_begin"/"text_end" style pairs)
+def get_end_pointer_string_index(arguments, index):
+    argument = arguments[index]
+    if (index == 0) or (argument.name is None) or (not argument.name.endswith("_end")) or \
+            (not is_char_pointer_argument(argument)):
+        return None
+    string_argument = arguments[index - 1]
+    if string_argument.is_implicit_default or not is_char_pointer_argument(string_argument):
+        return None
+    base_name = argument.name[:-len("_end")]
+    if string_argument.name not in [base_name, base_name + "_begin"]:
+        return None
+    return index - 1
+
+
+# Create the length argument that goes alongside a string argument
+def create_length_argument(function, string_argument_name, length_argument_name):
+    length_argument = code_dom.functionargument.DOMFunctionArgument()
+    length_argument.name = length_argument_name
+    length_argument.parent = function
+    length_argument.arg_type = utils.create_type("size_t")
+    length_argument.arg_type.parent = length_argument
+    length_argument.length_of_argument = string_argument_name
+    return length_argument
+
+
+# Remove an argument from the "Implied ..." comment generated by mod_generate_default_argument_functions, if it is
+# mentioned there
+def remove_implied_argument_comment(function, argument):
+    comment = function.attached_comment
+    if (comment is None) or (argument.default_value_tokens is None) or \
+            (not comment.comment_text.startswith("// Implied ")):
+        return
+    implied_text = argument.name + " = " + code_dom.common.collapse_tokens_to_string(argument.default_value_tokens)
+    if comment.comment_text == "// Implied " + implied_text:
+        function.attached_comment = None
+    elif comment.comment_text.startswith("// Implied " + implied_text + ", "):
+        comment.comment_text = comment.comment_text.replace(implied_text + ", ", "", 1)
+    else:
+        comment.comment_text = comment.comment_text.replace(", " + implied_text, "", 1)
+
+
+# This modifier generates "Sized" variants of functions that accept a string as a begin/end pointer pair or as ImStr,
+# which take the string as a pointer and a length instead. Bindings for languages that store strings with an explicit
+# length can use these to pass strings without copying them to add a zero terminator (or having the length recalculated
+# with strlen()).
+# End pointers are computed from the length, so string arguments that can be NULL (and mean something different when
+# they are) should not be passed through these.
+def apply(dom_root):
+    all_function_names = set(function.name for function in
+                             dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration))
+    # Argument lists of the variants we have generated for each original C++ function, so we can skip generating
+    # duplicates (such as for the default argument helper and the "Ex" version of a function both ending up with
+    # (text, text_len) arguments)
+    generated_signatures = {}
+
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        if function.is_imstr_helper or function.is_unformatted_helper:
+            continue  # These are already variants of another function that will be handled itself
+
+        new_function = function.clone()
+        new_function.name += "Sized"
+        new_function.has_imstr_helper = False
+        new_function.sized_string_source_function = function.name
+
+        new_arguments = []
+        has_sized_strings = False
+        for index, argument in enumerate(new_function.arguments):
+            string_index = get_end_pointer_string_index(new_function.arguments, index)
+            if string_index is not None:
+                # Replace the end pointer with a length that follows the string
+                string_argument = new_function.arguments[string_index]
+                base_name = argument.name[:-len("_end")]
+                if argument.is_implicit_default:
+                    remove_implied_argument_comment(new_function, argument)
+                argument.is_implicit_default = True
+                argument.stub_call_value = string_argument.name + " + " + base_name + "_len"
+                new_arguments.append(create_length_argument(new_function, string_argument.name, base_name + "_len"))
+                new_arguments.append(argument)
+                has_sized_strings = True
+            elif (not argument.is_varargs) and (not argument.is_implicit_default) and \
+                    (argument.name is not None) and (argument.arg_type.to_c_string() == "ImStr"):
+                # Pass the string as a pointer and a length, and build the ImStr from those
+                argument.arg_type = utils.create_type("const char*")
+                argument.arg_type.parent = argument
+                argument.stub_call_value = "MarshalToCPP_ImStr_FromSizedCharStr(" + argument.name + ", " + \
+                                           argument.name + "_len)"
+                new_arguments.append(argument)
+                new_arguments.append(create_length_argument(new_function, argument.name, argument.name + "_len"))
+                has_sized_strings = True
+            else:
+                new_arguments.append(argument)
+
+        if not has_sized_strings:
+            continue  # Nothing to do
+
+        new_function.arguments = new_arguments
+        # If we've replaced all the implied arguments then this is no longer really a default argument helper
+        new_function.is_default_argument_helper = \
+            any(argument.is_implicit_default and (argument.stub_call_value is None)
+                for argument in new_function.arguments)
+
+        signature_context = code_dom.WriteContext()
+        signature_context.for_c = True
+        signature_context.for_implementation = True
+        signature = [argument.to_c_string(signature_context) for argument in new_function.arguments
+                     if not argument.is_implicit_default]
+        original_function = function.unmodified_element or function
+        if signature in generated_signatures.setdefault(original_function, []):
+            continue
+        generated_signatures[original_function].append(signature)
+
+        if new_function.name in all_function_names:
+            print("Not generating sized string variant of " + function.name + " as " + new_function.name +
+                  " already exists")
+            continue
+        all_function_names.add(new_function.name)
+
+        # Insert new function
+        function.parent.insert_after_child(function, [new_function])
@@ -0,0 +1,285 @@
+from src import code_dom
+from src import utils
+
+
+# Alignment groups gathered from a single traversal of the DOM
+class AlignmentGroups:
+    def __init__(self):
+        self.enums = []  # List of (enum, [enum elements]) tuples
+        self.structs = []  # List of (struct, [fields]) tuples
+        self.function_groups = []  # Array of arrays of functions that appear together
+        self.comment_groups = []  # Array of arrays of elements whose attached comments should be aligned together
+        self.cacheable_elements = set()  # Elements whose rendered width does not depend on any other comment alignment
+
+
+# A fake file we get the DOM to write the C code to so we can evaluate the line length
+class LineLengthFile:
+    def __init__(self):
+        self.max_length = 0
+
+    def write(self, line):
+        self.max_length = max(self.max_length, len(line))
+
+
+# Cache of rendered statement lengths (excluding comments), shared by all groups so that each element only
+# gets rendered once
+class RenderedLineCache:
+    def __init__(self, cacheable_elements):
+        self.cacheable_elements = cacheable_elements
+        self.lengths = {}
+
+        # Context for writing - needs to match that used by the actual header file output
+        self.write_context = code_dom.WriteContext()
+        self.write_context.for_c = True
+
+    # Get the maximum line length of an element when written without comments
+    def get_statement_length(self, element):
+        length = self.lengths.get(element)
+        if length is not None:
+            return length
+
+        # Temporarily remove any comments so we can get the actual statement length without them
+        comment = element.attached_comment
+        pre_comments = element.pre_comments
+        element.attached_comment = None
+        element.pre_comments = []
+
+        # Write to fake file and extract maximum length
+        file = LineLengthFile()
+        element.write_to_c(file, 0, self.write_context)
+
+        # Reattach comments
+        element.attached_comment = comment
+        element.pre_comments = pre_comments
+
+        # Elements containing other commented elements get re-measured each time, as their width depends on the
+        # alignment of those comments (which may have been changed by a group processed in the meantime)
+        if element in self.cacheable_elements:
+            self.lengths[element] = file.max_length
+
+        return file.max_length
+
+
+# Calculate the alignment column for a set of lengths, ignoring any that are more than max_excess characters over the
+# average (to avoid a single very long line pushing everything far to the right)
+def calculate_alignment(lengths, max_excess, padding):
+    if len(lengths) == 0:
+        return 0
+
+    average = sum(lengths) / len(lengths)
+
+    alignment = 0
+    for length in lengths:
+        if length < (average + max_excess):
+            alignment = max(alignment, length + padding)
+
+    return alignment
+
+
+# Scan down from an element through its siblings until we hit a blank line or an already-grouped element, returning
+# the elements found that match the filter given (and marking them as grouped)
+def scan_sibling_group(element, sibling_positions, grouped_elements, include_element):
+    group = []
+    current = element
+    while (current is not None) and \
+            (not isinstance(current, code_dom.DOMBlankLines)) and \
+            (current not in grouped_elements):
+        if include_element(current):
+            group.append(current)
+            grouped_elements.add(current)
+        sibling_list, index = sibling_positions[current]
+        current = sibling_list[index + 1] if index + 1 < len(sibling_list) else None
+    return group
+
+
+# Build all of the alignment groups for the DOM in a single traversal
+def collect_alignment_groups(dom_root):
+    groups = AlignmentGroups()
+
+    functions = []  # All functions, in DOM order
+    commented_elements = []  # All elements with attached comments, in DOM order
+    sibling_positions = {}  # (list, index) in the parent for each element, as used by get_next_child()
+    struct_comment_groups = []  # Comment groups for structs
+    enum_comment_groups = []  # Comment groups for enums
+
+    enum_elements_stack = []  # Element lists for the enums we are currently inside
+    fields_stack = []  # Field lists for the structs we are currently inside
+    comment_groups_stack = []  # Comment groups for the structs/enums we are currently inside
+
+    # Returns True if this element or any of its descendants has an attached comment
+    def visit(element):
+        pushed_enum = False
+        pushed_struct = False
+        pushed_comment_group = False
+
+        if isinstance(element, code_dom.DOMEnum):
+            enum_elements = []
+            groups.enums.append((element, enum_elements))
+            enum_elements_stack.append(enum_elements)
+            pushed_enum = True
+        elif isinstance(element, code_dom.DOMClassStructUnion):
+            fields = []
+            groups.structs.append((element, fields))
+            fields_stack.append(fields)
+            pushed_struct = True
+        elif isinstance(element, code_dom.DOMEnumElement):
+            for enum_elements in enum_elements_stack:
+                enum_elements.append(element)
+        elif isinstance(element, code_dom.DOMFieldDeclaration):
+            for fields in fields_stack:
+                fields.append(element)
+        elif isinstance(element, code_dom.DOMFunctionDeclaration):
+            functions.append(element)
+
+        # Don't try and do anything with forward declarations at this point, as they don't have any children
+        # and trying to be clever here just impairs our ability to nicely align blocks of "typedef struct" statements
+        # (which the loose element scan will do just fine)
+        if pushed_enum or (pushed_struct and not element.is_forward_declaration):
+            comment_group = []
+            if element.attached_comment is not None:
+                # Count the struct itself as part of the group if it has a comment
+                comment_group.append(element)
+            (enum_comment_groups if pushed_enum else struct_comment_groups).append(comment_group)
+            comment_groups_stack.append(comment_group)
+            pushed_comment_group = True
+
+        has_comment = isinstance(element, code_dom.DOMElement) and (element.attached_comment is not None)
+        if has_comment:
+            commented_elements.append(element)
+            for comment_group in comment_groups_stack:
+                comment_group.append(element)
+
+        children_have_comments = False
+        for child_list in element.get_child_lists():
+            for index, child in enumerate(child_list):
+                if child not in sibling_positions:
+                    sibling_positions[child] = (child_list, index)
+                if visit(child):
+                    children_have_comments = True
+
+        if not children_have_comments:
+            groups.cacheable_elements.add(element)
+
+        if pushed_enum:
+            enum_elements_stack.pop()
+        if pushed_struct:
+            fields_stack.pop()
+        if pushed_comment_group:
+            comment_groups_stack.pop()
+
+        return has_comment or children_have_comments
+
+    visit(dom_root)
+
+    # Group functions that appear together (until a blank line)
+
+    grouped_functions = set()
+
+    for function in functions:
+        if function not in grouped_functions:
+            groups.function_groups.append(
+                scan_sibling_group(function, sibling_positions, grouped_functions,
+                                   lambda current: isinstance(current, code_dom.DOMFunctionDeclaration)))
+
+    # Comment groups from structures/enums come first, as we want to be sure those are grouped together
+
+    groups.comment_groups.extend(struct_comment_groups)
+    groups.comment_groups.extend(enum_comment_groups)
+
+    grouped_elements = set()
+    for comment_group in groups.comment_groups:
+        grouped_elements.update(comment_group)
+
+    # Next look for any other elements with comments and group them according to their position in the file
+    # We add statements here even if they don't have an attached comment themselves, because it looks bad if
+    # we have a bunch of interspaced statements that are longer than the comment alignment.
+    # But we ignore full-on comments as they tend to be long and don't affect the aesthetics so much.
+
+    for element in commented_elements:
+        if element not in grouped_elements:
+            groups.comment_groups.append(
+                scan_sibling_group(element, sibling_positions, grouped_elements,
+                                   lambda current: not isinstance(current, code_dom.DOMComment)))
+
+    return groups
+
+
+# Align enum values within each enum
+def align_enum_values(groups):
+    for enum, enum_elements in groups.enums:
+        # Calculate the maximum name length within the enum
+        max_name_length = 0
+        for enum_element in enum_elements:
+            max_name_length = max(max_name_length, len(enum_element.name))
+
+        # Set all the enum items to pad to that length
+        for enum_element in enum_elements:
+            enum_element.value_alignment = max_name_length
+
+
+# Align function names within each group of functions
+def align_function_names(groups):
+    # Context for writing - needs to match that used by the actual header file output
+    write_context = code_dom.WriteContext()
+    write_context.for_c = True
+
+    for group in groups.function_groups:
+        # -1 to remove trailing space
+        prefix_lengths = [len(function.get_prefixes_and_return_type(write_context)) - 1 for function in group]
+
+        alignment = calculate_alignment(prefix_lengths, 20, 1)  # +1 to leave a space after the end of the prefix
+
+        for function in group:
+            function.function_name_alignment = alignment
+
+
+# Align field names within each structure
+def align_structure_field_names(groups):
+    # Context for writing - needs to match that used by the actual header file output
+    write_context = code_dom.WriteContext()
+    write_context.for_c = True
+
+    # Fields that appear in nested structures get measured as part of the parent as well, so measure each one once
+    prefix_lengths_by_field = {}
+
+    for struct, fields in groups.structs:
+        prefix_lengths = []
+        for field in fields:
+            prefix_length = prefix_lengths_by_field.get(field)
+            if prefix_length is None:
+                prefix_length = len(field.get_prefix_and_type(write_context))
+                prefix_lengths_by_field[field] = prefix_length
+            prefix_lengths.append(prefix_length)
+
+        alignment = calculate_alignment(prefix_lengths, 20, 0)
+
+        # Set all the names to align to that
+        for field in fields:
+            field.name_alignment = alignment
+
+
+# Align attached comments within each group (this needs to happen after the other alignments, as they affect the
+# length of the statements)
+def align_comments(groups):
+    line_cache = RenderedLineCache(groups.cacheable_elements)
+
+    for group in groups.comment_groups:
+        statement_lengths = [line_cache.get_statement_length(element) for element in group]
+
+        alignment = calculate_alignment(statement_lengths, 40, 1)  # +1 to leave a space after the end of the statement
+
+        # Set all elements in the group to align to the same value
+        for element in group:
+            if element.attached_comment is not None:
+                element.attached_comment.alignment = alignment
+
+
+# This modifier performs all of the aesthetic alignment passes (enum values, function names, structure field names and
+# comments) together, gathering the groups of elements to align with a single traversal of the DOM
+def apply(dom_root):
+    groups = collect_alignment_groups(dom_root)
+
+    align_enum_values(groups)
+    align_function_names(groups)
+    align_structure_field_names(groups)
+    align_comments(groups)
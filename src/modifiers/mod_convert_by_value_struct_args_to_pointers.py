@@ -1,18 +1,27 @@
 from src import code_dom
+from src import struct_layout
 from src import utils
 
 
 # This modifier turns all instances of passing a struct by value as a function parameter into a pass-by-pointer instead
 # (for the benefit of langauge bindings that don't want to deal with the complexities of C's struct-as-value rules)
-def apply(dom_root):
-    for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
+# If max_by_value_size and/or convert_sysv_memory are given, only some structs are converted - those larger than
+# max_by_value_size bytes, and/or those that the x86-64 System V ABI passes in memory rather than in registers (so
+# small types like ImVec2 that are cheap to pass by value stay that way). Sizes are calculated for the LP64 ABI by
+# struct_layout, and structs whose layout can't be determined are left alone.
+def apply(dom_root, max_by_value_size=None, convert_sysv_memory=False):
+    # Make a list of all structs we know about
+
+    all_structs = {}
 
-        # Make a list of all structs we know about
+    for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
+        all_structs[struct.name] = struct
 
-        all_structs = {}
+    convert_all = (max_by_value_size is None) and not convert_sysv_memory
+    layout_calculator = struct_layout.StructLayoutCalculator(dom_root) if not convert_all else None
+    should_convert = {}  # Decisions we have made about each struct, indexed by name
 
-        for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
-            all_structs[struct.name] = struct
+    for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
 
         # Look for struct arguments
 
@@ -20,9 +29,32 @@ def apply(dom_root):
 
         if is_argument and (not type_element.parent.is_array):
             if len(type_element.tokens) == 1:
-                if type_element.tokens[0].value in all_structs:
+                struct_name = type_element.tokens[0].value
+                if struct_name in all_structs:
+                    if struct_name not in should_convert:
+                        should_convert[struct_name] = convert_all or \
+                            should_convert_struct(layout_calculator, struct_name, max_by_value_size,
+                                                  convert_sysv_memory)
+                    if not should_convert[struct_name]:
+                        continue
+
                     # This is a struct argument, so insert a pointer token
                     pointer_token = utils.create_token('*')
                     pointer_token.type = 'ASTERISK'
                     pointer_token.nullable = False  # Because it started as a value type, it can't be null
                     type_element.tokens = [type_element.tokens[0], pointer_token]
+                    type_element.parent.was_by_value_struct = True
+
+
+# Decide if arguments of the named struct type should be converted to pointers
+def should_convert_struct(layout_calculator, struct_name, max_by_value_size, convert_sysv_memory):
+    layout = layout_calculator.get_named_type_layout(struct_name)
+    if layout is None:
+        print("Layout of " + struct_name + " could not be determined, so leaving arguments of that type passed by "
+              "value")
+        return False
+    if (max_by_value_size is not None) and (layout.size > max_by_value_size):
+        return True
+    if convert_sysv_memory and (struct_layout.classify_sysv_x86_64(layout) == "MEMORY"):
+        return True
+    return False
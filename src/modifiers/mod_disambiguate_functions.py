@@ -3,6 +3,51 @@ from src import utils
 import sys
 
 
+# Given a list of suffix lists (one per function), figure out the minimal number of suffixes that needs to be used
+# to differentiate all of the functions (or the maximum number of suffixes if they can't be differentiated)
+def get_num_suffixes_needed(suffix_lists):
+    max_suffixes = 0  # Maximum number of suffixes
+    for suffixes in suffix_lists:
+        max_suffixes = max(max_suffixes, len(suffixes))
+
+    # Two suffix lists clash when truncated to N suffixes if N is no more than the length of their common prefix
+    # (or if they are identical), so we need one more suffix than the longest prefix shared by any two lists.
+    # We find that by giving every prefix an ID (built up from the ID of the prefix one suffix shorter), and
+    # counting how many lists share each one.
+    prefix_ids = {}
+    prefix_counts = {}
+    longest_shared_prefix = 0
+    have_identical_lists = False
+    for suffixes in suffix_lists:
+        prefix_id = prefix_ids.setdefault((), 0)
+        prefix_counts[prefix_id] = prefix_counts.get(prefix_id, 0) + 1
+        for length, suffix in enumerate(suffixes, 1):
+            prefix_id = prefix_ids.setdefault((prefix_id, suffix), len(prefix_ids))
+            prefix_counts[prefix_id] = prefix_counts.get(prefix_id, 0) + 1
+            if prefix_counts[prefix_id] > 1:
+                longest_shared_prefix = max(longest_shared_prefix, length)
+        # Track the ID of each complete list as well, so we can spot identical ones
+        prefix_id = prefix_ids.setdefault((prefix_id, None), len(prefix_ids))
+        prefix_counts[prefix_id] = prefix_counts.get(prefix_id, 0) + 1
+        if prefix_counts[prefix_id] > 1:
+            have_identical_lists = True
+
+    if have_identical_lists:
+        return max(max_suffixes, 1)
+
+    num_suffixes_needed = max(1, min(longest_shared_prefix + 1, max_suffixes))
+
+    # The suffixes get concatenated, so in rare cases lists that differ can still produce the same name (e.g. "A" +
+    # "BC" and "AB" + "C"), in which case we need to keep adding suffixes until the names are distinct
+    while num_suffixes_needed < max_suffixes:
+        potential_names = set(''.join(suffixes[:num_suffixes_needed]) for suffixes in suffix_lists)
+        if len(potential_names) == len(suffix_lists):
+            break
+        num_suffixes_needed += 1
+
+    return num_suffixes_needed
+
+
 # This modifier finds any overloaded functions with identical names and disambiguates them
 # name_suffix_remaps gives a dictionary remapping type names for types that have awkward or unwanted names
 # functions_to_ignore gives a list of functions that are known not to need disambiguation (but look like they do)
@@ -14,9 +59,11 @@ import sys
 def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename_everything, type_priorities):
     # Find all functions with name collisions
 
+    all_functions = dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration)
+
     functions_by_name = {}  # Contains lists of functions
 
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+    for function in all_functions:
         if function.name not in functions_by_name:
             # Create list
             functions_by_name[function.name] = [function]
@@ -24,6 +71,22 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
             # Add to list
             functions_by_name[function.name].append(function)
 
+    # Render each argument type once, and build a signature for each function as a tuple of canonical type IDs
+    # (so that argument lists can be compared without re-rendering the types)
+
+    type_ids = {}  # Canonical type ID for each distinct argument type string
+    arg_type_names = {}  # Argument type strings for each function
+    signatures = {}  # Tuple of argument type IDs for each function
+
+    for functions in functions_by_name.values():
+        if len(functions) < 2:
+            continue  # We only need signatures for overloaded functions
+
+        for function in functions:
+            names = [("..." if arg.is_varargs else arg.arg_type.to_c_string()) for arg in function.arguments]
+            arg_type_names[function] = names
+            signatures[function] = tuple(type_ids.setdefault(name, len(type_ids)) for name in names)
+
     # Resolve collisions
 
     for functions in functions_by_name.values():
@@ -43,18 +106,9 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
 
         # Count the number of arguments that are identical across all overloads
         num_common_args = 0
-        finished_common_arguments = False
-        while num_common_args < len(functions[0].arguments):
-            for function in functions:
-                if num_common_args >= len(function.arguments):
-                    finished_common_arguments = True
-                    break  # Ran out of arguments
-                if function.arguments[num_common_args].arg_type.to_c_string() != \
-                        functions[0].arguments[num_common_args].arg_type.to_c_string():
-                    finished_common_arguments = True
-                    break  # Arguments don't match
-            if finished_common_arguments:
-                break
+        for arg_type_ids in zip(*[signatures[function] for function in functions]):
+            if len(set(arg_type_ids)) > 1:
+                break  # Arguments don't match
             num_common_args += 1
 
         # Find the function in the set with the smallest argument count, using the sum of the priority of the arguments
@@ -65,8 +119,7 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
         for function in functions:
             if len(function.arguments) <= lowest_arg_count:
                 function_priority = 0
-                for arg in function.arguments:
-                    arg_type = arg.arg_type.to_c_string()
+                for arg_type in arg_type_names[function]:
                     if arg_type in type_priorities:
                         function_priority += type_priorities[arg_type]
 
@@ -92,7 +145,7 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
             for i in range(num_common_args, len(function.arguments)):
                 if not function.arguments[i].is_varargs:  # Don't try and append a suffix for ... arguments
                     # Check to see if the full type name is in the remap list, and if so remap it
-                    full_name = function.arguments[i].arg_type.to_c_string()
+                    full_name = arg_type_names[function][i]
 
                     if full_name in name_suffix_remaps:
                         suffix_name = name_suffix_remaps[full_name]
@@ -105,7 +158,7 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
                         # Capitalise the first letter of the name
                         suffix_name = suffix_name[0].upper() + suffix_name[1:]
                         # Slight bodge to differentiate pointers
-                        if function.arguments[i].arg_type.to_c_string().endswith('*'):
+                        if full_name.endswith('*'):
                             suffix_name += "Ptr"
 
                     # Semi-hack - "Ref" is rarely meaningful as a disambiguator and just clutters things, so don't
@@ -117,28 +170,7 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
         # Optimise the suffix lists - we want the shortest version that differentiates the functions in question, so
         # figure out the minimal number of suffixes that achieves that
 
-        max_suffixes = 0  # Maximum number of suffixes
-        for function in functions:
-            max_suffixes = max(max_suffixes, len(suffixes_by_function[function]))
-
-        num_suffixes_needed = 1
-        while num_suffixes_needed < max_suffixes:
-            clash_exists = False
-            existing_names = {}
-            for function in functions:
-                suffixes = suffixes_by_function[function]
-                if len(suffixes) > num_suffixes_needed:
-                    suffixes = suffixes[:num_suffixes_needed]
-                potential_name = ''.join(suffixes)
-                if potential_name in existing_names:
-                    clash_exists = True
-                    break
-                existing_names[potential_name] = function
-
-            if clash_exists:
-                num_suffixes_needed += 1
-            else:
-                break
+        num_suffixes_needed = get_num_suffixes_needed([suffixes_by_function[function] for function in functions])
 
         # Apply the optimised names
 
@@ -158,17 +190,26 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
                 else:
                     functions[1].name += "_Const"
 
-        # Verify we now have no name clashes
-        # (note that this only checks that we resolved the collisions between the functions that were initially
-        # overloaded, and doesn't check for the possibility that a previously non-colliding function now collides)
+    # Verify we now have no name clashes anywhere (this catches both collisions between the functions that were
+    # initially overloaded and the possibility that a previously non-colliding function now collides with a renamed
+    # one)
 
-        new_names = {}
+    new_functions_by_name = {}
 
-        for function in functions:
-            if function.name in new_names:
-                print("Unresolved collision between these functions:")
-                for print_function in functions:
-                    print(print_function.name + " : " + str(print_function))
-                raise Exception("Unresolved function name collision")
+    for function in all_functions:
+        new_functions_by_name.setdefault(function.name, []).append(function)
+
+    for functions in new_functions_by_name.values():
+        if len(functions) < 2:
+            continue
+
+        if functions[0].name in functions_to_ignore:
+            continue
+
+        if (len(functions) == 2) and utils.are_elements_mutually_exclusive(functions[0], functions[1]):
+            continue
 
-            new_names[function.name] = function
+        print("Unresolved collision between these functions:")
+        for print_function in functions:
+            print(print_function.name + " : " + str(print_function))
+        raise Exception("Unresolved function name collision")
@@ -27,259 +27,349 @@ def extract_template_parameter(template_name, tokens):
     return None, -1, -1
 
 
+# Add any template references in the type given to the reference index, using order_key to record where the type
+# sits in the document (so that references can be processed in the order they appear)
+# The index is conservative - it records every name followed by a <, and users re-check the type with
+# extract_template_parameter() before acting on it
+def add_type_to_reference_index(reference_index, type_element, order_key):
+    tokens = type_element.tokens
+    names_seen = set()
+    for i in range(0, len(tokens) - 3):
+        if tokens[i + 1].value == '<':
+            name = tokens[i].value
+            if name not in names_seen:
+                names_seen.add(name)
+                reference_index.setdefault(name, []).append((order_key, type_element))
+
+
+# Walk the entire DOM once, building an index of template references (keyed by the name of the template being
+# referenced) and recording the position of every template in document order
+# Returns the reference index and a dictionary mapping each template to a (first, last) tuple giving the document
+# positions its subtree occupies
+def build_reference_index(dom_root):
+    reference_index = {}
+    template_extents = {}
+    position = 0
+
+    def walker(element):
+        nonlocal position
+        first_position = position
+        position += 1
+        if isinstance(element, code_dom.DOMType):
+            add_type_to_reference_index(reference_index, element, (first_position,))
+        for child_list in element.get_child_lists():
+            for child in child_list:
+                walker(child)
+        if isinstance(element, code_dom.DOMTemplate):
+            template_extents[element] = (first_position, position - 1)
+
+    walker(dom_root)
+
+    return reference_index, template_extents
+
+
+# Get the references to template_name that are still part of the DOM, sorted into document order
+def get_live_references(dom_root, reference_index, template_name):
+    references = [reference for reference in reference_index.get(template_name, [])
+                  if reference[1].is_descendant_of(dom_root)]
+    references.sort(key=lambda reference: reference[0])
+    return references
+
+
 # This modifier finds templates and flattens them, creating concrete classes/functions for each required instantiation
 # It currently only supports templates with a single type parameter
 # custom_type_fudges can be used to supply strings which will be matched and replaced in modified types within the
 # instantiation as a way of working around some issues with the subtleties of template expansion rules (notably
 # "const T*" with T as "Blah *" expanding to "Blah* const*" rather than the lexical substitution "const Blah**")
+# Template references are indexed once up-front, and each template instantiation adds the references it contains to
+# the index. Instantiating one template can create new references to another (e.g. ImPool<T> contains an ImVector<T>),
+# so templates that gained new references are kept and processed again as the next nesting level.
 def apply(dom_root, custom_type_fudges={}):
-    while True:
-        keep_templates = apply_single_iteration(dom_root, custom_type_fudges)
-        if len(keep_templates) == 0:
-            break
-
-# Flattens one nesting level of templates. 
-# Returnslist of template types that still have non-flattened usages.
-def apply_single_iteration(dom_root, custom_type_fudges) -> list[code_dom.DOMTemplate]:
-    keep_templates = []
-
-    # Iterate through all templates
-    for template in dom_root.list_all_children_of_type(code_dom.DOMTemplate):
-        templated_obj = template.get_templated_object()
-        template_name = templated_obj.name
-
-        # Figure out the template parameter name
-        template_parameter_name = None
-        for token in template.template_parameter_tokens:
-            if token.value != 'typename':
-                if template_parameter_name is not None:
-                    raise Exception(
-                        "Template " + str(template) +
-                        " appears to have more than one parameter (which is not currently supported)")
-                template_parameter_name = token.value
-
-        # Instantiation parameters as they exist in the DOM at present
-        instantiation_parameters = []
-        # Instantiation parameters in their implementation form (if that exists, None if not)
-        implementation_instantiation_parameters = []
-
-        # Find all references to this
-        for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
-            # Don't look for instantiations inside the template itself (technically this is wrong, but it simplifies
-            # things for now as otherwise we'd need to be able to tell the difference between template parameters
-            # and concrete types)
-            if type_element.is_descendant_of(template):
-                continue
-
-            instantiation_parameter, _, _ = extract_template_parameter(template_name, type_element.tokens)
-
-            if instantiation_parameter is not None:
-                if instantiation_parameter not in instantiation_parameters:
-                    instantiation_parameters.append(instantiation_parameter)
-
-                    #print("Template " + template_name + " referenced in " + str(type_element) + " with parameter " +
-                    #     instantiation_parameter)
-
-                    # Figure out what the implementation parameter is and record that
-                    implementation_parameter = None
-                    if type_element.original_name_override is not None:
-                        opening_bracket = type_element.original_name_override.index('<')
-                        closing_bracket = type_element.original_name_override.index('>')
-                        if (opening_bracket >= 0) and (closing_bracket > opening_bracket):
-                            implementation_parameter = \
-                                type_element.original_name_override[opening_bracket + 1:closing_bracket]
-
-                    implementation_instantiation_parameters.append(implementation_parameter)
-
-        # Reverse so that when we add these to the DOM (which in turn reverses the order), they end up in the original
-        # order they were seen
-        instantiation_parameters.reverse()
-        implementation_instantiation_parameters.reverse()
-
-        # Duplicate the template for each instantiation
-
-        instantiation_names = []
-
-        for (instantiation_parameter, implementation_instantiation_parameter) in \
-                zip(instantiation_parameters, implementation_instantiation_parameters):
-            instantiation = templated_obj.clone()
-            instantiation.parent = None
+    reference_index, template_extents = build_reference_index(dom_root)
+
+    # Templates in document order
+    templates = sorted(template_extents.keys(), key=lambda template: template_extents[template][0])
+
+    # Counter used to order instantiations inserted at the same point (later insertions appear first)
+    insertion_counter = [0]
+
+    while len(templates) > 0:
+        # Templates for each class name, so we can quickly find which templates new references need
+        templates_by_class_name = {}
+        for template in templates:
+            template_type = template.children[0]
+            if isinstance(template_type, code_dom.DOMClassStructUnion):
+                templates_by_class_name.setdefault(template_type.name, []).append(template)
+
+        keep_templates = []
+
+        for template in templates:
+            flatten_template(dom_root, template, custom_type_fudges, reference_index, template_extents,
+                             templates_by_class_name, keep_templates, insertion_counter)
+
+        for template in templates:
+            # Remove the original template
+            if template not in keep_templates:
+                template.parent.remove_child(template)
+
+        # Anything we kept needs processing again to deal with the references that have been created to it
+        templates = sorted(keep_templates, key=lambda template: template_extents[template][0])
+
+
+# Flattens a single template, creating instantiations for all of the references to it that currently exist.
+# Any templates which have had new (as-yet unflattened) references created are added to keep_templates.
+def flatten_template(dom_root, template, custom_type_fudges, reference_index, template_extents,
+                     templates_by_class_name, keep_templates, insertion_counter):
+    templated_obj = template.get_templated_object()
+    template_name = templated_obj.name
+
+    # Figure out the template parameter name
+    template_parameter_name = None
+    for token in template.template_parameter_tokens:
+        if token.value != 'typename':
+            if template_parameter_name is not None:
+                raise Exception(
+                    "Template " + str(template) +
+                    " appears to have more than one parameter (which is not currently supported)")
+            template_parameter_name = token.value
+
+    # Instantiation parameters as they exist in the DOM at present
+    instantiation_parameters = []
+    # Instantiation parameters in their implementation form (if that exists, None if not)
+    implementation_instantiation_parameters = []
+
+    # Find all references to this
+    for _, type_element in get_live_references(dom_root, reference_index, template_name):
+        # Don't look for instantiations inside the template itself (technically this is wrong, but it simplifies
+        # things for now as otherwise we'd need to be able to tell the difference between template parameters
+        # and concrete types)
+        if type_element.is_descendant_of(template):
+            continue
+
+        instantiation_parameter, _, _ = extract_template_parameter(template_name, type_element.tokens)
+
+        if instantiation_parameter is not None:
+            if instantiation_parameter not in instantiation_parameters:
+                instantiation_parameters.append(instantiation_parameter)
+
+                #print("Template " + template_name + " referenced in " + str(type_element) + " with parameter " +
+                #     instantiation_parameter)
+
+                # Figure out what the implementation parameter is and record that
+                implementation_parameter = None
+                if type_element.original_name_override is not None:
+                    opening_bracket = type_element.original_name_override.index('<')
+                    closing_bracket = type_element.original_name_override.index('>')
+                    if (opening_bracket >= 0) and (closing_bracket > opening_bracket):
+                        implementation_parameter = \
+                            type_element.original_name_override[opening_bracket + 1:closing_bracket]
+
+                implementation_instantiation_parameters.append(implementation_parameter)
+
+    # Reverse so that when we add these to the DOM (which in turn reverses the order), they end up in the original
+    # order they were seen
+    instantiation_parameters.reverse()
+    implementation_instantiation_parameters.reverse()
+
+    # Duplicate the template for each instantiation
+
+    instantiation_names = {}
+
+    for (instantiation_parameter, implementation_instantiation_parameter) in \
+            zip(instantiation_parameters, implementation_instantiation_parameters):
+        instantiation = templated_obj.clone()
+        instantiation.parent = None
+
+        # We need to set up an override so that instead of using the original template typename the
+        # implementation uses the name with parameter substitution doe
+        if instantiation.original_name_override is None:
+            instantiation.original_name_override = instantiation.get_fully_qualified_name()
+
+        # The implementation name should use the implementation version of the instantiation parameter if
+        # possible, so we get "ImVector<ImGuiTextFilter::TextRange>" instead of
+        # "ImVector<ImGuiTextFilter_TextRange>"
+        instantiation.original_name_override += "<" + \
+                                                (implementation_instantiation_parameter or
+                                                 instantiation_parameter) + ">"
+
+        # Generate a new name for the instantiation
+        instantiation.name += "_" + utils.sanitise_name_for_identifier(instantiation_parameter)
+        instantiation_names[instantiation_parameter] = instantiation.name
+
+        # Replace all occurrences of the type parameter with the instantiation parameter
+
+        for element in instantiation.list_all_children_of_type(code_dom.DOMType):
+            # Look for the THING preceeding the first LTRIANGLE
+            element_type_name = None
+            for token_index, token in enumerate(element.unmodified_element.tokens):
+                if token.type == 'LTRIANGLE':
+                    thing_token = element.unmodified_element.tokens[token_index - 1]
+                    if thing_token.type == 'THING':
+                        element_type_name = thing_token.value
 
-            # We need to set up an override so that instead of using the original template typename the
-            # implementation uses the name with parameter substitution doe
-            if instantiation.original_name_override is None:
-                instantiation.original_name_override = instantiation.get_fully_qualified_name()
+            element_instantiation_parameter, _, _ = extract_template_parameter(element_type_name, element.unmodified_element.tokens)
+
+            # Check if template is not instantiated
+            if template_parameter_name == element_instantiation_parameter:
 
-            # The implementation name should use the implementation version of the instantiation parameter if
-            # possible, so we get "ImVector<ImGuiTextFilter::TextRange>" instead of
-            # "ImVector<ImGuiTextFilter_TextRange>"
-            instantiation.original_name_override += "<" + \
-                                                    (implementation_instantiation_parameter or
-                                                     instantiation_parameter) + ">"
+                # Replace the type with a template instance
+
+                original_element = element
+                element = element.unmodified_element.clone()
+
+                # Replace the template parameter with type instance
+
+                for tok in element.tokens:
+                    if tok.value == element_instantiation_parameter:
+                        tok.value = instantiation_parameter
 
-            # Generate a new name for the instantiation
-            instantiation.name += "_" + utils.sanitise_name_for_identifier(instantiation_parameter)
-            instantiation_names.append(instantiation.name)
+                # Replace the original element
+
+                original_element.parent.replace_child(original_element, [element])
+                element.parent.field_type = element
 
-            # Replace all occurrences of the type parameter with the instantiation parameter
+                # Make sure the element type's template is not deleted yet
 
-            for element in instantiation.list_all_children_of_type(code_dom.DOMType):
-                # Look for the THING preceeding the first LTRIANGLE
-                element_type_name = None
-                for token_index, token in enumerate(element.unmodified_element.tokens):
-                    if token.type == 'LTRIANGLE':
-                        thing_token = element.unmodified_element.tokens[token_index - 1]
-                        if thing_token.type == 'THING':
-                            element_type_name = thing_token.value
+                for element_template in templates_by_class_name.get(element_type_name, []):
+                    if not element_template in keep_templates:
+                        keep_templates.append(element_template)
 
-                element_instantiation_parameter, _, _ = extract_template_parameter(element_type_name, element.unmodified_element.tokens)
-
-                # Check if template is not instantiated
-                if template_parameter_name == element_instantiation_parameter:
-
-                    # Replace the type with a template instance
-
-                    original_element = element
-                    element = element.unmodified_element.clone()
-
-                    # Replace the template parameter with type instance
-
-                    for tok in element.tokens:
-                        if tok.value == element_instantiation_parameter:
-                            tok.value = instantiation_parameter
-
-                    # Replace the original element
-
-                    original_element.parent.replace_child(original_element, [element])
-                    element.parent.field_type = element
-
-                    # Make sure the element type's template is not deleted yet
-
-                    for element_template in dom_root.list_all_children_of_type(code_dom.DOMTemplate):
-                        element_template_type = element_template.children[0]
-                        if isinstance(element_template_type, code_dom.DOMClassStructUnion):
-                            if element_template_type.name == element_type_name:
-                                if not element_template in keep_templates:
-                                    keep_templates.append(element_template)
-
-                    # At this point, we've created another template instance type,
-                    # but it itself is not flattened yet. We'll need another iteration
-                    # to resolve the newly created type.
-                    continue
-
-                modified_anything = False
+                # At this point, we've created another template instance type,
+                # but it itself is not flattened yet. We'll need another iteration
+                # to resolve the newly created type.
+                continue
 
-                for i in range(0, len(element.tokens)):
-                    if element.tokens[i].value == template_parameter_name:
-                        element.tokens[i].value = instantiation_parameter
-                        modified_anything = True
-
-                if modified_anything:
-                    # Do the same for any original name overrides, using the original override version of
-                    # the parameter
-                    if implementation_instantiation_parameter is not None:
-                        if element.original_name_override is None:
-                            write_context = code_dom.WriteContext()
-                            write_context.for_implementation = True
-                            element.original_name_override = element.to_c_string(write_context)
-                            element.original_name_override = element.original_name_override \
-                                .replace(instantiation_parameter,
-                                         implementation_instantiation_parameter)
-                        else:
-                            # This is kinda dubious because parameter names can be things like T, which will then match
-                            # *any* T in the type, but for now I'm banking on that not happening as template types
-                            # aren't very complicated and have little aside from the odd "const", * or & on them.
+            modified_anything = False
+
+            for i in range(0, len(element.tokens)):
+                if element.tokens[i].value == template_parameter_name:
+                    element.tokens[i].value = instantiation_parameter
+                    modified_anything = True
+
+            if modified_anything:
+                # Do the same for any original name overrides, using the original override version of
+                # the parameter
+                if implementation_instantiation_parameter is not None:
+                    if element.original_name_override is None:
+                        write_context = code_dom.WriteContext()
+                        write_context.for_implementation = True
+                        element.original_name_override = element.to_c_string(write_context)
+                        element.original_name_override = element.original_name_override \
+                            .replace(instantiation_parameter,
+                                     implementation_instantiation_parameter)
+                    else:
+                        # This is kinda dubious because parameter names can be things like T, which will then match
+                        # *any* T in the type, but for now I'm banking on that not happening as template types
+                        # aren't very complicated and have little aside from the odd "const", * or & on them.
+                        element.original_name_override = element.original_name_override \
+                            .replace(template_parameter_name,
+                                     implementation_instantiation_parameter)
+
+                # Apply any custom fudges
+
+                full_type = element.to_c_string()
+
+                for fudge_key in custom_type_fudges.keys():
+                    if fudge_key in full_type:
+                        full_type = full_type.replace(fudge_key, custom_type_fudges[fudge_key])
+
+                        # Figure out if any of our source type had reference->pointer conversions done on it
+                        num_converted_references = 0
+                        for tok in element.tokens:
+                            if hasattr(tok, "was_reference") and tok.was_reference:
+                                num_converted_references += 1
+
+                        # Supporting this wouldn't be horrifically difficult, but right now it's hard due to the
+                        # way we collapse all the tokens into one here. If this proves necessary then it's probably
+                        # a question of either redoing fudges to use token sequences, or adding something to
+                        # re-parse the fudged string into tokens and then map the was_reference flag across.
+                        if num_converted_references > 1:
+                            raise Exception("Fudged type has more than one converted reference - this is not "
+                                            "supported")
+
+                        element.tokens = utils.create_tokens_for_type(full_type)
+
+                        if num_converted_references > 0:
+                            element.tokens[0].was_reference = True
+
+                        if element.original_name_override is not None:
                             element.original_name_override = element.original_name_override \
-                                .replace(template_parameter_name,
-                                         implementation_instantiation_parameter)
-
-                    # Apply any custom fudges
-
-                    full_type = element.to_c_string()
-
-                    for fudge_key in custom_type_fudges.keys():
-                        if fudge_key in full_type:
-                            full_type = full_type.replace(fudge_key, custom_type_fudges[fudge_key])
-
-                            # Figure out if any of our source type had reference->pointer conversions done on it
-                            num_converted_references = 0
-                            for tok in element.tokens:
-                                if hasattr(tok, "was_reference") and tok.was_reference:
-                                    num_converted_references += 1
-
-                            # Supporting this wouldn't be horrifically difficult, but right now it's hard due to the
-                            # way we collapse all the tokens into one here. If this proves necessary then it's probably
-                            # a question of either redoing fudges to use token sequences, or adding something to
-                            # re-parse the fudged string into tokens and then map the was_reference flag across.
-                            if num_converted_references > 1:
-                                raise Exception("Fudged type has more than one converted reference - this is not "
-                                                "supported")
-
-                            element.tokens = utils.create_tokens_for_type(full_type)
-
-                            if num_converted_references > 0:
-                                element.tokens[0].was_reference = True
-
-                            if element.original_name_override is not None:
-                                element.original_name_override = element.original_name_override \
-                                    .replace(fudge_key, custom_type_fudges[fudge_key])
-
-            # Create a comment to note where this came from
-            comment = code_dom.DOMComment()
-            comment.comment_text = "// Instantiation of " + template_name + "<" + instantiation_parameter + ">"
-
-            # Optionally insert new struct instances into the DOM at the very end to avoid problems with referencing
-            # things that aren't declared yet at the point the template appears
-            place_instantiation_at_end = False
-
-            if place_instantiation_at_end:
-                # Create a forward-declaration of the template at the point it was originally declared
-
-                declaration_comment = code_dom.DOMComment()
-                declaration_comment.comment_text = "// Forward declaration of " + template_name + \
-                                                   "<" + instantiation_parameter + ">"
-
-                declaration = instantiation.clone()
-                declaration.children.clear()
-                declaration.is_forward_declaration = True
-
-                template.parent.insert_after_child(template, [declaration_comment, declaration])
-
-                # Add at end of file
-                dom_root.add_children([code_dom.DOMBlankLines(1),
-                                       comment,
-                                       code_dom.DOMBlankLines(1),
-                                       instantiation])
-            else:
-                # Insert new instance at point of template
-                template.parent.insert_after_child(template,
-                                                   [code_dom.DOMBlankLines(1),
-                                                    comment,
-                                                    code_dom.DOMBlankLines(1),
-                                                    instantiation])
-
-        # Replace any references to the original template types with the new instantiations
-        for (instantiation_parameter, instantiation_name) in zip(instantiation_parameters, instantiation_names):
-            for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
-                element_instantiation_parameter, first_token, last_token = \
-                    extract_template_parameter(template_name, type_element.tokens)
-                if element_instantiation_parameter == instantiation_parameter:
-                    # Set the original (parameterised) name as the override so it gets used for the
-                    # implementation code
-                    write_context = code_dom.WriteContext()
-                    write_context.use_original_names = True
-                    type_element.original_name_override = type_element.to_c_string(write_context)
-                    # ...then replace the main name with our instance name
-
-                    # -2 because first_token is the parameter, so we need to step back over the < and the template name
-                    first_token_of_reference = first_token - 2
-
-                    type_element.tokens[first_token_of_reference].value = instantiation_name
-                    del type_element.tokens[first_token_of_reference + 1:last_token + 1]  # +1 to eat the closing >
-
-    for template in dom_root.list_all_children_of_type(code_dom.DOMTemplate):           
-        # Remove the original template
-        if not template in keep_templates:
-            template.parent.remove_child(template)
-    
-    return keep_templates
+                                .replace(fudge_key, custom_type_fudges[fudge_key])
+
+        # Create a comment to note where this came from
+        comment = code_dom.DOMComment()
+        comment.comment_text = "// Instantiation of " + template_name + "<" + instantiation_parameter + ">"
+
+        # Optionally insert new struct instances into the DOM at the very end to avoid problems with referencing
+        # things that aren't declared yet at the point the template appears
+        place_instantiation_at_end = False
+
+        insertion_counter[0] += 1
+
+        if place_instantiation_at_end:
+            # Create a forward-declaration of the template at the point it was originally declared
+
+            declaration_comment = code_dom.DOMComment()
+            declaration_comment.comment_text = "// Forward declaration of " + template_name + \
+                                               "<" + instantiation_parameter + ">"
+
+            declaration = instantiation.clone()
+            declaration.children.clear()
+            declaration.is_forward_declaration = True
+
+            template.parent.insert_after_child(template, [declaration_comment, declaration])
+
+            # Add at end of file
+            dom_root.add_children([code_dom.DOMBlankLines(1),
+                                   comment,
+                                   code_dom.DOMBlankLines(1),
+                                   instantiation])
+
+            # Instances added at the end appear after everything else, in the order they were added
+            instantiation_order_key = (float('inf'), insertion_counter[0])
+        else:
+            # Insert new instance at point of template
+            template.parent.insert_after_child(template,
+                                               [code_dom.DOMBlankLines(1),
+                                                comment,
+                                                code_dom.DOMBlankLines(1),
+                                                instantiation])
+
+            # Instances inserted at the point of the template appear after the template itself, but before any
+            # instances that were inserted there previously
+            instantiation_order_key = (template_extents[template][1], 1, -insertion_counter[0])
+
+        # Index any template references in the new instance, so that they get picked up when the templates they
+        # refer to are (next) processed
+        for type_index, element in enumerate(instantiation.list_all_children_of_type(code_dom.DOMType)):
+            add_type_to_reference_index(reference_index, element, instantiation_order_key + (type_index,))
+
+    # Replace any references to the original template types with the new instantiations, pruning any references
+    # that have been replaced or are no longer in the DOM from the index as we go
+    remaining_references = []
+
+    for reference in get_live_references(dom_root, reference_index, template_name):
+        type_element = reference[1]
+        element_instantiation_parameter, first_token, last_token = \
+            extract_template_parameter(template_name, type_element.tokens)
+        if element_instantiation_parameter in instantiation_names:
+            # Set the original (parameterised) name as the override so it gets used for the
+            # implementation code
+            write_context = code_dom.WriteContext()
+            write_context.use_original_names = True
+            type_element.original_name_override = type_element.to_c_string(write_context)
+            # ...then replace the main name with our instance name
+
+            # -2 because first_token is the parameter, so we need to step back over the < and the template name
+            first_token_of_reference = first_token - 2
+
+            type_element.tokens[first_token_of_reference].value = instantiation_names[element_instantiation_parameter]
+            del type_element.tokens[first_token_of_reference + 1:last_token + 1]  # +1 to eat the closing >
+
+            # Keep the reference if the type refers to this template more than once
+            element_instantiation_parameter, _, _ = extract_template_parameter(template_name, type_element.tokens)
+
+        if element_instantiation_parameter is not None:
+            remaining_references.append(reference)
+
+    reference_index[template_name] = remaining_references
@@ -0,0 +1,128 @@
+from src import code_dom
+from src import symbol_mangling
+from src import utils
+
+# Definition of the CIMGUI_DIRECT_ALIAS() macro used on marked functions
+# (when compiling as C++ it always expands to nothing, so that cimgui.cpp still defines the wrapper functions)
+direct_alias_macro_definition = """#ifndef CIMGUI_DIRECT_ALIAS
+#if (defined(__GNUC__) || defined(__clang__)) && !defined(_WIN32) && !defined(__cplusplus) && !defined(CIMGUI_NO_DIRECT_ALIASES)
+#define CIMGUI_DIRECT_ALIAS_STRINGIFY_(_X)   #_X
+#define CIMGUI_DIRECT_ALIAS_STRINGIFY(_X)    CIMGUI_DIRECT_ALIAS_STRINGIFY_(_X)
+#define CIMGUI_DIRECT_ALIAS(_SYMBOL)         __asm__(CIMGUI_DIRECT_ALIAS_STRINGIFY(__USER_LABEL_PREFIX__) _SYMBOL)
+#else
+#define CIMGUI_DIRECT_ALIAS(_SYMBOL)
+#endif
+#endif
+"""
+
+direct_alias_macro_comments = [
+    "// Functions marked with CIMGUI_DIRECT_ALIAS() have exactly the same ABI as the original C++ function, so C code",
+    "// compiled with GCC or Clang calls the C++ function directly rather than going through the wrapper in cimgui.cpp.",
+    "// Define CIMGUI_NO_DIRECT_ALIASES to always use the wrappers (for example if Dear ImGui was built with a compiler",
+    "// that does not use the Itanium C++ ABI, or with a different configuration)."
+]
+
+
+# This modifier finds functions where the C version has the same ABI as the original C++ function (so the function
+# stub does nothing but forward the arguments), and marks them with the symbol name of the C++ function so that C
+# callers can use that directly (see symbol_mangling.py)
+def apply(dom_root):
+    mangler = symbol_mangling.SymbolMangler(dom_root.unmodified_element)
+
+    first_marked_functions = {}  # The first marked function in each header file, indexed by header
+
+    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+        symbol = get_direct_alias_symbol(function, mangler)
+        if symbol is None:
+            continue
+
+        function.direct_alias_symbol = symbol
+        header = utils.find_nearest_parent_of_type(function, code_dom.DOMHeaderFile)
+        if header not in first_marked_functions:
+            first_marked_functions[header] = function
+
+    # Add the definition of CIMGUI_DIRECT_ALIAS() to each header before the first function that uses it
+    for header, first_marked_function in first_marked_functions.items():
+        definition = utils.create_preprocessor_if(direct_alias_macro_definition)
+        for define in definition.list_all_children_of_type(code_dom.DOMDefine):
+            define.exclude_from_metadata = True
+
+        comments = []
+        for comment_text in direct_alias_macro_comments:
+            comment = code_dom.DOMComment()
+            comment.comment_text = comment_text
+            comments.append(comment)
+        definition.attach_preceding_comments(comments)
+
+        # Insert this at the top level of the file, so that it isn't affected by any conditionals around the function
+        insert_point = first_marked_function
+        while insert_point.parent is not header:
+            insert_point = insert_point.parent
+        header.insert_before_child(insert_point, [definition])
+
+
+# Get the symbol that the C version of function can alias, or None if the function needs a stub
+def get_direct_alias_symbol(function, mangler):
+    if function.is_manual_helper or function.is_default_argument_helper or function.is_imstr_helper or \
+            function.is_unformatted_helper or function.is_constructor or function.is_destructor or \
+            (function.original_name_override is not None):
+        return None
+
+    # The original function needs to be a real (non-inline) function that is exported from Dear ImGui
+    original_function = function.unmodified_element
+    if (original_function is None) or not original_function.is_imgui_api or original_function.is_inline or \
+            (original_function.body is not None):
+        return None
+
+    arguments = function.arguments
+    if (function.original_class is not None) and not function.is_static:
+        arguments = arguments[1:]  # Self becomes the this pointer, which is passed in the same way
+
+    if len(arguments) != len(original_function.arguments):
+        return None
+
+    for argument, original_argument in zip(arguments, original_function.arguments):
+        if argument.is_varargs or argument.is_implicit_default or (argument.stub_call_value is not None) or \
+                (argument.is_array != original_argument.is_array):
+            return None
+        original_type = mangler.resolve_argument_type(original_argument, original_function)
+        if (original_type is None) or not is_abi_identical(argument.arg_type, original_type):
+            return None
+
+    if original_function.return_type is None:
+        return None
+    original_return_type = mangler.resolve_type(original_function.return_type, original_function)
+    if (original_return_type is None) or \
+            not is_abi_identical(function.return_type, original_return_type, allow_void=True):
+        return None
+
+    return mangler.get_function_symbol(original_function)
+
+
+# Check if a C type is passed in the same way as a resolved C++ type (see symbol_mangling.py)
+# References are passed as pointers, so a reference that was turned into a pointer is fine, but a reference to a
+# by-value struct that became a value is not
+def is_abi_identical(c_type, original_type, allow_void=False):
+    if (c_type is None) or isinstance(c_type, code_dom.DOMFunctionPointerType):
+        return False
+
+    indirections = 0
+    while original_type[0] in ("const", "pointer", "reference"):
+        if original_type[0] != "const":
+            indirections += 1
+        original_type = original_type[1]
+
+    if sum(1 for token in c_type.tokens if token.value == "*") != indirections:
+        return False
+
+    if indirections > 0:
+        return True  # Pointers are all passed the same way, whatever they point to
+
+    # Values need to be scalars (structs are passed differently if they are not trivially copyable in C++, and
+    # enums need to be the same size as in C)
+    if original_type[0] == "builtin":
+        return allow_void or (original_type[1] != "void")
+    if original_type[0] == "enum":
+        storage_type = original_type[2].storage_type
+        return (storage_type is None) or (storage_type.to_c_string() == "int")
+    return False
@@ -0,0 +1,28 @@
+from src import code_dom
+from src import preprocessor_expression
+
+
+# This modifier evaluates preprocessor conditionals using a set of known macro states (environment should be a
+# preprocessor_expression.PPDefineEnvironment), and flattens any that can be decided, keeping only the content that
+# would actually be compiled. Conditionals that depend on macros not in the environment are left untouched.
+def apply(dom_root, environment):
+    if environment.is_empty():
+        return
+
+    for conditional in dom_root.list_all_children_of_type(code_dom.DOMPreprocessorIf):
+        if not conditional.is_descendant_of(dom_root):
+            continue  # This was inside a conditional we already removed
+
+        result = preprocessor_expression.evaluate(conditional.get_condition_node(), environment)
+        if result is None:
+            continue  # Can't be decided
+
+        content_to_retain = conditional.children if result != 0 else conditional.else_children
+
+        if len(content_to_retain) > 0:
+            # Promote the retained content to the parent scope (any #elif clauses in it will get evaluated when we
+            # reach them later in the list)
+            conditional.parent.insert_after_child(conditional, list(content_to_retain))
+
+        # ...and remove the conditional itself
+        conditional.parent.remove_child(conditional)
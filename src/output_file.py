@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import locale
+import lzma
+import os
+import tempfile
+from src.code_dom.common import LineBuffer
+
+
+# An output file that is rendered in memory and only written to disk if its contents differ from what is already
+# there, so that unchanged outputs keep their modification time (and don't trigger rebuilds of anything that depends
+# on them). Use as a context manager in place of open(filename, "w").
+class OutputFile(LineBuffer):
+    # compression can be "gzip" or "xz" to compress the file contents (filename should include a suitable extension)
+    # binary should be set if bytes rather than text will be written (as with open(filename, "wb"))
+    def __init__(self, filename, compression=None, binary=False):
+        super().__init__()
+        self.filename = filename
+        self.compression = compression
+        self.binary = binary
+        self.changed = False  # Set when the file is closed, if the file on disk was (re)written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        # Don't write anything if generation failed part-way through
+        if exc_type is None:
+            self.close()
+        return False
+
+    # Get the data exactly as open(filename, "w") (or "wb" for binary files) would have written it, with any compression
+    # applied
+    def get_data(self):
+        if self.binary:
+            data = b"".join(self.chunks)
+        else:
+            text = self.getvalue()
+            if os.linesep != "\n":
+                text = text.replace("\n", os.linesep)
+            data = text.encode(locale.getpreferredencoding(False))
+
+        # Compression needs to be deterministic so that unchanged contents are detected as such (hence no timestamp)
+        if self.compression == "gzip":
+            data = gzip.compress(data, mtime=0)
+        elif self.compression == "xz":
+            data = lzma.compress(data, format=lzma.FORMAT_XZ)
+        elif self.compression is not None:
+            raise Exception("Unknown compression type " + self.compression)
+
+        return data
+
+    # Compare our contents with the existing file and replace it if they differ
+    def close(self):
+        data = self.get_data()
+
+        if not is_file_content_identical(self.filename, data):
+            write_file_atomically(self.filename, data)
+            self.changed = True
+
+
+# Returns the SHA-256 hash of a file's contents, or None if it cannot be read
+def get_file_hash(filename):
+    try:
+        with open(filename, "rb") as file:
+            return hashlib.sha256(file.read()).digest()
+    except OSError:
+        return None
+
+
+# Returns True if filename exists and contains exactly data
+def is_file_content_identical(filename, data):
+    try:
+        if os.path.getsize(filename) != len(data):
+            return False  # Quick-out without needing to hash anything
+    except OSError:
+        return False  # File doesn't exist (or can't be accessed)
+
+    return get_file_hash(filename) == hashlib.sha256(data).digest()
+
+
+# Write data to filename via a temporary file in the same directory that is then renamed over the target, so that
+# readers never see a partially-written file
+def write_file_atomically(filename, data):
+    directory = os.path.dirname(os.path.abspath(filename))
+
+    # Keep the permissions of the existing file, or use the defaults for a new one (mkstemp() creates files that
+    # only the owner can read)
+    try:
+        mode = os.stat(filename).st_mode & 0o777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    handle, temp_filename = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(filename) + ".",
+                                             suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.chmod(temp_filename, mode)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
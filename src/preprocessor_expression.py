@@ -0,0 +1,467 @@
+from enum import Enum
+import re
+
+
+# This parses preprocessor conditional expressions (the bit after #if/#elif) into a normalised tree of nodes.
+# Nodes are interned, so any two expressions that normalise to the same tree share the same node object (and ID),
+# and can be compared with a simple identity check.
+
+
+# The kinds of node that can appear in an expression
+class PPExpressionKind(Enum):
+    number = 0  # An integer literal (value is the integer value)
+    identifier = 1  # A macro name (value is the name)
+    defined = 2  # defined(X) (value is the macro name)
+    unary = 3  # A unary operator (value is the operator, operands contains the single operand)
+    binary = 4  # A binary operator (value is the operator, operands contains both operands)
+    logical = 5  # A chain of && or || (value is the operator, operands contains all the terms)
+    conditional = 6  # The ternary ?: operator (operands contains condition, true value and false value)
+    call = 7  # A function-like macro invocation we don't evaluate (value is the name and argument text)
+    unparsed = 8  # Something we couldn't parse (value is the expression text)
+
+
+# A single node in an expression tree
+# Nodes should only be created via intern_node(), and should be treated as immutable
+class PPExpressionNode:
+    def __init__(self, node_id, kind, value, operands):
+        self.id = node_id  # Unique ID for this node (stable for the lifetime of the process)
+        self.kind = kind
+        self.value = value
+        self.operands = operands  # Tuple of child nodes
+
+    # Interned nodes are shared, so copying one should just give back the same node
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __str__(self):
+        if self.kind == PPExpressionKind.number:
+            return str(self.value)
+        elif (self.kind == PPExpressionKind.identifier) or (self.kind == PPExpressionKind.unparsed):
+            return self.value
+        elif self.kind == PPExpressionKind.defined:
+            return "defined(" + self.value + ")"
+        elif self.kind == PPExpressionKind.unary:
+            return self.value + "(" + str(self.operands[0]) + ")"
+        elif self.kind == PPExpressionKind.conditional:
+            return "(" + " ? ".join(str(operand) for operand in self.operands[:2]) + " : " + \
+                str(self.operands[2]) + ")"
+        elif self.kind == PPExpressionKind.call:
+            return self.value[0] + "(" + self.value[1] + ")"
+        else:
+            return "(" + (" " + self.value + " ").join(str(operand) for operand in self.operands) + ")"
+
+
+# All the nodes we have created, indexed by (kind, value, operand IDs)
+interned_nodes = {}
+
+# Cache of parsed expressions, indexed by the tuple of token values they were parsed from
+parsed_expressions = {}
+
+
+# Get the interned node for the kind/value/operands given, creating it if it doesn't exist yet
+def intern_node(kind, value=None, operands=()):
+    key = (kind, value, tuple(operand.id for operand in operands))
+    node = interned_nodes.get(key)
+    if node is None:
+        node = PPExpressionNode(len(interned_nodes), kind, value, tuple(operands))
+        interned_nodes[key] = node
+    return node
+
+
+# Binary operators where the order of the operands doesn't matter
+commutative_operators = frozenset(['==', '!=', '+', '*', '&', '|', '^'])
+
+# Comparison operators that get rewritten as their mirror image (so "a > b" and "b < a" are the same node)
+mirrored_operators = {'>': '<', '>=': '<='}
+
+
+# Make a (normalised) binary operator node
+def make_binary(operator, left, right):
+    if operator in mirrored_operators:
+        operator = mirrored_operators[operator]
+        left, right = right, left
+    elif (operator in commutative_operators) and (right.id < left.id):
+        left, right = right, left
+    return intern_node(PPExpressionKind.binary, operator, (left, right))
+
+
+# Make a (normalised) && or || node - nested chains of the same operator get flattened, and since the order of terms
+# doesn't affect the result in a preprocessor expression, duplicate terms are removed and the remainder sorted
+def make_logical(operator, terms):
+    flattened_terms = {}
+    for term in terms:
+        if (term.kind == PPExpressionKind.logical) and (term.value == operator):
+            for sub_term in term.operands:
+                flattened_terms[sub_term.id] = sub_term
+        else:
+            flattened_terms[term.id] = term
+    if len(flattened_terms) == 1:
+        return next(iter(flattened_terms.values()))
+    return intern_node(PPExpressionKind.logical, operator,
+                       sorted(flattened_terms.values(), key=lambda term: term.id))
+
+
+# Make a node that negates the condition given (for use where only the truth of the result matters, so !!X is
+# treated as being the same as X)
+def make_not(node):
+    if (node.kind == PPExpressionKind.unary) and (node.value == '!'):
+        return node.operands[0]
+    return intern_node(PPExpressionKind.unary, '!', (node,))
+
+
+# Regular expression used to split expression text into tokens
+expression_token_regex = re.compile(r"""\s*(?:
+    (?P<number>0[xX][0-9A-Fa-f]+|[0-9]+)[uUlL]*|
+    (?P<character>'(?:\\.|[^'\\])+')|
+    (?P<string>"(?:\\.|[^"\\])*")|
+    (?P<identifier>[A-Za-z_][0-9A-Za-z_]*)|
+    (?P<operator>\|\||&&|==|!=|<=|>=|<<|>>|[!~+\-*/%<>&|^?:(),])
+    )""", re.VERBOSE)
+
+# Binary operator precedence (higher binds more tightly)
+binary_operator_precedence = {
+    '||': 1,
+    '&&': 2,
+    '|': 3,
+    '^': 4,
+    '&': 5,
+    '==': 6, '!=': 6,
+    '<': 7, '<=': 7, '>': 7, '>=': 7,
+    '<<': 8, '>>': 8,
+    '+': 9, '-': 9,
+    '*': 10, '/': 10, '%': 10
+}
+
+
+# Exception used internally to bail out of parsing expressions we don't understand
+class PPExpressionParseError(Exception):
+    pass
+
+
+# Simple recursive-descent parser for preprocessor expressions
+class PPExpressionParser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []  # List of (type, value) tuples
+        position = 0
+        while position < len(text):
+            match = expression_token_regex.match(text, position)
+            if match is None:
+                if text[position:].strip() == "":
+                    break  # Trailing whitespace
+                raise PPExpressionParseError("Unrecognised character in expression")
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        if self.next()[1] != value:
+            raise PPExpressionParseError("Expected " + value)
+
+    def parse(self):
+        node = self.parse_conditional()
+        if self.position != len(self.tokens):
+            raise PPExpressionParseError("Unexpected trailing tokens")
+        return node
+
+    def parse_conditional(self):
+        condition = self.parse_binary(1)
+        if self.peek()[1] != '?':
+            return condition
+        self.next()
+        true_value = self.parse_conditional()
+        self.expect(':')
+        false_value = self.parse_conditional()
+        return intern_node(PPExpressionKind.conditional, None, (condition, true_value, false_value))
+
+    def parse_binary(self, min_precedence):
+        left = self.parse_unary()
+        while True:
+            token_type, operator = self.peek()
+            precedence = binary_operator_precedence.get(operator) if token_type == 'operator' else None
+            if (precedence is None) or (precedence < min_precedence):
+                return left
+            self.next()
+            right = self.parse_binary(precedence + 1)
+            if (operator == '&&') or (operator == '||'):
+                left = make_logical(operator, [left, right])
+            else:
+                left = make_binary(operator, left, right)
+
+    def parse_unary(self):
+        token_type, value = self.peek()
+        if (token_type == 'operator') and (value in ['!', '~', '-', '+']):
+            self.next()
+            operand = self.parse_unary()
+            if value == '+':
+                return operand
+            if (value == '-') and (operand.kind == PPExpressionKind.number):
+                return intern_node(PPExpressionKind.number, -operand.value)
+            return intern_node(PPExpressionKind.unary, value, (operand,))
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token_type, value = self.next()
+        if token_type == 'number':
+            return intern_node(PPExpressionKind.number, int(value, 0) if not re.match(r'^0[0-7]+$', value)
+                               else int(value, 8))
+        elif token_type == 'character':
+            body = value[1:-1]
+            if len(body) == 1:
+                return intern_node(PPExpressionKind.number, ord(body))
+            return intern_node(PPExpressionKind.unparsed, value)
+        elif token_type == 'identifier':
+            if value == 'defined':
+                # defined X or defined(X)
+                if self.peek()[1] == '(':
+                    self.next()
+                    name_type, name = self.next()
+                    self.expect(')')
+                else:
+                    name_type, name = self.next()
+                if name_type != 'identifier':
+                    raise PPExpressionParseError("Expected identifier after defined")
+                return intern_node(PPExpressionKind.defined, name)
+            if self.peek()[1] == '(':
+                # A function-like macro (e.g. __has_include), which we record but don't attempt to understand
+                self.next()
+                depth = 1
+                arguments = []
+                while True:
+                    argument_type, argument = self.next()
+                    if argument_type is None:
+                        raise PPExpressionParseError("Unterminated macro arguments")
+                    if argument == '(':
+                        depth += 1
+                    elif argument == ')':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    arguments.append(argument)
+                return intern_node(PPExpressionKind.call, (value, " ".join(arguments)))
+            return intern_node(PPExpressionKind.identifier, value)
+        elif value == '(':
+            node = self.parse_conditional()
+            self.expect(')')
+            return node
+        raise PPExpressionParseError("Unexpected token in expression")
+
+
+# Parse expression text into an (interned) expression node
+def parse_expression_text(text):
+    try:
+        return PPExpressionParser(text).parse()
+    except (PPExpressionParseError, ValueError):
+        # We can't make sense of this, so just represent it as its (whitespace-normalised) text
+        return intern_node(PPExpressionKind.unparsed, " ".join(text.split()))
+
+
+# Get the (interned) expression node for a list of expression tokens
+# Each distinct token sequence is only parsed once
+def get_expression_node(tokens):
+    # Continuation markers and newlines are irrelevant to the meaning of the expression
+    token_values = tuple(token.value for token in tokens if (token.value != '\\') and (token.value.strip() != ""))
+    node = parsed_expressions.get(token_values)
+    if node is None:
+        # Note that some synthetic tokens contain more than one lexical token (e.g. "defined(X)"), so we work from
+        # the text rather than the token types here
+        node = parse_expression_text(" ".join(token_values))
+        parsed_expressions[token_values] = node
+    return node
+
+
+# Break a condition down into a list of (term, polarity) pairs that must all be true for it to be true
+def get_condition_terms(node):
+    if (node.kind == PPExpressionKind.logical) and (node.value == '&&'):
+        terms = node.operands
+    else:
+        terms = (node,)
+
+    result = []
+    for term in terms:
+        if (term.kind == PPExpressionKind.unary) and (term.value == '!'):
+            result.append((term.operands[0], False))
+        else:
+            result.append((term, True))
+    return result
+
+
+# Returns true if the two conditions given can never both be true at the same time
+# This is conservative, in that it only spots exclusions where one condition requires a term to be true and the other
+# requires it to be false (e.g. "defined(X) && !defined(Y)" vs "defined(Y)"), or where both require the same
+# macro to be equal to different values (e.g. "X == 1" vs "X == 2")
+def are_conditions_mutually_exclusive(condition_a, condition_b):
+    terms_a = get_condition_terms(condition_a)
+    terms_b = set(get_condition_terms(condition_b))
+
+    for term, polarity in terms_a:
+        if (term, not polarity) in terms_b:
+            return True
+
+    values_a = get_required_values(terms_a)
+    if len(values_a) > 0:
+        values_b = get_required_values(terms_b)
+        for name, value in values_a.items():
+            if (name in values_b) and (values_b[name] != value):
+                return True
+
+    return False
+
+
+# Get a dictionary of macro names to the integer values the terms given require them to have
+def get_required_values(terms):
+    result = {}
+    for term, polarity in terms:
+        if polarity and (term.kind == PPExpressionKind.binary) and (term.value == '=='):
+            left, right = term.operands
+            if (left.kind == PPExpressionKind.number) and (right.kind == PPExpressionKind.identifier):
+                left, right = right, left
+            if (left.kind == PPExpressionKind.identifier) and (right.kind == PPExpressionKind.number):
+                result[left.value] = right.value
+    return result
+
+
+# A set of macros whose state is known in advance (e.g. from --define/--undef on the command line), which can be
+# used to evaluate conditions
+# defines maps macro names to their value text (or None if they are defined with no value, which is treated as 1, as
+# with -D on a compiler command line), and undefines is a collection of macro names known to not be defined
+# Any other macro is assumed to be unknown, and conditions depending on it can't be evaluated
+class PPDefineEnvironment:
+    def __init__(self, defines=None, undefines=None):
+        self.defines = dict(defines) if defines is not None else {}
+        self.undefines = set(undefines) if undefines is not None else set()
+        self.values = {}  # Cache of evaluated macro values
+
+    # Returns true if this environment doesn't know about any macros (and thus can't evaluate anything useful)
+    def is_empty(self):
+        return (len(self.defines) == 0) and (len(self.undefines) == 0)
+
+    # Get the integer value of a macro, or None if it is not known
+    def get_value(self, name, expanding=()):
+        if name in self.undefines:
+            return 0  # Undefined macros evaluate to 0 in #if expressions
+        if name not in self.defines:
+            return None
+        if name in expanding:
+            return None  # Self-referential definition
+        if name not in self.values:
+            value_text = self.defines[name]
+            if (value_text is None) or (value_text.strip() == ""):
+                self.values[name] = 1
+            else:
+                self.values[name] = evaluate(parse_expression_text(value_text), self, expanding + (name,))
+        return self.values[name]
+
+
+# Convert a value to a C-style truth value (1 or 0), passing through None for unknown values
+def to_truth_value(value):
+    if value is None:
+        return None
+    return 1 if value != 0 else 0
+
+
+# Evaluate an expression node using the environment given, returning the integer result, or None if the result
+# cannot be determined (because it depends on unknown macros or constructs we don't understand)
+def evaluate(node, environment, expanding=()):
+    kind = node.kind
+    if kind == PPExpressionKind.number:
+        return node.value
+    elif kind == PPExpressionKind.identifier:
+        return environment.get_value(node.value, expanding)
+    elif kind == PPExpressionKind.defined:
+        if node.value in environment.defines:
+            return 1
+        if node.value in environment.undefines:
+            return 0
+        return None
+    elif kind == PPExpressionKind.logical:
+        # Unknown terms only make the result unknown if none of the others decide it
+        deciding_value = 0 if node.value == '&&' else 1
+        result = 1 - deciding_value
+        for operand in node.operands:
+            value = to_truth_value(evaluate(operand, environment, expanding))
+            if value == deciding_value:
+                return deciding_value
+            if value is None:
+                result = None
+        return result
+    elif kind == PPExpressionKind.conditional:
+        condition = to_truth_value(evaluate(node.operands[0], environment, expanding))
+        if condition is None:
+            # We can still give an answer if both sides agree
+            true_value = evaluate(node.operands[1], environment, expanding)
+            if (true_value is not None) and (true_value == evaluate(node.operands[2], environment, expanding)):
+                return true_value
+            return None
+        return evaluate(node.operands[1] if condition else node.operands[2], environment, expanding)
+    elif kind == PPExpressionKind.unary:
+        value = evaluate(node.operands[0], environment, expanding)
+        if value is None:
+            return None
+        if node.value == '!':
+            return 0 if value != 0 else 1
+        elif node.value == '~':
+            return ~value
+        elif node.value == '-':
+            return -value
+        return None
+    elif kind == PPExpressionKind.binary:
+        left = evaluate(node.operands[0], environment, expanding)
+        if left is None:
+            return None
+        right = evaluate(node.operands[1], environment, expanding)
+        if right is None:
+            return None
+        return evaluate_binary_operator(node.value, left, right)
+    else:
+        return None  # Calls and unparsed expressions can't be evaluated
+
+
+# Evaluate a binary operator on two integers, returning None if the result is undefined
+def evaluate_binary_operator(operator, left, right):
+    if operator == '+':
+        return left + right
+    elif operator == '-':
+        return left - right
+    elif operator == '*':
+        return left * right
+    elif (operator == '/') or (operator == '%'):
+        if right == 0:
+            return None
+        # C division truncates towards zero
+        quotient = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            quotient = -quotient
+        return quotient if operator == '/' else left - (quotient * right)
+    elif operator == '<<':
+        return left << right if right >= 0 else None
+    elif operator == '>>':
+        return left >> right if right >= 0 else None
+    elif operator == '<':
+        return 1 if left < right else 0
+    elif operator == '<=':
+        return 1 if left <= right else 0
+    elif operator == '==':
+        return 1 if left == right else 0
+    elif operator == '!=':
+        return 1 if left != right else 0
+    elif operator == '&':
+        return left & right
+    elif operator == '|':
+        return left | right
+    elif operator == '^':
+        return left ^ right
+    return None
@@ -0,0 +1,191 @@
+# Persistent cache of generated code, for incremental regeneration
+#
+# This maps the structural hash (see structural_hash.py) of each top-level declaration to the header text, function
+# stub text and metadata that were generated for it last time. When the source header changes, only declarations whose
+# subtrees (or surroundings) actually changed need to be regenerated, and everything else is spliced in from the cache.
+#
+# Cache keys include everything the output depends on other than the element itself - the context hash of the element
+# (its position in the DOM), the write context settings and so on - as well as a fingerprint of the generator code, so
+# that changes to Dear Bindings itself invalidate the whole cache.
+
+import hashlib
+import json
+import os
+from src import code_dom
+from src import structural_hash
+from src.code_dom.common import LineBuffer
+from src.output_file import OutputFile
+
+CACHE_FORMAT_VERSION = 1
+
+# Containers whose children are cached individually (rather than caching the whole container)
+container_types = (code_dom.DOMHeaderFileSet,
+                   code_dom.DOMHeaderFile,
+                   code_dom.DOMPreprocessorIf,
+                   code_dom.DOMExternC,
+                   code_dom.DOMNamespace)
+
+
+class RenderCache:
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}  # Entries loaded from the cache file, indexed by key
+        self.used_entries = {}  # Entries used (or generated) this run, which are the ones that get saved
+        self.hasher = None
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            data = None  # Missing or unreadable cache, so start from scratch
+
+        if (data is not None) and \
+                (data.get("version") == CACHE_FORMAT_VERSION) and \
+                (data.get("generator") == get_generator_fingerprint()):
+            self.entries = data["entries"]
+
+    # (Re)calculate structural hashes for the DOM - this must be done after the DOM is modified and before anything is
+    # generated from it
+    def update_hashes(self, dom_root):
+        self.hasher = structural_hash.compute_structural_hashes(dom_root)
+
+    # Get the cache key for a given kind of output for an element, with key_data containing anything else the output
+    # depends on
+    def get_key(self, element, kind, key_data):
+        if element.structural_hash is None:
+            raise Exception("Structural hashes have not been calculated for " + str(element))
+        key = json.dumps([kind, element.structural_hash, self.hasher.get_context_hash(element), key_data])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    # Look up an entry, returning None if it is not present
+    def lookup(self, key):
+        value = self.used_entries.get(key)
+        if value is None:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.used_entries[key] = value
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        self.used_entries[key] = value
+
+    # Get the text written by write (which is passed a file to write to) for an element, using the cached version if
+    # there is one
+    def get_text(self, element, kind, key_data, write):
+        key = self.get_key(element, kind, key_data)
+        text = self.lookup(key)
+        if text is None:
+            buffer = LineBuffer()
+            write(buffer)
+            text = buffer.getvalue()
+            self.store(key, text)
+        return text
+
+    # Write an element out as C code, using the cached version if there is one
+    def write_element_to_c(self, element, file, indent, context):
+        if isinstance(element, container_types):
+            # Containers get written normally, and their children are then looked up individually
+            element.write_to_c(file, indent=indent, context=context)
+            return
+
+        file.write(self.get_text(element, "c", [indent, get_write_context_key(context)],
+                                 lambda buffer: element.write_to_c(buffer, indent=indent, context=context)))
+
+    # Get the metadata emitted by emit (a function that takes no arguments) for an element, using the cached version
+    # if there is one
+    def get_metadata(self, element, kind, emit):
+        # Source line numbers are stored relative to the element, so that declarations which have merely moved
+        # within the file can still be reused
+        base_line = element.get_source_line() or 0
+        key = self.get_key(element, "metadata:" + kind, [element.get_source_filename(),
+                                                         get_relative_source_lines(element, base_line)])
+        metadata = self.lookup(key)
+        if metadata is None:
+            metadata = emit()
+            self.store(key, offset_source_lines(metadata, -base_line))
+            return metadata
+        return offset_source_lines(metadata, base_line)
+
+    # Write the entries used this run back to the cache file (entries that were not used are discarded, so the cache
+    # does not grow without limit as the headers change)
+    def save(self):
+        data = {
+            "version": CACHE_FORMAT_VERSION,
+            "generator": get_generator_fingerprint(),
+            "entries": self.used_entries
+        }
+        with OutputFile(self.filename) as file:
+            # Note that keys must not be sorted here, as the key order of metadata items needs to be preserved
+            file.write(json.dumps(data, separators=(",", ":")))
+
+
+# Get a JSON-compatible key representing the settings in a write context
+def get_write_context_key(context):
+    key = {}
+    for name, value in vars(context).items():
+        if name == "render_cache":
+            continue
+        key[name] = value
+    return key
+
+
+# Get the line numbers of an element and all its children, relative to base_line
+def get_relative_source_lines(element, base_line):
+    result = []
+
+    def walker(child):
+        line = child.get_source_line()
+        result.append((line - base_line) if line is not None else None)
+
+    element.walk(walker)
+
+    return result
+
+
+# Return a copy of some metadata, with offset added to all the source line numbers in it
+def offset_source_lines(value, offset):
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if (key == "source_location") and ("line" in item):
+                item = dict(item)
+                item["line"] += offset
+                result[key] = item
+            else:
+                result[key] = offset_source_lines(item, offset)
+        return result
+    elif isinstance(value, list):
+        return [offset_source_lines(item, offset) for item in value]
+    else:
+        return value
+
+
+# Cache of the generator fingerprint
+generator_fingerprint = None
+
+
+# Get a hash of the Dear Bindings source code, so that cached output from a different version of the generator is
+# not used
+def get_generator_fingerprint():
+    global generator_fingerprint
+    if generator_fingerprint is None:
+        root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        filenames = [os.path.join(root_dir, "dear_bindings.py")]
+        for dir_path, dir_names, file_names in os.walk(os.path.join(root_dir, "src")):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith(".py"):
+                    filenames.append(os.path.join(dir_path, file_name))
+
+        fingerprint = hashlib.sha256()
+        for filename in filenames:
+            fingerprint.update(os.path.relpath(filename, root_dir).replace(os.sep, "/").encode("utf-8"))
+            with open(filename, "rb") as file:
+                fingerprint.update(hashlib.sha256(file.read()).digest())
+        generator_fingerprint = fingerprint.hexdigest()
+    return generator_fingerprint
@@ -0,0 +1,534 @@
+# Struct layout calculation
+#
+# Works out the size and alignment of types, and the offsets of struct fields, for a given target ABI from the
+# declarations in a DOM (using type_comprehension to interpret the types). This lets us make decisions that depend on
+# how types are laid out in memory (such as which by-value struct arguments are worth passing as pointers).
+#
+# Only plain C-style data is handled - anything whose layout can't be determined with certainty (types we can't find,
+# array bounds we can't evaluate, fields that depend on preprocessor conditionals, structs that still have base classes
+# and so on) results in None.
+#
+# Layouts also record the preprocessor conditions that the definitions they were calculated from are subject to (for
+# example, a typedef inside "#ifndef ImTextureID" that the user may replace), so that users can tell if a layout might
+# be different in other build configurations.
+
+import copy
+from src import code_dom
+from src import preprocessor_expression
+from src import type_comprehension
+
+
+# A target ABI, describing the layout of the built-in types
+class TargetABI:
+    def __init__(self, name, pointer_size, builtin_type_layouts, msvc_bitfields=False):
+        self.name = name
+        self.pointer_size = pointer_size
+        self.builtin_type_layouts = builtin_type_layouts  # (size, alignment, kind) tuples indexed by type name, where
+        #                                                   kind is "integer", "float" or "long_double"
+        self.msvc_bitfields = msvc_bitfields  # Use MSVC rules for packing bitfields (rather than the System V ones)
+
+
+# 64-bit Linux/macOS and other Unix-like platforms (x86-64 System V and AArch64)
+lp64_abi = TargetABI("LP64", 8, {
+    "bool": (1, 1, "integer"),
+    "char": (1, 1, "integer"),
+    "unsigned char": (1, 1, "integer"),
+    "short": (2, 2, "integer"),
+    "unsigned short": (2, 2, "integer"),
+    "int": (4, 4, "integer"),
+    "unsigned int": (4, 4, "integer"),
+    "long": (8, 8, "integer"),
+    "unsigned long": (8, 8, "integer"),
+    "long long": (8, 8, "integer"),
+    "unsigned long long": (8, 8, "integer"),
+    "float": (4, 4, "float"),
+    "double": (8, 8, "float"),
+    "long double": (16, 16, "long_double"),
+    "wchar_t": (4, 4, "integer"),
+    "char16_t": (2, 2, "integer"),
+    "char32_t": (4, 4, "integer"),
+    "int8_t": (1, 1, "integer"),
+    "uint8_t": (1, 1, "integer"),
+    "int16_t": (2, 2, "integer"),
+    "uint16_t": (2, 2, "integer"),
+    "int32_t": (4, 4, "integer"),
+    "uint32_t": (4, 4, "integer"),
+    "int64_t": (8, 8, "integer"),
+    "uint64_t": (8, 8, "integer"),
+    "size_t": (8, 8, "integer"),
+    "ptrdiff_t": (8, 8, "integer"),
+    "intptr_t": (8, 8, "integer"),
+    "uintptr_t": (8, 8, "integer")
+})
+
+# 64-bit Windows (MSVC)
+llp64_abi = TargetABI("LLP64", 8, dict(lp64_abi.builtin_type_layouts, **{
+    "long": (4, 4, "integer"),
+    "unsigned long": (4, 4, "integer"),
+    "long double": (8, 8, "long_double"),
+    "wchar_t": (2, 2, "integer")
+}), msvc_bitfields=True)
+
+# All the ABIs we know about
+all_abis = [lp64_abi, llp64_abi]
+
+# The ABI classes built-in types are passed as, named after the libffi types (types that vary in size between the ABIs
+# we support keep a distinct name, so that these are the same for all ABIs)
+builtin_type_abi_classes = {
+    "bool": "uint8",
+    "char": "sint8",
+    "unsigned char": "uint8",
+    "short": "sint16",
+    "unsigned short": "uint16",
+    "int": "sint32",
+    "unsigned int": "uint32",
+    "long": "slong",
+    "unsigned long": "ulong",
+    "long long": "sint64",
+    "unsigned long long": "uint64",
+    "float": "float",
+    "double": "double",
+    "long double": "longdouble",
+    "wchar_t": "wchar",
+    "char16_t": "uint16",
+    "char32_t": "uint32",
+    "int8_t": "sint8",
+    "uint8_t": "uint8",
+    "int16_t": "sint16",
+    "uint16_t": "uint16",
+    "int32_t": "sint32",
+    "uint32_t": "uint32",
+    "int64_t": "sint64",
+    "uint64_t": "uint64",
+    "size_t": "uint64",
+    "ptrdiff_t": "sint64",
+    "intptr_t": "sint64",
+    "uintptr_t": "uint64"
+}
+
+
+# The layout of a type
+class TypeLayout:
+    def __init__(self, size, alignment):
+        self.size = size
+        self.alignment = alignment
+        self.scalar_kind = None  # For scalars (including pointers), "integer", "float" or "long_double"...
+        self.abi_class = None  # ...and the ABI class they are passed as (see builtin_type_abi_classes)
+        self.element_layout = None  # For arrays, the layout of each element...
+        self.element_count = None  # ...and the number of them
+        self.fields = None  # For structs and unions, a list of FieldLayouts
+        self.conditions = frozenset()  # Preprocessor conditions the definitions this was calculated from are subject
+        #                                to, as (condition node, is in else branch) pairs
+
+    # Make a copy of this layout that is additionally subject to the given conditions
+    def with_conditions(self, conditions):
+        if conditions.issubset(self.conditions):
+            return self
+        result = copy.copy(self)
+        result.conditions = self.conditions | conditions
+        return result
+
+    # Get the layout of the named field of a struct or union, or None if there isn't one
+    def get_field(self, name):
+        for field in self.fields or []:
+            if field.name == name:
+                return field
+        return None
+
+
+# The layout of a single field in a struct or union
+class FieldLayout:
+    def __init__(self, name, offset, layout, bit_offset=None, bit_width=None, is_anonymous=False):
+        self.name = name  # For anonymous nested structs/unions, this is the (generated) name of the nested type
+        self.is_anonymous = is_anonymous
+        self.offset = offset  # For bitfields, this is the offset of the storage unit containing the field
+        self.layout = layout
+        self.bit_offset = bit_offset  # For bitfields, the position of the field within the storage unit (starting from
+        #                               the least significant bit)...
+        self.bit_width = bit_width  # ...and its width in bits
+
+
+# Round value up to a multiple of alignment
+def align_up(value, alignment):
+    return ((value + alignment - 1) // alignment) * alignment
+
+
+# Get the set of preprocessor conditions an element is subject to, as (condition node, is in else branch) pairs
+def get_enclosing_conditions(element):
+    conditions = set()
+    child = element
+    parent = element.parent
+    while parent is not None:
+        if isinstance(parent, code_dom.DOMPreprocessorIf) and not parent.is_include_guard:
+            conditions.add((parent.get_condition_node(), parent.is_element_in_else_block(child)))
+        child = parent
+        parent = parent.parent
+    return frozenset(conditions)
+
+
+# Returns True if the layout of a struct depends on preprocessor conditions other than those the struct itself is subject
+# to (in which case it may be different in other build configurations, such as if the user has supplied their own
+# ImTextureID type)
+def is_configuration_dependent(struct, layout):
+    return not layout.conditions.issubset(get_enclosing_conditions(struct))
+
+
+# Evaluates array bounds using the values of enum elements and #defines
+# (the conditions that any of the values used are subject to are accumulated in used_conditions)
+class ConstantEnvironment(preprocessor_expression.PPDefineEnvironment):
+    def __init__(self, dom_root):
+        super().__init__()
+        self.enum_elements = {}
+        self.define_elements = {}
+        self.used_conditions = set()
+        for enum_element in dom_root.list_all_children_of_type(code_dom.DOMEnumElement):
+            self.enum_elements[enum_element.name] = enum_element
+        for define in dom_root.list_all_children_of_type(code_dom.DOMDefine):
+            if "(" in define.name:
+                continue  # Function-like macros can't be evaluated
+            if (define.name in self.defines) and (self.defines[define.name] != define.content):
+                self.defines[define.name] = ""  # Defined in more than one way, so we can't know the value
+            else:
+                self.defines[define.name] = define.content
+                self.define_elements[define.name] = define
+
+    def get_value(self, name, expanding=()):
+        enum_element = self.enum_elements.get(name)
+        if enum_element is not None:
+            self.used_conditions |= get_enclosing_conditions(enum_element)
+            if enum_element.value is not None:
+                return enum_element.value
+            if (enum_element.value_tokens is None) or (name in expanding):
+                return None
+            return preprocessor_expression.evaluate(preprocessor_expression.get_expression_node(
+                enum_element.value_tokens), self, expanding + (name,))
+        if self.defines.get(name) == "":
+            return None  # Either defined without a value or ambiguous, neither of which is any use as a constant
+        if name in self.define_elements:
+            self.used_conditions |= get_enclosing_conditions(self.define_elements[name])
+        return super().get_value(name, expanding)
+
+
+# Calculates layouts for the types in a DOM
+class StructLayoutCalculator:
+    def __init__(self, dom_root, abi=lp64_abi):
+        self.abi = abi
+        self.constants = ConstantEnvironment(dom_root)
+        self.named_elements = {}  # Lists of struct definitions, enums and typedefs indexed by name
+        for element in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion) + \
+                dom_root.list_all_children_of_type(code_dom.DOMEnum) + \
+                dom_root.list_all_children_of_type(code_dom.DOMTypedef):
+            if (element.name is None) or getattr(element, "is_forward_declaration", False):
+                continue
+            if isinstance(element, code_dom.DOMTypedef) and (element.type is not None) and \
+                    (element.type.to_c_string().split()[-1] == element.name):
+                continue  # Typedefs like "typedef struct Foo Foo" don't tell us anything
+            self.named_elements.setdefault(element.name, []).append(element)
+        self.struct_layouts = {}  # Cache of layouts calculated for each struct
+        self.names_being_resolved = set()  # Used to detect recursive definitions
+
+    # Get the layout of a pointer
+    def get_pointer_layout(self):
+        layout = TypeLayout(self.abi.pointer_size, self.abi.pointer_size)
+        layout.scalar_kind = "integer"
+        layout.abi_class = "pointer"
+        return layout
+
+    # Get the layout of a built-in type (or common standard library type), or None if the name isn't one
+    def get_builtin_layout(self, name):
+        if name not in self.abi.builtin_type_layouts:
+            return None
+        size, alignment, kind = self.abi.builtin_type_layouts[name]
+        layout = TypeLayout(size, alignment)
+        layout.scalar_kind = kind
+        layout.abi_class = builtin_type_abi_classes.get(name)
+        return layout
+
+    # Get the layout of an array with the given bounds (as tokens or a string)
+    def get_array_layout(self, element_layout, bounds):
+        if (element_layout is None) or (bounds is None):
+            return None
+        if isinstance(bounds, str):
+            node = preprocessor_expression.parse_expression_text(bounds)
+        else:
+            if len(bounds) == 0:
+                return None  # Unbounded array
+            node = preprocessor_expression.get_expression_node(bounds)
+        self.constants.used_conditions = set()
+        count = preprocessor_expression.evaluate(node, self.constants)
+        if (count is None) or (count <= 0):
+            return None
+        layout = TypeLayout(element_layout.size * count, element_layout.alignment)
+        layout.element_layout = element_layout
+        layout.element_count = count
+        layout.conditions = element_layout.conditions | frozenset(self.constants.used_conditions)
+        return layout
+
+    # Get the layout of a type (a DOMType or DOMFunctionPointerType), or None if it can't be determined
+    def get_type_layout(self, dom_type):
+        if isinstance(dom_type, code_dom.DOMFunctionPointerType):
+            return self.get_pointer_layout()
+        return self.get_type_comprehension_layout(
+            type_comprehension.type_comprehender.get_type_description(dom_type.to_c_string()))
+
+    # Get the layout of a type from its type comprehension description
+    def get_type_comprehension_layout(self, tc_element):
+        if isinstance(tc_element, type_comprehension.TCType):
+            return self.get_type_comprehension_layout(tc_element.type)
+        elif isinstance(tc_element, type_comprehension.TCPointer):
+            return self.get_pointer_layout()
+        elif isinstance(tc_element, type_comprehension.TCArray):
+            return self.get_array_layout(self.get_type_comprehension_layout(tc_element.target), tc_element.bounds)
+        elif isinstance(tc_element, type_comprehension.TCBuiltInType):
+            return self.get_builtin_layout(tc_element.type.name.replace("_", " "))
+        elif isinstance(tc_element, type_comprehension.TCUserType):
+            return self.get_named_type_layout(tc_element.name)
+        return None  # Functions and unknown elements don't have a layout
+
+    # Get the layout of a type by name
+    def get_named_type_layout(self, name):
+        name = name.split("::")[-1]  # We only deal in unqualified names
+        builtin_layout = self.get_builtin_layout(name)
+        if builtin_layout is not None:
+            return builtin_layout
+
+        if name in self.names_being_resolved:
+            return None  # Recursive definition (which can't be laid out anyway)
+
+        elements = self.named_elements.get(name)
+        if elements is None:
+            return None
+
+        self.names_being_resolved.add(name)
+        try:
+            layouts = [self.get_element_layout(element) for element in elements]
+        finally:
+            self.names_being_resolved.remove(name)
+
+        # If there are several definitions (for example under different preprocessor conditionals), they need to agree
+        if (None in layouts) or \
+                any((layout.size, layout.alignment) != (layouts[0].size, layouts[0].alignment) for layout in layouts):
+            return None
+        return layouts[0].with_conditions(frozenset().union(*[get_enclosing_conditions(element)
+                                                               for element in elements]))
+
+    # Get the layout of the type a struct, enum or typedef declares
+    def get_element_layout(self, element):
+        if isinstance(element, code_dom.DOMClassStructUnion):
+            return self.get_struct_layout(element)
+        elif isinstance(element, code_dom.DOMEnum):
+            if element.storage_type is not None:
+                return self.get_type_layout(element.storage_type)
+            return self.get_builtin_layout("int")  # Not strictly guaranteed, but true for all the platforms we support
+        elif isinstance(element, code_dom.DOMTypedef):
+            if element.type is None:
+                return None
+            return self.get_type_layout(element.type)
+        return None
+
+    # Get the layout of a struct or union, or None if it can't be determined
+    def get_struct_layout(self, struct):
+        if struct not in self.struct_layouts:
+            self.struct_layouts[struct] = self.calculate_struct_layout(struct)
+        return self.struct_layouts[struct]
+
+    # Get a list of (name, layout, bitfield width, is anonymous) tuples for the data members of a struct, or None if they
+    # can't all be determined
+    def get_struct_members(self, struct):
+        members = []
+        for child in struct.children:
+            if isinstance(child, code_dom.DOMFieldDeclaration):
+                if child.is_static or child.is_extern:
+                    continue
+                field_layout = self.get_type_layout(child.field_type)
+                for i in range(0, len(child.names)):
+                    if child.width_specifiers[i] is not None:
+                        if (field_layout is not None) and (field_layout.scalar_kind != "integer"):
+                            return None  # Only integer bitfields make sense
+                        members.append((child.names[i], field_layout, child.width_specifiers[i], False))
+                    elif child.is_array[i]:
+                        members.append((child.names[i],
+                                        self.get_array_layout(field_layout, child.array_bounds_tokens[i]),
+                                        None, False))
+                    else:
+                        members.append((child.names[i], field_layout, None, False))
+            elif isinstance(child, code_dom.DOMClassStructUnion):
+                if child.is_anonymous and not child.is_forward_declaration:
+                    # Anonymous nested structs/unions are members in their own right
+                    members.append((child.name, self.get_struct_layout(child), None, True))
+            elif isinstance(child, code_dom.DOMPreprocessorIf):
+                if any(not (field.is_static or field.is_extern)
+                       for field in child.list_all_children_of_type(code_dom.DOMFieldDeclaration)):
+                    return None  # The members depend on the build configuration
+        if any(layout is None for name, layout, bit_width, is_anonymous in members):
+            return None
+        return members
+
+    # Calculate the layout of a struct or union
+    def calculate_struct_layout(self, struct):
+        if struct.is_forward_declaration or (struct.base_classes is not None):
+            return None
+
+        members = self.get_struct_members(struct)
+        if (members is None) or (len(members) == 0):
+            return None  # Empty structs have different sizes in C and C++, so we don't try to describe them
+
+        fields = []
+        bit_position = 0  # Position of the end of the previous member, in bits
+        alignment = 1
+        unit_offset = None  # Offset and size of the current bitfield storage unit (for MSVC bitfields)
+        unit_size = None
+        for name, layout, bit_width, is_anonymous in members:
+            if struct.structure_type == "UNION":
+                if bit_width is not None:
+                    fields.append(FieldLayout(name, 0, layout, 0, bit_width))
+                    if not self.abi.msvc_bitfields:
+                        bit_position = max(bit_position, bit_width)
+                        alignment = max(alignment, layout.alignment)
+                        continue
+                else:
+                    fields.append(FieldLayout(name, 0, layout, is_anonymous=is_anonymous))
+                bit_position = max(bit_position, layout.size * 8)
+            elif bit_width is not None:
+                if self.abi.msvc_bitfields:
+                    # MSVC packs consecutive bitfields into a unit of the declared type, and starts a new unit if the
+                    # type size changes or there isn't room (zero-width bitfields just end the current unit)
+                    if (unit_offset is None) or (unit_size != layout.size) or (bit_width == 0) or \
+                            (bit_position + bit_width > (unit_offset + unit_size) * 8):
+                        if unit_offset is not None:
+                            bit_position = (unit_offset + unit_size) * 8  # Units always take up their full size
+                        if bit_width == 0:
+                            unit_offset = None
+                            continue
+                        unit_offset = align_up((bit_position + 7) // 8, layout.alignment)
+                        unit_size = layout.size
+                        bit_position = unit_offset * 8
+                    field_unit_offset = unit_offset
+                else:
+                    # System V places bitfields at the next free bit, unless the field would then straddle an
+                    # alignment boundary for its type
+                    unit_bits = layout.alignment * 8
+                    if (bit_width == 0) or \
+                            ((bit_position // unit_bits) != ((bit_position + bit_width - 1) // unit_bits)):
+                        bit_position = align_up(bit_position, unit_bits)
+                    if bit_width == 0:
+                        continue
+                    field_unit_offset = (bit_position // unit_bits) * layout.alignment
+                fields.append(FieldLayout(name, field_unit_offset, layout, bit_position - (field_unit_offset * 8),
+                                          bit_width))
+                bit_position += bit_width
+            else:
+                if unit_offset is not None:
+                    bit_position = (unit_offset + unit_size) * 8
+                    unit_offset = None
+                offset = align_up((bit_position + 7) // 8, layout.alignment)
+                fields.append(FieldLayout(name, offset, layout, is_anonymous=is_anonymous))
+                bit_position = (offset + layout.size) * 8
+            alignment = max(alignment, layout.alignment)
+
+        if unit_offset is not None:
+            bit_position = (unit_offset + unit_size) * 8
+
+        result = TypeLayout(align_up((bit_position + 7) // 8, alignment), alignment)
+        result.fields = fields
+        result.conditions = get_enclosing_conditions(struct).union(*[field.layout.conditions for field in fields])
+        return result
+
+
+# Get a list of (offset, layout) pairs for every scalar value in a layout
+def get_scalars(layout, base_offset=0):
+    if layout.scalar_kind is not None:
+        return [(base_offset, layout)]
+    result = []
+    if layout.element_layout is not None:
+        for i in range(0, layout.element_count):
+            result += get_scalars(layout.element_layout, base_offset + (i * layout.element_layout.size))
+    elif layout.fields is not None:
+        for field in layout.fields:
+            result += get_scalars(field.layout, base_offset + field.offset)
+    return result
+
+
+# Classify how a value with the given layout is passed as an argument under the x86-64 System V ABI, returning a list
+# with the class of each eightbyte ("INTEGER", "SSE" or "NO_CLASS" for padding), or "MEMORY" if it is passed on the
+# stack
+# (this does not deal with vector types, which don't appear in the APIs we handle)
+def classify_sysv_x86_64(layout):
+    if layout.size > 16:
+        return "MEMORY"
+
+    eightbyte_classes = [None] * ((layout.size + 7) // 8)
+    for offset, scalar in get_scalars(layout):
+        if scalar.scalar_kind == "long_double":
+            return "MEMORY"  # X87 classes are passed in memory
+        scalar_class = "SSE" if scalar.scalar_kind == "float" else "INTEGER"
+        index = offset // 8
+        if (eightbyte_classes[index] is None) or (eightbyte_classes[index] == "SSE"):
+            eightbyte_classes[index] = scalar_class  # INTEGER wins when merged with SSE
+    return [eightbyte_class or "NO_CLASS" for eightbyte_class in eightbyte_classes]
+
+
+# Get the ABI class of a value with the given layout, as a string such as "sint32", "pointer" or "{float,float}" (for a
+# struct, with array members given as the right number of elements), or None if it can't be expressed
+# (the format follows libffi, which doesn't support unions or bitfields)
+def get_abi_class(layout):
+    if layout.scalar_kind is not None:
+        return layout.abi_class
+    if layout.fields is None:
+        return None  # Arrays aren't passed by value
+    element_classes = []
+    end_offset = 0
+    for field in layout.fields:
+        if (field.bit_width is not None) or (field.offset < end_offset):
+            return None  # Bitfields or overlapping fields (in a union)
+        end_offset = field.offset + field.layout.size
+        field_layout = field.layout
+        count = 1
+        while field_layout.element_layout is not None:
+            count *= field_layout.element_count
+            field_layout = field_layout.element_layout
+        field_class = get_abi_class(field_layout)
+        if field_class is None:
+            return None
+        element_classes += [field_class] * count
+    return "{" + ",".join(element_classes) + "}"
+
+
+# Get the canonical ABI signature of a function, in the form "return_class(argument_class,...)" (for example
+# "void(pointer,{float,float},sint32,...)"), so that functions that can be called in the same way can be grouped
+# together. Returns None if any part of the signature can't be expressed, or if it depends on preprocessor conditionals
+# (such as if it uses ImTextureID, which the user can redefine).
+def get_function_abi_signature(function, layout_calculator):
+    conditions = frozenset()
+    parameter_classes = []
+
+    parameter_types = [function.return_type]
+    for argument in function.arguments:
+        if argument.is_implicit_default:
+            continue  # Not part of the C signature
+        if argument.is_varargs:
+            parameter_types.append("...")
+        elif argument.is_array:
+            parameter_types.append("pointer")  # Arrays are passed as pointers
+        else:
+            parameter_types.append(argument.arg_type)
+
+    for parameter_type in parameter_types:
+        if isinstance(parameter_type, str):
+            parameter_classes.append(parameter_type)
+        elif (parameter_type is None) or (parameter_type.to_c_string() == "void"):
+            parameter_classes.append("void")
+        else:
+            layout = layout_calculator.get_type_layout(parameter_type)
+            if layout is None:
+                return None
+            parameter_class = get_abi_class(layout)
+            if parameter_class is None:
+                return None
+            conditions |= layout.conditions
+            parameter_classes.append(parameter_class)
+
+    if not conditions.issubset(get_enclosing_conditions(function)):
+        return None
+
+    return parameter_classes[0] + "(" + ",".join(parameter_classes[1:]) + ")"
@@ -0,0 +1,151 @@
+# Structural (Merkle-style) hashing of the DOM
+#
+# The structural hash of an element covers its type, all of its own attributes and the structural hashes of its
+# children, so any change anywhere in a subtree changes the hash of the subtree root (and nothing outside it). Tokens
+# only contribute their type/value (and any flags added by modifiers), not their position in the source file, so
+# declarations that are unchanged between two versions of a header hash identically even if they have moved.
+#
+# Elements that are referred to without being children (for example original_class) contribute their fully-qualified
+# name and shallow hash (the hash of their own attributes). The exception is unmodified_element, which is the original
+# version of the element itself and so contributes its full structural hash.
+
+import hashlib
+from src import code_dom
+
+# Element attributes that are not part of the structure
+ignored_element_attributes = frozenset(["parent", "structural_hash"])
+
+# Element attributes that are additionally ignored for shallow hashes (as comments on a container don't affect its
+# children)
+shallow_ignored_element_attributes = ignored_element_attributes | frozenset(["pre_comments", "attached_comment"])
+
+# Token attributes that are not part of the structure (as they only describe where the token appeared)
+ignored_token_attributes = frozenset(["lineno", "lexpos", "lexer"])
+
+# Separator used between the parts of the data being hashed
+part_separator = "\x1f"
+
+
+# Calculates and caches structural hashes for elements
+class StructuralHasher:
+    def __init__(self):
+        self.element_hashes = {}  # Structural hashes, indexed by element
+        self.shallow_hashes = {}  # Hashes of the attributes of the element alone, indexed by element
+        self.context_hashes = {}  # Hashes of the location of each element in the DOM, indexed by element
+        self.in_progress = set()  # Elements whose shallow hashes are currently being calculated (to detect cycles)
+
+    # Get the structural hash of an element (and its children)
+    def get_element_hash(self, element):
+        result = self.element_hashes.get(element)
+        if result is None:
+            parts = [type(element).__name__]
+            self.add_attributes(parts, element, element, True)
+            result = get_parts_hash(parts)
+            self.element_hashes[element] = result
+        return result
+
+    # Get a hash of the attributes of an element, ignoring its children entirely (so this does not change when
+    # children are added, removed or modified)
+    def get_shallow_hash(self, element):
+        result = self.shallow_hashes.get(element)
+        if result is None:
+            self.in_progress.add(element)
+            parts = [type(element).__name__]
+            self.add_attributes(parts, element, element, False)
+            self.in_progress.remove(element)
+            result = get_parts_hash(parts)
+            self.shallow_hashes[element] = result
+        return result
+
+    # Get a hash describing where an element sits in the DOM - the shallow hash of each of its ancestors, and which of
+    # their child lists it is in (which matters for things like the #else branch of a preprocessor conditional)
+    def get_context_hash(self, element):
+        result = self.context_hashes.get(element)
+        if result is None:
+            parent = element.parent
+            if parent is None:
+                result = ""
+            else:
+                child_list_index = -1
+                for index, child_list in enumerate(parent.get_child_lists()):
+                    if any(child is element for child in child_list):
+                        child_list_index = index
+                        break
+                result = get_parts_hash([self.get_context_hash(parent),
+                                         self.get_shallow_hash(parent),
+                                         str(child_list_index)])
+            self.context_hashes[element] = result
+        return result
+
+    # Add the attributes of an object to parts
+    def add_attributes(self, parts, value, owner, include_children):
+        if not isinstance(value, code_dom.DOMElement):
+            ignored_attributes = ignored_token_attributes
+        elif include_children:
+            ignored_attributes = ignored_element_attributes
+        else:
+            ignored_attributes = shallow_ignored_element_attributes
+
+        for name, attribute in sorted(vars(value).items()):
+            if name in ignored_attributes:
+                continue
+            parts.append(name)
+            if (name == "unmodified_element") and (attribute is not None) and include_children:
+                parts.append("U" + attribute.get_fully_qualified_name() + ":" + self.get_element_hash(attribute))
+            else:
+                self.add_value(parts, attribute, owner, include_children)
+
+    # Add a value to parts
+    def add_value(self, parts, value, owner, include_children):
+        if (value is None) or isinstance(value, (str, int, float, bool)):
+            parts.append(repr(value))
+        elif isinstance(value, code_dom.DOMElement):
+            if value.parent is owner:
+                if include_children:
+                    parts.append("C" + self.get_element_hash(value))
+            elif value in self.in_progress:
+                # Circular reference, so we can only use the name
+                parts.append("R" + type(value).__name__ + ":" + value.get_fully_qualified_name())
+            else:
+                parts.append("R" + type(value).__name__ + ":" + value.get_fully_qualified_name() + ":" +
+                             self.get_shallow_hash(value))
+        elif isinstance(value, (list, tuple)):
+            parts.append("[")
+            for item in value:
+                self.add_value(parts, item, owner, include_children)
+            parts.append("]")
+        elif isinstance(value, dict):
+            parts.append("{")
+            for key, item in sorted(value.items(), key=lambda entry: repr(entry[0])):
+                parts.append(repr(key))
+                self.add_value(parts, item, owner, include_children)
+            parts.append("}")
+        elif hasattr(value, "__dict__"):
+            # Tokens (and any other simple objects)
+            parts.append("O" + type(value).__name__ + "(")
+            self.add_attributes(parts, value, owner, include_children)
+            parts.append(")")
+        else:
+            parts.append(repr(value))
+
+
+# Hash a list of strings
+def get_parts_hash(parts):
+    return hashlib.sha256(part_separator.join(parts).encode("utf-8")).hexdigest()
+
+
+# Calculate structural hashes for every element in the DOM (bottom-up), storing them in the structural_hash field of
+# each element, and return the hasher (which can be used to get context hashes for the same elements)
+# This needs to be re-run if the DOM is modified afterwards.
+def compute_structural_hashes(dom_root):
+    hasher = StructuralHasher()
+
+    def visit(element):
+        for child_list in element.get_child_lists():
+            for child in child_list:
+                visit(child)
+        element.structural_hash = hasher.get_element_hash(element)
+
+    visit(dom_root)
+
+    return hasher
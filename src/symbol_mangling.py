@@ -0,0 +1,335 @@
+# Itanium C++ ABI symbol names for (a subset of) the original C++ functions
+#
+# GCC, Clang and most other non-Windows compilers name C++ functions according to the Itanium C++ ABI. Knowing the
+# symbol an original function was compiled to lets C code call it directly (see mod_mark_direct_alias_functions).
+#
+# Only the subset of the mangling rules needed for non-template functions whose arguments are scalars, enums and
+# pointers/references to named types is implemented - anything else (templates, function pointers, types we can't
+# resolve or whose definition depends on the build configuration, and so on) results in None, so callers fall back to
+# the normal function stubs.
+
+from src import code_dom
+from src import utils
+
+# Mangled codes for built-in types, indexed by their normalised C name
+builtin_type_codes = {
+    "void": "v",
+    "bool": "b",
+    "char": "c",
+    "signed char": "a",
+    "unsigned char": "h",
+    "short": "s",
+    "unsigned short": "t",
+    "int": "i",
+    "unsigned int": "j",
+    "long": "l",
+    "unsigned long": "m",
+    "long long": "x",
+    "unsigned long long": "y",
+    "float": "f",
+    "double": "d",
+    "long double": "e",
+    "wchar_t": "w",
+    "char16_t": "Ds",
+    "char32_t": "Di"
+}
+
+# Words that can make up the name of a built-in type
+builtin_type_words = frozenset(["void", "bool", "char", "short", "int", "long", "float", "double", "signed",
+                                "unsigned", "wchar_t", "char16_t", "char32_t"])
+
+# Different spellings of the built-in types that need normalising
+builtin_type_aliases = {
+    "signed": "int",
+    "unsigned": "unsigned int",
+    "signed int": "int",
+    "short int": "short",
+    "signed short": "short",
+    "signed short int": "short",
+    "unsigned short int": "unsigned short",
+    "long int": "long",
+    "signed long": "long",
+    "signed long int": "long",
+    "unsigned long int": "unsigned long",
+    "long long int": "long long",
+    "signed long long": "long long",
+    "signed long long int": "long long",
+    "unsigned long long int": "unsigned long long"
+}
+
+
+# Resolved types are represented as tuples:
+#   ("builtin", <normalised C name>)
+#   ("class", <tuple of name parts>, <DOMClassStructUnion>)
+#   ("enum", <tuple of name parts>, <DOMEnum>)
+#   ("const", <type>), ("pointer", <type>) or ("reference", <type>)
+
+
+# Generates symbol names for functions in an (unmodified) DOM
+class SymbolMangler:
+    def __init__(self, dom_root):
+        self.named_elements = {}  # Lists of classes/enums/typedefs, indexed by fully-qualified name
+        for element in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion) + \
+                dom_root.list_all_children_of_type(code_dom.DOMEnum) + \
+                dom_root.list_all_children_of_type(code_dom.DOMTypedef):
+            if element.name is None:
+                continue
+            self.named_elements.setdefault(element.get_fully_qualified_name(), []).append(element)
+        self.typedefs_being_resolved = set()
+
+    # Get the mangled symbol name for a function, or None if it cannot be determined
+    def get_function_symbol(self, function):
+        if function.is_operator or function.is_constructor or function.is_destructor:
+            return None
+
+        scope = get_scope_names(function)
+        if scope is None:
+            return None
+
+        argument_types = []
+        for argument in function.arguments:
+            if argument.is_varargs:
+                return None
+            argument_type = self.resolve_argument_type(argument, function)
+            if argument_type is None:
+                return None
+            argument_types.append(argument_type)
+
+        substitutions = []  # Keys of the components that can be referred to by substitutions, in order
+
+        if len(scope) == 0:
+            symbol = "_Z" + get_source_name(function.name)
+        else:
+            symbol = "_ZN"
+            if function.is_const:
+                symbol += "K"
+            symbol += mangle_name_parts(scope, substitutions) + get_source_name(function.name) + "E"
+
+        if len(argument_types) == 0:
+            symbol += "v"
+        for argument_type in argument_types:
+            symbol += mangle_type(argument_type, substitutions)
+
+        return symbol
+
+    # Resolve the type of a function argument as it appears in the function signature (so with arrays decayed to
+    # pointers and top-level const removed), returning None if it cannot be resolved
+    def resolve_argument_type(self, argument, function):
+        if not isinstance(argument.arg_type, code_dom.DOMType) or \
+                isinstance(argument.arg_type, code_dom.DOMFunctionPointerType):
+            return None
+        argument_type = self.resolve_type(argument.arg_type, function)
+        if argument_type is None:
+            return None
+        if argument.is_array:
+            argument_type = ("pointer", argument_type)
+        while argument_type[0] == "const":
+            argument_type = argument_type[1]
+        return argument_type
+
+    # Resolve a type as used by context_element (which determines the scopes names are looked up in), returning None
+    # if it cannot be resolved
+    def resolve_type(self, dom_type, context_element):
+        if isinstance(dom_type, code_dom.DOMFunctionPointerType):
+            return None
+
+        base_words = []
+        is_base_const = False
+        declarators = []  # List of [declarator, is_const] pairs
+
+        for token in dom_type.tokens:
+            value = token.value
+            if value in ("struct", "class", "union", "enum"):
+                continue
+            elif value == "const":
+                if len(declarators) > 0:
+                    declarators[-1][1] = True
+                else:
+                    is_base_const = True
+            elif (value == "*") or (value == "&"):
+                if len(base_words) == 0:
+                    return None
+                declarators.append([value, False])
+            elif (value == ":") or (value == "::") or value.replace("_", "").replace(":", "").isalnum():
+                if len(declarators) > 0:
+                    return None
+                base_words.append(value)
+            else:
+                return None  # Templates, arrays, rvalue references, volatile and so on are not supported
+
+        if len(base_words) == 0:
+            return None
+
+        if base_words[0] in builtin_type_words:
+            name = " ".join(base_words)
+            name = builtin_type_aliases.get(name, name)
+            if name not in builtin_type_codes:
+                return None
+            result = ("builtin", name)
+        else:
+            result = self.resolve_name("".join(base_words), context_element)
+            if result is None:
+                return None
+
+        if is_base_const:
+            result = ("const", result)
+        for declarator, is_const in declarators:
+            result = ("pointer" if declarator == "*" else "reference", result)
+            if is_const:
+                result = ("const", result)
+
+        return result
+
+    # Resolve a (possibly qualified) type name used by context_element, returning None if it cannot be resolved
+    def resolve_name(self, name, context_element):
+        if name.startswith("::"):
+            candidate_names = [name[2:]]
+        else:
+            # Search outwards from the scope of the element that is using the name
+            candidate_names = []
+            scope = get_scope_names(context_element)
+            if scope is None:
+                return None
+            for length in range(len(scope), -1, -1):
+                candidate_names.append("::".join(list(scope[:length]) + [name]))
+
+        for candidate_name in candidate_names:
+            elements = self.named_elements.get(candidate_name)
+            if elements is None:
+                continue
+
+            kinds = set(type(element) for element in elements)
+            if len(kinds) != 1:
+                return None  # Ambiguous
+
+            element = elements[0]
+            if isinstance(element, code_dom.DOMTypedef):
+                if len(elements) > 1:
+                    return None  # Multiple definitions means this varies with the configuration
+                if not is_definition_unconditional_for(element, context_element):
+                    return None  # The definition depends on the build configuration
+                if (element.structure_type is not None) and (element.type.to_c_string() == element.name):
+                    return "class", tuple(candidate_name.split("::")), element  # C-style "typedef struct X X;"
+                if element in self.typedefs_being_resolved:
+                    return None  # Circular definition
+                self.typedefs_being_resolved.add(element)
+                result = self.resolve_type(element.type, element)
+                self.typedefs_being_resolved.remove(element)
+                return result
+
+            parts = tuple(candidate_name.split("::"))
+            if isinstance(element, code_dom.DOMEnum):
+                return "enum", parts, element
+            return "class", parts, element
+
+        return None  # Not something we know about (for example a type from a system header)
+
+
+# Get the names of the namespaces/classes an element is inside (outermost first), or None if it is somewhere that
+# we can't generate symbol names for
+def get_scope_names(element):
+    result = []
+    current = element.parent
+    while current is not None:
+        if isinstance(current, (code_dom.DOMNamespace, code_dom.DOMClassStructUnion)):
+            if current.name is None:
+                return None  # Anonymous namespaces and classes
+            result.append(current.name)
+        elif isinstance(current, (code_dom.DOMTemplate, code_dom.DOMExternC)):
+            return None
+        current = current.parent
+    result.reverse()
+    return result
+
+
+# Returns true if a type definition is only subject to preprocessor conditionals that user is also subject to
+# (so it can't be changed by configuration without the user also being removed)
+def is_definition_unconditional_for(definition, user):
+    user_conditionals = utils.get_preprocessor_conditionals(user)
+    for conditional in utils.get_preprocessor_conditionals(definition):
+        in_else_clause = utils.is_in_else_clause(definition, conditional)
+        if not any(user_conditional.condition_matches(conditional) and
+                   (utils.is_in_else_clause(user, user_conditional) == in_else_clause)
+                   for user_conditional in user_conditionals):
+            return False
+    return True
+
+
+# Get the <source-name> encoding of a name
+def get_source_name(name):
+    return str(len(name)) + name
+
+
+# Get the encoding of a substitution reference
+def get_substitution(index):
+    if index == 0:
+        return "S_"
+    index -= 1
+    digits = ""
+    while True:
+        digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"[index % 36] + digits
+        index //= 36
+        if index == 0:
+            break
+    return "S" + digits + "_"
+
+
+# Mangle a sequence of scope names (without the surrounding N...E), adding each prefix to substitutions
+def mangle_name_parts(parts, substitutions):
+    # Find the longest prefix that we can use a substitution for
+    result = ""
+    start = 0
+    for length in range(len(parts), 0, -1):
+        key = ("name", tuple(parts[:length]))
+        if key in substitutions:
+            result = get_substitution(substitutions.index(key))
+            start = length
+            break
+
+    for length in range(start + 1, len(parts) + 1):
+        result += get_source_name(parts[length - 1])
+        substitutions.append(("name", tuple(parts[:length])))
+
+    return result
+
+
+# Mangle a resolved type, adding any substitutable components to substitutions
+def mangle_type(resolved_type, substitutions):
+    kind = resolved_type[0]
+
+    if kind == "builtin":
+        return builtin_type_codes[resolved_type[1]]  # Built-in types are never substituted
+
+    if (kind == "class") or (kind == "enum"):
+        parts = resolved_type[1]
+        key = ("name", parts)
+        if key in substitutions:
+            return get_substitution(substitutions.index(key))
+        if len(parts) == 1:
+            substitutions.append(key)
+            return get_source_name(parts[0])
+        return "N" + mangle_name_parts(parts, substitutions) + "E"
+
+    key = get_type_key(resolved_type)
+    if key in substitutions:
+        return get_substitution(substitutions.index(key))
+
+    inner = mangle_type(resolved_type[1], substitutions)
+    if kind == "const":
+        result = "K" + inner
+    elif kind == "pointer":
+        result = "P" + inner
+    else:
+        result = "R" + inner
+    substitutions.append(key)
+    return result
+
+
+# Get a key identifying a resolved type (for substitutions)
+def get_type_key(resolved_type):
+    kind = resolved_type[0]
+    if kind == "builtin":
+        return resolved_type
+    if (kind == "class") or (kind == "enum"):
+        return "name", resolved_type[1]
+    return kind, get_type_key(resolved_type[1])
@@ -228,9 +228,11 @@ def get_type_description(type_str):
                     right_parse_point += 1
                     if c == '(':
                         paren_level += 1
+                        current_parameter += c  # Nested brackets are part of the parameter declaration
                     elif c == ')':
                         if paren_level > 0:
                             paren_level -= 1
+                            current_parameter += c
                         else:
                             # This was the closing bracket, so we are done
                             if len(current_parameter) > 0:
@@ -240,7 +242,7 @@ def get_type_description(type_str):
                             break
                     elif c == ',':
                         if paren_level > 0:
-                            pass  # We're inside parenthesis, so this isn't a separator for us
+                            current_parameter += c  # We're inside parenthesis, so this isn't a separator for us
                         else:
                             if len(current_parameter) > 0:
                                 # If we had a parameter declaration, examine it
@@ -207,4 +207,29 @@ def find_nearest_parent_of_type(child, parent_type):
         if isinstance(current, parent_type):
             break
 
-    return current
\ No newline at end of file
+    return current
+
+
+# Find the innermost element that contains all of elements, returning that and the child of it that contains the last
+# element (which is where new declarations relating to the elements can be inserted after)
+def find_common_container(elements):
+    container = elements[0].parent
+    for element in elements:
+        while not element.is_descendant_of(container):
+            container = container.parent
+
+    last_child = elements[-1]
+    while last_child.parent is not container:
+        last_child = last_child.parent
+
+    return container, last_child
+
+
+# Get the prefixes used for naming types and functions that are generated for an output file, as a (type prefix,
+# function prefix) tuple (e.g. ("Cimgui", "cimgui") for cimgui.h, or ("CimguiImplOpengl3", "cimgui_impl_opengl3") for
+# cimgui_impl_opengl3.h)
+def get_output_file_name_prefixes(dest_file_name):
+    name_parts = [part for part in dest_file_name.split("_") if part != ""]
+    type_prefix = "".join(part[0].upper() + part[1:] for part in name_parts)
+    function_prefix = "_".join(name_parts).lower()
+    return type_prefix, function_prefix